@@ -8,6 +8,8 @@ import numpy as np
 from scipy import stats
 import knpackage.toolbox as kn
 
+import data_cache_toolbox as data_cache
+
 
 class ColumnType(Enum):
     """Two categories of phenotype traits.
@@ -22,7 +24,7 @@ def combine_phenotype_data_and_clustering(run_parameters):
     Returns:
         phenotype_df: phenotype dataframe with the first column as sample clusters.
     """
-    phenotype_df = kn.get_spreadsheet_df(run_parameters['phenotype_name_full_path'])
+    phenotype_df = data_cache.get_spreadsheet_df(run_parameters['phenotype_name_full_path'], run_parameters)
 
     phenotype_df.insert(0, 'Cluster_ID', np.nan) # pylint: disable=no-member
 
@@ -0,0 +1,363 @@
+"""
+@author: The KnowEnG dev team
+"""
+import math
+import numpy as np
+import pandas as pd
+from   scipy import sparse
+
+
+def get_packed_size(number_of_samples):
+    """ number of values in the packed upper triangle (diagonal included) of a samples x samples matrix.
+
+    Args:
+        number_of_samples: number of matrix rows.
+
+    Returns:
+        packed_size: number_of_samples * (number_of_samples + 1) / 2.
+    """
+
+    return number_of_samples * (number_of_samples + 1) // 2
+
+
+def get_number_of_samples(packed_size):
+    """ number of matrix rows of a packed upper triangle.
+
+    Args:
+        packed_size: number of packed values.
+
+    Returns:
+        number_of_samples: the n with n * (n + 1) / 2 == packed_size.
+    """
+
+    return (math.isqrt(8 * packed_size + 1) - 1) // 2
+
+
+def get_row_offsets(number_of_samples):
+    """ position of the diagonal value of every row in the packed upper triangle; row i holds the
+        columns i to n - 1 from there on.
+
+    Args:
+        number_of_samples: number of matrix rows.
+
+    Returns:
+        row_offsets: int64 array of the row starts, followed by the packed size.
+    """
+
+    rows = np.arange(number_of_samples + 1, dtype=np.int64)
+
+    return rows * number_of_samples - rows * (rows - 1) // 2
+
+
+def add_to_packed_rows(packed_values, start, block):
+    """ add the upper triangle part of a block of rows to the packed values (in place); the block rows
+        start at row "start" and its columns at column "start", so its upper triangle is contiguous
+        in the packed values.
+
+    Args:
+        packed_values: packed upper triangle (one dimensional array view).
+        start: first row (and column) of the block.
+        block: rows x (number_of_samples - start) matrix.
+    """
+
+    row_offsets   = get_row_offsets(get_number_of_samples(packed_values.shape[0]))
+    upper_mask    = np.arange(block.shape[1])[None, :] >= np.arange(block.shape[0])[:, None]
+    packed_block  = packed_values[row_offsets[start]:row_offsets[start + block.shape[0]]]
+
+    np.add(packed_block, block[upper_mask], out=packed_block, casting='unsafe')
+
+
+def get_packed_upper_block(packed_values, number_of_samples, start, stop, dtype=None):
+    """ rows start to stop of the upper triangle, from column start on (zero below the diagonal).
+
+    Args:
+        packed_values: packed upper triangle.
+        number_of_samples: number of matrix rows.
+        start: first row.
+        stop: row after the last one.
+        dtype: (optional) element type of the block (default: the packed values type).
+
+    Returns:
+        upper_block: (stop - start) x (number_of_samples - start) matrix.
+    """
+
+    row_offsets = get_row_offsets(number_of_samples)
+    upper_block = np.zeros((stop - start, number_of_samples - start), dtype=dtype or packed_values.dtype)
+    upper_mask  = np.arange(upper_block.shape[1])[None, :] >= np.arange(upper_block.shape[0])[:, None]
+    upper_block[upper_mask] = packed_values[row_offsets[start]:row_offsets[stop]]
+
+    return upper_block
+
+
+def get_packed_mean(packed_values, number_of_samples):
+    """ mean over the whole symmetric matrices of packed upper triangles (off diagonal values count twice).
+
+    Args:
+        packed_values: packed upper triangle, or a stack of them (one per row).
+        number_of_samples: number of matrix rows.
+
+    Returns:
+        mean: mean value of the full matrices.
+    """
+
+    packed_values = np.asarray(packed_values).reshape((-1, get_packed_size(number_of_samples)))
+    diagonal_sum  = packed_values[:, get_row_offsets(number_of_samples)[:-1]].sum(dtype=np.float64)
+
+    return (2 * packed_values.sum(dtype=np.float64) - diagonal_sum) / (packed_values.shape[0] * number_of_samples ** 2)
+
+
+def get_mean_absolute_difference(consensus_a, consensus_b):
+    """ mean absolute difference of two consensus matrices (dense arrays or PackedConsensusMatrix).
+
+    Args:
+        consensus_a: samples x samples consensus matrix.
+        consensus_b: samples x samples consensus matrix of the same storage.
+
+    Returns:
+        difference: mean of |consensus_a - consensus_b| over the full matrices.
+    """
+
+    if not isinstance(consensus_a, PackedConsensusMatrix):
+        return np.mean(np.abs(consensus_a - consensus_b))
+
+    number_of_samples = consensus_a.shape[0]
+    if consensus_a.is_sparse() or consensus_b.is_sparse():
+        return abs(consensus_a.to_sparse() - consensus_b.to_sparse()).sum() / number_of_samples ** 2
+
+    return get_packed_mean(np.abs(consensus_a.values - consensus_b.values), number_of_samples)
+
+
+class PackedConsensusMatrix:
+    """ symmetric samples x samples consensus matrix stored as its packed upper triangle (row major,
+        diagonal included), or as a symmetric scipy csr matrix of the values at or above a threshold
+        (see sparsify). It reads as dense blocks of rows (consensus[start:stop]), multiplies dense
+        vectors and matrices (matvec, matmat; scipy eigsh accepts it) and converts to a dense array
+        with np.asarray when a caller needs all of it at once.
+    """
+
+    def __init__(self, values, number_of_samples, block_size=2**22):
+        """
+        Args:
+            values: packed upper triangle, or a symmetric scipy sparse matrix.
+            number_of_samples: number of matrix rows.
+            block_size: approximate number of values in the dense blocks formed by the methods.
+        """
+
+        self.values     = values
+        self.shape      = (number_of_samples, number_of_samples)
+        self.dtype      = values.dtype
+        self.ndim       = 2
+        self.block_size = block_size
+
+    def is_sparse(self):
+        """ True for the sparse (thresholded) storage. """
+
+        return sparse.issparse(self.values)
+
+    def get_block_rows(self):
+        """ rows per dense block of about block_size values. """
+
+        return max(1, self.block_size // max(self.shape[0], 1))
+
+    def __getitem__(self, rows):
+        """ dense rows of a contiguous row slice, e.g. consensus[start:stop], or of an integer array of row numbers. """
+
+        if isinstance(rows, slice):
+            start, stop, step = rows.indices(self.shape[0])
+            if step != 1:
+                raise TypeError('PackedConsensusMatrix rows are read by contiguous slices.')
+            rows = np.arange(start, max(start, stop))
+        rows = np.asarray(rows, dtype=np.int64)
+
+        if self.is_sparse():
+            return self.values[rows].toarray()
+
+        row_offsets = get_row_offsets(self.shape[0])
+        row_numbers = rows[:, None]
+        columns     = np.arange(self.shape[1])[None, :]
+
+        return self.values[row_offsets[np.minimum(row_numbers, columns)] + np.abs(row_numbers - columns)]
+
+    def __array__(self, dtype=None, copy=None):
+        dense_matrix = np.empty(self.shape, dtype=dtype or self.dtype)
+        block_rows   = self.get_block_rows()
+        for start in range(0, self.shape[0], block_rows):
+            dense_matrix[start:start + block_rows] = self[start:start + block_rows]
+
+        return dense_matrix
+
+    def diagonal(self):
+        """ the diagonal values. """
+
+        if self.is_sparse():
+            return self.values.diagonal()
+
+        return self.values[get_row_offsets(self.shape[0])[:-1]]
+
+    def matmat(self, x_matrix):
+        """ consensus . x_matrix, one block of packed rows at a time (each value is read once).
+
+        Args:
+            x_matrix: samples x columns dense matrix.
+
+        Returns:
+            product: samples x columns dense matrix.
+        """
+
+        if self.is_sparse():
+            return self.values.dot(x_matrix)
+
+        number_of_samples = self.shape[0]
+        product           = np.zeros((number_of_samples, x_matrix.shape[1]), dtype=np.result_type(self.dtype, x_matrix.dtype))
+        block_rows        = self.get_block_rows()
+        for start in range(0, number_of_samples, block_rows):
+            stop        = min(start + block_rows, number_of_samples)
+            upper_block = get_packed_upper_block(self.values, number_of_samples, start, stop)
+            product[start:stop] += upper_block.dot(x_matrix[start:])
+            product[start:]     += upper_block.T.dot(x_matrix[start:stop])
+            product[start:stop] -= self.values[get_row_offsets(number_of_samples)[start:stop]][:, None] * x_matrix[start:stop]
+
+        return product
+
+    def matvec(self, x_vector):
+        """ consensus . x_vector (see matmat). """
+
+        return self.matmat(np.reshape(x_vector, (-1, 1))).ravel()
+
+    def sparsify(self, threshold):
+        """ drop the values below threshold into the sparse (symmetric csr) storage.
+
+        Args:
+            threshold: smallest consensus value kept.
+
+        Returns:
+            consensus_matrix: PackedConsensusMatrix with sparse values.
+        """
+
+        if self.is_sparse():
+            values = self.values.multiply(self.values >= threshold).tocsr()
+            return PackedConsensusMatrix(values, self.shape[0], self.block_size)
+
+        number_of_samples = self.shape[0]
+        row_offsets       = get_row_offsets(number_of_samples)
+        rows, columns, values = [], [], []
+        for start in range(0, self.values.shape[0], self.block_size):
+            kept      = np.flatnonzero(self.values[start:start + self.block_size] >= threshold) + start
+            kept_rows = np.searchsorted(row_offsets, kept, side='right') - 1
+            rows.append(kept_rows)
+            columns.append(kept_rows + kept - row_offsets[kept_rows])
+            values.append(self.values[kept])
+
+        rows, columns, values = np.concatenate(rows), np.concatenate(columns), np.concatenate(values)
+        lower  = rows != columns
+        values = sparse.csr_matrix( ( np.concatenate([values,  values [lower]])
+                                    , ( np.concatenate([rows,    columns[lower]])
+                                      , np.concatenate([columns, rows   [lower]]) ) )
+                                  , shape=self.shape, dtype=self.dtype )
+
+        return PackedConsensusMatrix(values, number_of_samples, self.block_size)
+
+    def to_sparse(self):
+        """ the consensus as a symmetric scipy csr matrix (all values kept for the packed storage). """
+
+        if self.is_sparse():
+            return self.values
+
+        return self.sparsify(-np.inf).values
+
+    def get_condensed_distances(self):
+        """ condensed consensus distances (1 - consensus of the pairs i < j, in scipy squareform order).
+
+        Returns:
+            consensus_distances: float64 array of n * (n - 1) / 2 distances.
+        """
+
+        number_of_samples = self.shape[0]
+        if not self.is_sparse():
+            return 1 - np.delete(self.values, get_row_offsets(number_of_samples)[:-1]).astype(np.float64)
+
+        consensus_distances = np.empty(number_of_samples * (number_of_samples - 1) // 2)
+        position            = 0
+        block_rows          = self.get_block_rows()
+        for start in range(0, number_of_samples, block_rows):
+            stop        = min(start + block_rows, number_of_samples)
+            upper_block = self[start:stop][:, start:]
+            upper_mask  = np.arange(upper_block.shape[1])[None, :] > np.arange(upper_block.shape[0])[:, None]
+            distances   = 1 - upper_block[upper_mask]
+            consensus_distances[position:position + distances.size] = distances
+            position   += distances.size
+
+        return consensus_distances
+
+    def get_row_block_dfs(self, sample_names, sample_order=None):
+        """ the consensus as dense dataframes of consecutive blocks of rows.
+
+        Args:
+            sample_names: row and column names.
+            sample_order: (optional) order of the rows and columns, e.g. the display order of
+                          cluster_consensus_matrix (default: the sample order).
+
+        Yields:
+            block_df: rows x samples dataframe.
+        """
+
+        if sample_order is None:
+            sample_order = np.arange(self.shape[0])
+        sample_order = np.asarray(sample_order)
+        sample_names = pd.Index(sample_names)[sample_order]
+
+        block_rows   = self.get_block_rows()
+        for start in range(0, self.shape[0], block_rows):
+            yield pd.DataFrame(self[sample_order[start:start + block_rows]][:, sample_order]
+                              , columns=sample_names, index=sample_names[start:start + block_rows])
+
+    def save_tsv(self, file_name, sample_names, float_format='%g', sample_order=None):
+        """ write the consensus as the dense consensus_matrix tsv file, one block of rows at a time.
+
+        Args:
+            file_name: output file name.
+            sample_names: row and column names.
+            float_format: value format.
+            sample_order: (optional) order of the rows and columns (see get_row_block_dfs).
+        """
+
+        with open(file_name, 'w') as file_handle:
+            for block_number, block_df in enumerate(self.get_row_block_dfs(sample_names, sample_order)):
+                block_df.to_csv(file_handle, sep='\t', float_format=float_format, header=(block_number == 0))
+
+    def save_npz(self, file_name, sample_names):
+        """ write the stored values (packed upper triangle or csr components) and the sample names.
+
+        Args:
+            file_name: output .npz file name.
+            sample_names: row and column names.
+        """
+
+        if self.is_sparse():
+            np.savez(file_name, storage='sparse', sample_names=np.asarray(sample_names, dtype=str)
+                    , data=self.values.data, indices=self.values.indices, indptr=self.values.indptr)
+        else:
+            np.savez(file_name, storage='packed', sample_names=np.asarray(sample_names, dtype=str), values=self.values)
+
+
+def load_npz(file_name):
+    """ read a consensus matrix written by PackedConsensusMatrix.save_npz.
+
+    Args:
+        file_name: .npz file name.
+
+    Returns:
+        consensus_matrix: PackedConsensusMatrix.
+        sample_names: row and column names.
+    """
+
+    with np.load(file_name) as arrays:
+        sample_names      = arrays['sample_names']
+        number_of_samples = sample_names.shape[0]
+        if str(arrays['storage']) == 'sparse':
+            values = sparse.csr_matrix( (arrays['data'], arrays['indices'], arrays['indptr'])
+                                      , shape=(number_of_samples, number_of_samples) )
+        else:
+            values = arrays['values']
+
+    return PackedConsensusMatrix(values, number_of_samples), sample_names
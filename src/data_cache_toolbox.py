@@ -0,0 +1,442 @@
+"""
+@author: The KnowEnG dev team
+"""
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from   scipy import sparse
+import knpackage.toolbox as kn
+
+CACHE_FORMAT_VERSION = 1
+
+
+def get_network_matrices(gg_network_name_full_path, run_parameters):
+    """ read the gene gene network, normalize it and form its laplacian components; with a
+        "network_cache_directory" the results are kept there, keyed on the network file contents,
+        and later runs memory-map them instead of parsing the network again.
+
+    Args:
+        gg_network_name_full_path: file path to gene gene network data.
+        run_parameters: parameter set dictionary with (optional) "network_cache_directory" key.
+
+    Returns:
+        network_mat: normalized sparse (csr) network matrix.
+        unique_gene_names: sorted list of the network gene names.
+        lap_diag: laplacian matrix component, L = lap_diag - lap_pos.
+        lap_pos: laplacian matrix component, L = lap_diag - lap_pos.
+    """
+
+    if 'network_cache_directory' not in run_parameters:
+        return form_network_matrices(gg_network_name_full_path)
+
+    cache_directory = run_parameters['network_cache_directory']
+    file_hash       = get_file_hash(gg_network_name_full_path, cache_directory)
+    entry_directory = os.path.join(cache_directory, 'network_v%d_%s'%(CACHE_FORMAT_VERSION, file_hash))
+
+    if not os.path.isdir(entry_directory):
+        network_mat, unique_gene_names, lap_diag, lap_pos = form_network_matrices(gg_network_name_full_path)
+
+        save_cached_arrays(entry_directory, { 'network_data'      : network_mat.data
+                                            , 'network_indices'   : network_mat.indices
+                                            , 'network_indptr'    : network_mat.indptr
+                                            , 'gene_names'        : np.array(unique_gene_names, dtype=str)
+                                            , 'laplacian_diagonal': lap_diag.diagonal()
+                                            , 'laplacian_data'    : lap_pos.data
+                                            , 'laplacian_indices' : lap_pos.indices
+                                            , 'laplacian_indptr'  : lap_pos.indptr })
+
+        return network_mat, unique_gene_names, lap_diag, lap_pos
+
+    arrays            = load_cached_arrays(entry_directory)
+    number_of_genes   = len(arrays['gene_names'])
+
+    network_mat       = sparse.csr_matrix( (arrays['network_data'], arrays['network_indices'], arrays['network_indptr'])
+                                         , shape=(number_of_genes, number_of_genes) )
+    lap_pos           = sparse.csr_matrix( (arrays['laplacian_data'], arrays['laplacian_indices'], arrays['laplacian_indptr'])
+                                         , shape=(number_of_genes, number_of_genes) )
+    lap_diag          = sparse.diags(arrays['laplacian_diagonal'])
+    unique_gene_names = arrays['gene_names'].tolist()
+
+    return network_mat, unique_gene_names, lap_diag, lap_pos
+
+
+def form_network_matrices(gg_network_name_full_path):
+    """ read the gene gene network file, normalize the network and form its laplacian components.
+
+    Args:
+        gg_network_name_full_path: file path to gene gene network data.
+
+    Returns:
+        network_mat, unique_gene_names, lap_diag, lap_pos: see get_network_matrices.
+    """
+
+    network_mat,      \
+    unique_gene_names = kn.get_sparse_network_matrix(gg_network_name_full_path)
+    network_mat       = sparse.csr_matrix(kn.normalize_sparse_mat_by_diagonal(network_mat))
+    lap_diag, lap_pos = kn.form_network_laplacian_matrix(network_mat)
+
+    return network_mat, unique_gene_names, lap_diag, lap_pos
+
+
+def get_file_hash(file_name, cache_directory):
+    """ sha256 of the file contents. The hash is recorded in "file_hashes.json" of the cache directory
+        with the file size and modification time, so an unchanged file is only read once.
+
+    Args:
+        file_name: file to hash.
+        cache_directory: cache directory.
+
+    Returns:
+        file_hash: hexadecimal sha256 digest.
+    """
+
+    os.makedirs(cache_directory, mode=0o755, exist_ok=True)
+
+    hashes_name = os.path.join(cache_directory, 'file_hashes.json')
+    file_key    = os.path.realpath(file_name)
+    file_stat   = os.stat(file_name)
+    file_stamp  = [file_stat.st_size, file_stat.st_mtime_ns]
+
+    try:
+        with open(hashes_name, 'r') as fh:
+            file_hashes = json.load(fh)
+    except (IOError, ValueError):
+        file_hashes = {}
+
+    if file_key in file_hashes and file_hashes[file_key][0:2] == file_stamp:
+        return file_hashes[file_key][2]
+
+    sha = hashlib.sha256()
+    with open(file_name, 'rb') as fh:
+        for block in iter(lambda: fh.read(2**20), b''):
+            sha.update(block)
+    file_hash = sha.hexdigest()
+
+    file_hashes[file_key] = file_stamp + [file_hash]
+    partial_name = hashes_name + '.%d'%(os.getpid())
+    with open(partial_name, 'w') as fh:
+        json.dump(file_hashes, fh)
+    os.replace(partial_name, hashes_name)
+
+    return file_hash
+
+
+def save_cached_arrays(entry_directory, arrays):
+    """ save arrays as .npy files of a cache entry directory. The entry is written under a
+        partial name and renamed, so readers never see an incomplete entry.
+
+    Args:
+        entry_directory: cache entry directory.
+        arrays: dictionary of array name to array.
+    """
+
+    partial_directory = entry_directory + '.partial_%d'%(os.getpid())
+    os.makedirs(partial_directory, mode=0o755, exist_ok=True)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(partial_directory, name + '.npy'), np.asarray(array))
+
+    try:
+        os.rename(partial_directory, entry_directory)
+    except OSError:
+        shutil.rmtree(partial_directory)        # another run saved the same entry first
+
+
+def load_cached_arrays(entry_directory):
+    """ memory-map the .npy files of a cache entry directory.
+
+    Args:
+        entry_directory: cache entry directory.
+
+    Returns:
+        arrays: dictionary of array name to read-only array.
+    """
+
+    arrays = {}
+    for file_name in os.listdir(entry_directory):
+        if file_name.endswith('.npy'):
+            arrays[file_name[:-4]] = np.load(os.path.join(entry_directory, file_name), mmap_mode='r')
+
+    return arrays
+
+
+def get_spreadsheet_df(spreadsheet_name_full_path, run_parameters):
+    """ read a spreadsheet into a dataframe; with a "spreadsheet_cache_directory" the spreadsheet is
+        converted to binary arrays there the first time it is seen, keyed on the file contents, and
+        later runs build the dataframe on the memory-mapped arrays. A spreadsheet with a single
+        numeric type is kept as one dense array and loaded without copying; others are kept by column.
+
+    Args:
+        spreadsheet_name_full_path: full path name of a tab separated values spreadsheet
+                                    with row and column names.
+        run_parameters: parameter set dictionary with (optional) "spreadsheet_cache_directory" key.
+
+    Returns:
+        spreadsheet_df: the spreadsheet dataframe (as read by kn.get_spreadsheet_df).
+    """
+
+    if 'spreadsheet_cache_directory' not in run_parameters:
+        return kn.get_spreadsheet_df(spreadsheet_name_full_path)
+
+    cache_directory = run_parameters['spreadsheet_cache_directory']
+    file_hash       = get_file_hash(spreadsheet_name_full_path, cache_directory)
+    entry_directory = os.path.join(cache_directory, 'spreadsheet_v%d_%s'%(CACHE_FORMAT_VERSION, file_hash))
+
+    if not os.path.isdir(entry_directory):
+        spreadsheet_df = kn.get_spreadsheet_df(spreadsheet_name_full_path)
+        save_cached_arrays(entry_directory, get_spreadsheet_arrays(spreadsheet_df))
+
+        return spreadsheet_df
+
+    arrays       = load_cached_arrays(entry_directory)
+    row_names    = pd.Index(np.asarray(arrays['row_names']),    name=get_cached_name(arrays, 'row_names_name'))
+    column_names = pd.Index(np.asarray(arrays['column_names']), name=get_cached_name(arrays, 'column_names_name'))
+
+    if 'values' in arrays:
+        return pd.DataFrame(arrays['values'], index=row_names, columns=column_names, copy=False)
+
+    columns = {}
+    for column, dtype in enumerate(arrays['column_dtypes'].tolist()):
+        values = arrays['column_%d'%(column)]
+        if 'column_%d_null'%(column) in arrays:
+            values = values.astype(object)
+            values[arrays['column_%d_null'%(column)]] = np.nan
+        columns[column] = pd.Series(values, index=row_names, copy=False).astype(dtype)
+
+    spreadsheet_df         = pd.DataFrame(columns)
+    spreadsheet_df.columns = column_names
+
+    return spreadsheet_df
+
+
+def get_sparse_spreadsheet_df(spreadsheet_name_full_path, run_parameters):
+    """ read a mostly zero (e.g. binary mutation) spreadsheet into a dataframe of sparse columns, so
+        memory scales with the nonzero values rather than genes x samples. The spreadsheet is parsed
+        "spreadsheet_chunk_size" rows at a time, each chunk kept as a sparse matrix; with a
+        "spreadsheet_cache_directory" the sparse matrix is cached there as binary arrays, keyed on
+        the file contents, and later runs load those instead of parsing the spreadsheet.
+
+    Args:
+        spreadsheet_name_full_path: full path name of a tab separated values spreadsheet
+                                    with row and column names.
+        run_parameters: parameter set dictionary with (optional) "spreadsheet_chunk_size"
+                        (default 1000) and "spreadsheet_cache_directory" keys.
+
+    Returns:
+        spreadsheet_df: genes x samples dataframe of pandas sparse columns (zero fill value), with
+                        string row and column names as kn.get_spreadsheet_df.
+    """
+
+    if 'spreadsheet_cache_directory' in run_parameters:
+        cache_directory = run_parameters['spreadsheet_cache_directory']
+        file_hash       = get_file_hash(spreadsheet_name_full_path, cache_directory)
+        entry_directory = os.path.join(cache_directory, 'sparse_spreadsheet_v%d_%s'%(CACHE_FORMAT_VERSION, file_hash))
+
+        if os.path.isdir(entry_directory):
+            arrays          = load_cached_arrays(entry_directory)
+            spreadsheet_mat = sparse.csc_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                                shape=tuple(arrays['shape']))
+            row_names       = pd.Index(np.asarray(arrays['row_names']),    name=get_cached_name(arrays, 'row_names_name'))
+            column_names    = pd.Index(np.asarray(arrays['column_names']), name=get_cached_name(arrays, 'column_names_name'))
+
+            return get_sparse_df(spreadsheet_mat, row_names, column_names)
+
+    if 'spreadsheet_chunk_size' in run_parameters:
+        spreadsheet_chunk_size = int(run_parameters['spreadsheet_chunk_size'])
+    else:
+        spreadsheet_chunk_size = 1000
+
+    chunk_mats = []
+    row_names  = None
+
+    for chunk_df in pd.read_csv(spreadsheet_name_full_path, sep='\t', header=0, index_col=0, chunksize=spreadsheet_chunk_size):
+        chunk_mats.append(sparse.csr_matrix(chunk_df.values))
+        if row_names is None:
+            row_names    = chunk_df.index
+            column_names = chunk_df.columns
+        else:
+            row_names    = row_names.append(chunk_df.index)
+
+    if row_names is None:
+        header_df       = pd.read_csv(spreadsheet_name_full_path, sep='\t', header=0, index_col=0, nrows=0)
+        row_names       = header_df.index
+        column_names    = header_df.columns
+        spreadsheet_mat = sparse.csc_matrix((0, header_df.shape[1]))
+    else:
+        spreadsheet_mat = sparse.vstack(chunk_mats, format='csc')
+
+    row_names      = row_names.map(str)
+    column_names   = column_names.map(str)
+    spreadsheet_df = get_sparse_df(spreadsheet_mat, row_names, column_names)
+
+    if 'spreadsheet_cache_directory' in run_parameters:
+        arrays = { 'data'        : spreadsheet_mat.data
+                 , 'indices'     : spreadsheet_mat.indices
+                 , 'indptr'      : spreadsheet_mat.indptr
+                 , 'shape'       : np.array(spreadsheet_mat.shape)
+                 , 'row_names'   : np.array(row_names.values,    dtype=str)
+                 , 'column_names': np.array(column_names.values, dtype=str) }
+        for names, axis_names in [('row_names', row_names), ('column_names', column_names)]:
+            if axis_names.name is not None:
+                arrays[names + '_name'] = np.array(str(axis_names.name))
+        save_cached_arrays(entry_directory, arrays)
+
+    return spreadsheet_df
+
+
+def get_sparse_df(spreadsheet_mat, row_names, column_names):
+    """ dataframe of pandas sparse columns, with zero (rather than NaN) as the value left out.
+
+    Args:
+        spreadsheet_mat: genes x samples scipy sparse matrix.
+        row_names: row index.
+        column_names: column index.
+
+    Returns:
+        spreadsheet_df: genes x samples dataframe of sparse columns.
+    """
+
+    spreadsheet_df = pd.DataFrame.sparse.from_spmatrix(spreadsheet_mat, index=row_names, columns=column_names)
+
+    return spreadsheet_df.astype(pd.SparseDtype(spreadsheet_mat.dtype, 0))
+
+
+def is_sparse_df(spreadsheet_df):
+    """ decide whether a dataframe is made of pandas sparse columns (see get_sparse_spreadsheet_df).
+
+    Args:
+        spreadsheet_df: dataframe.
+
+    Returns:
+        True when every column is sparse, otherwise False.
+    """
+
+    return spreadsheet_df.shape[1] > 0 and all(isinstance(dtype, pd.SparseDtype) for dtype in spreadsheet_df.dtypes)
+
+
+def get_spreadsheet_arrays(spreadsheet_df):
+    """ split a spreadsheet dataframe into the arrays of its cache entry: the row and column names and
+        either one dense "values" array (single numeric type) or one array per column, with a null
+        mask for the non numeric columns.
+
+    Args:
+        spreadsheet_df: the spreadsheet dataframe.
+
+    Returns:
+        arrays: dictionary of array name to array.
+    """
+
+    arrays = { 'row_names'   : np.array(spreadsheet_df.index.values,   dtype=str)
+             , 'column_names': np.array(spreadsheet_df.columns.values, dtype=str) }
+
+    for names, axis_names in [('row_names', spreadsheet_df.index), ('column_names', spreadsheet_df.columns)]:
+        if axis_names.name is not None:
+            arrays[names + '_name'] = np.array(str(axis_names.name))
+
+    column_dtypes = spreadsheet_df.dtypes.tolist()
+    if len(set(column_dtypes)) == 1 and is_numeric_dtype(column_dtypes[0]):
+        arrays['values'] = spreadsheet_df.values
+
+        return arrays
+
+    arrays['column_dtypes'] = np.array([str(dtype) for dtype in column_dtypes], dtype=str)
+    for column, dtype in enumerate(column_dtypes):
+        values = spreadsheet_df.iloc[:, column]
+        if is_numeric_dtype(dtype):
+            arrays['column_%d'%(column)] = values.values
+        else:
+            arrays['column_%d_null'%(column)] = values.isnull().values
+            arrays['column_%d'     %(column)] = np.array(values.where(values.notnull(), '').values, dtype=str)
+
+    return arrays
+
+
+def get_cached_name(arrays, name):
+    """ the string saved as a zero dimensional array of a cache entry, or None if it was not saved.
+
+    Args:
+        arrays: dictionary of array name to array.
+        name: array name.
+
+    Returns:
+        the saved string or None.
+    """
+
+    if name not in arrays:
+        return None
+
+    return str(arrays[name])
+
+
+def is_numeric_dtype(dtype):
+    """ decide whether a dataframe column type is a plain numpy (bool, integer or float) type.
+
+    Args:
+        dtype: dataframe column type.
+
+    Returns:
+        True for numpy bool, integer and float types, otherwise False.
+    """
+
+    return isinstance(dtype, np.dtype) and dtype.kind in 'biuf'
+
+
+def get_network_spreadsheet_df(spreadsheet_name_full_path, unique_gene_names, run_parameters):
+    """ read the spreadsheet rows of the network genes, in network gene order, with genes missing from
+        the spreadsheet set to zero (kn.get_spreadsheet_df followed by kn.update_spreadsheet_df). The
+        spreadsheet is parsed "spreadsheet_chunk_size" rows at a time, straight into the network sized
+        matrix, so the full spreadsheet is never held in memory; a cached spreadsheet (see
+        get_spreadsheet_df) is memory-mapped and reindexed instead.
+
+    Args:
+        spreadsheet_name_full_path: full path name of a tab separated values spreadsheet
+                                    with row and column names.
+        unique_gene_names: list of the network gene names.
+        run_parameters: parameter set dictionary with (optional) "spreadsheet_chunk_size"
+                        (default 1000) and "spreadsheet_cache_directory" keys.
+
+    Returns:
+        spreadsheet_df: network genes x samples dataframe.
+    """
+
+    if 'spreadsheet_cache_directory' in run_parameters:
+        return kn.update_spreadsheet_df(get_spreadsheet_df(spreadsheet_name_full_path, run_parameters), unique_gene_names)
+
+    if 'spreadsheet_chunk_size' in run_parameters:
+        spreadsheet_chunk_size = int(run_parameters['spreadsheet_chunk_size'])
+    else:
+        spreadsheet_chunk_size = 1000
+
+    gene_names      = pd.Index(unique_gene_names)
+    gene_found      = np.zeros(len(gene_names), dtype=bool)
+    spreadsheet_mat = None
+
+    for chunk_df in pd.read_csv(spreadsheet_name_full_path, sep='\t', header=0, index_col=0, chunksize=spreadsheet_chunk_size):
+        gene_rows = gene_names.get_indexer(chunk_df.index.map(str))
+        in_network = gene_rows >= 0
+        gene_rows  = gene_rows[in_network]
+
+        chunk_dtype = np.result_type(*chunk_df.dtypes)
+        if spreadsheet_mat is None:
+            index_name      = chunk_df.index.name
+            sample_names    = chunk_df.columns.map(str)
+            spreadsheet_mat = np.zeros((len(gene_names), chunk_df.shape[1]), dtype=chunk_dtype, order='F')
+        elif not np.can_cast(chunk_dtype, spreadsheet_mat.dtype):
+            spreadsheet_mat = spreadsheet_mat.astype(np.result_type(spreadsheet_mat.dtype, chunk_dtype), order='F')
+
+        if np.any(gene_found[gene_rows]) or len(np.unique(gene_rows)) < len(gene_rows):
+            raise ValueError('spreadsheet contains duplicate gene names.')
+        gene_found[gene_rows] = True
+
+        spreadsheet_mat[gene_rows, :] = chunk_df.values[in_network, :]
+
+    if spreadsheet_mat is None:
+        header_df       = pd.read_csv(spreadsheet_name_full_path, sep='\t', header=0, index_col=0, nrows=0)
+        index_name      = header_df.index.name
+        sample_names    = header_df.columns.map(str)
+        spreadsheet_mat = np.zeros((len(gene_names), header_df.shape[1]), order='F')
+
+    return pd.DataFrame(spreadsheet_mat, index=pd.Index(gene_names, name=index_name), columns=sample_names, copy=False)
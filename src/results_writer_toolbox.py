@@ -0,0 +1,455 @@
+"""
+@author: The KnowEnG dev team
+"""
+import os
+import gzip
+import time
+import collections
+import numpy as np
+import pandas as pd
+from   scipy import sparse
+import knpackage.toolbox as kn
+
+import consensus_storage_toolbox as consensus_storage
+import data_cache_toolbox        as data_cache
+
+OUTPUT_TYPE_SUFFIXES = { 'tsv'    : 'tsv'
+                       , 'tsv.gz' : 'tsv.gz'
+                       , 'npz'    : 'npz'
+                       , 'parquet': 'parquet'
+                       , 'feather': 'feather' }
+
+# fastest zlib level; random consensus digits compress about 10% less than at level 9, five times faster
+GZIP_COMPRESSLEVEL   = 1
+
+
+def get_output_format(run_parameters):
+    """ format of the large result files (spreadsheet heatmap, gene cluster averages and the consensus matrix).
+
+    Args:
+        run_parameters: parameter set dictionary with (optional) "output_format" key, 'tsv' (default),
+                        'tsv.gz', 'npz', 'parquet' or 'feather'.
+
+    Returns:
+        output_format: one of the OUTPUT_TYPE_SUFFIXES keys.
+    """
+
+    if 'output_format' not in run_parameters:
+        return 'tsv'
+
+    if run_parameters['output_format'] not in OUTPUT_TYPE_SUFFIXES:
+        raise ValueError('output_format contains bad value.')
+
+    return run_parameters['output_format']
+
+
+def get_output_type_suffix(run_parameters):
+    """ file name extension of the large result files.
+
+    Args:
+        run_parameters: parameter set dictionary with (optional) "output_format" key.
+
+    Returns:
+        type_suffix: extension without the leading dot, e.g. 'tsv.gz'.
+    """
+
+    return OUTPUT_TYPE_SUFFIXES[get_output_format(run_parameters)]
+
+
+def get_output_parallelism(run_parameters):
+    """ number of processes formatting the chunks of the text result files.
+
+    Args:
+        run_parameters: parameter set dictionary with (optional) "output_parallelism" key (default 1).
+
+    Returns:
+        output_parallelism: positive integer.
+    """
+
+    if 'output_parallelism' not in run_parameters:
+        return 1
+
+    output_parallelism = int(run_parameters['output_parallelism'])
+    if output_parallelism < 1:
+        raise ValueError('output_parallelism contains bad value.')
+
+    return output_parallelism
+
+
+def start_results_writer(run_parameters):
+    """ start the pool of "output_writers" background threads that write the result files handed to
+        submit_result while the run computes the next results (0: write in the calling thread, the
+        default). At most two files per thread wait to be written.
+
+    Args:
+        run_parameters: parameter set dictionary with (optional) "output_writers" key.
+
+    Returns:
+        writer_state: dictionary of the pool, the pending writes and the write timings (see stop_results_writer).
+    """
+    import concurrent.futures
+
+    output_writers = 0
+    if 'output_writers' in run_parameters:
+        output_writers = int(run_parameters['output_writers'])
+        if output_writers < 0:
+            raise ValueError('output_writers contains bad value.')
+
+    if output_writers > 0:
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=output_writers, thread_name_prefix='results_writer')
+    else:
+        pool = None
+
+    return {'pool': pool, 'max_pending': 2 * output_writers, 'pending': [], 'timings': [], 'errors': []}
+
+
+def submit_result(writer_state, file_name, save_function, *arguments, **keywords):
+    """ write a result file with save_function(*arguments, **keywords), in the background when the
+        writer has threads; waits for a pending write to finish when the writer is full. The arguments
+        must not change until the write finishes.
+
+    Args:
+        writer_state: see start_results_writer (None writes in the calling thread, untimed).
+        file_name: name of the file written by save_function.
+        save_function: function writing the file.
+        arguments: positional arguments of save_function.
+        keywords: keyword arguments of save_function.
+    """
+    import concurrent.futures
+
+    if writer_state is None:
+        save_function(*arguments, **keywords)
+        return
+
+    if writer_state['pool'] is None:
+        writer_state['timings'].append(run_timed_save(file_name, time.time(), save_function, arguments, keywords) + ['ok'])
+        return
+
+    if len(writer_state['pending']) >= writer_state['max_pending']:
+        concurrent.futures.wait([ future for pending_name, future in writer_state['pending'] ]
+                               , return_when=concurrent.futures.FIRST_COMPLETED)
+        collect_finished_results(writer_state)
+
+    future = writer_state['pool'].submit(run_timed_save, file_name, time.time(), save_function, arguments, keywords)
+    writer_state['pending'].append((file_name, future))
+
+
+def run_timed_save(file_name, submit_time, save_function, arguments, keywords):
+    """ write a result file and time it (the task of the writer threads).
+
+    Args:
+        file_name: name of the file written by save_function.
+        submit_time: time.time() of the submit_result call.
+        save_function: function writing the file.
+        arguments: positional arguments of save_function.
+        keywords: keyword arguments of save_function.
+
+    Returns:
+        timing: [file base name, seconds queued, seconds writing, file bytes].
+    """
+
+    start_time = time.time()
+    save_function(*arguments, **keywords)
+
+    return [os.path.basename(file_name), start_time - submit_time, time.time() - start_time, os.path.getsize(file_name)]
+
+
+def collect_finished_results(writer_state, wait_all=False):
+    """ move the finished writes out of the pending list, recording their timings; errors are recorded
+        with the file name as a 'failed' status and the exceptions returned.
+
+    Args:
+        writer_state: see start_results_writer.
+        wait_all: True to wait for all the pending writes first.
+
+    Returns:
+        errors: exceptions of the failed writes.
+    """
+
+    errors  = []
+    pending = []
+    for file_name, future in writer_state['pending']:
+        if not wait_all and not future.done():
+            pending.append((file_name, future))
+        elif future.exception() is not None:
+            errors.append(future.exception())
+            writer_state['timings'].append([os.path.basename(file_name), np.nan, np.nan, np.nan, 'failed: %r'%(future.exception())])
+        else:
+            writer_state['timings'].append(future.result() + ['ok'])
+
+    writer_state['pending'] = pending
+    writer_state['errors' ].extend(errors)
+
+    return errors
+
+
+def wait_for_result(writer_state, file_name):
+    """ wait until a submitted result file is written, e.g. before reading it back.
+
+    Args:
+        writer_state: see start_results_writer.
+        file_name: name given to submit_result.
+    """
+
+    if writer_state is None or writer_state['pool'] is None:
+        return
+
+    for pending_name, future in writer_state['pending']:
+        if pending_name == file_name:
+            future.result()
+
+
+def stop_results_writer(writer_state, run_parameters):
+    """ flush the writer: wait for every pending write and stop the threads; with "output_writers" set,
+        save the write timings of the files. The first failed write is raised after all the others finish.
+
+    Args:
+        writer_state: see start_results_writer.
+        run_parameters: parameter set dictionary with "results_directory", "method" and (optional) "output_writers" keys.
+
+    Output:
+        output_timings_{method}_{timestamp}_download.tsv
+    """
+
+    if writer_state['pool'] is not None:
+        collect_finished_results(writer_state, wait_all=True)
+        writer_state['pool'].shutdown(wait=True)
+
+    if 'output_writers' in run_parameters:
+        timings_df = pd.DataFrame(writer_state['timings'], columns=['file_name', 'queued_seconds', 'write_seconds', 'bytes', 'status'])
+        file_name  = kn.create_timestamped_filename(os.path.join(run_parameters['results_directory'], 'output_timings_' + run_parameters['method']))
+        timings_df.to_csv(file_name + '_download.tsv', sep='\t', index=False, float_format='%g')
+
+    if writer_state['errors']:
+        raise writer_state['errors'][0]
+
+
+def save_text(file_name, text):
+    """ write a text file.
+
+    Args:
+        file_name: output file name.
+        text: file contents.
+    """
+
+    with open(file_name, 'w') as file_handle:
+        file_handle.write(text)
+
+
+def save_df(result_df, file_name, run_parameters, float_format=None):
+    """ write a result dataframe (dense or of sparse columns) in the "output_format": tsv as DataFrame.to_csv,
+        tsv.gz as gzip members of row chunks, npz (see load_npz_df), parquet, or feather (index as
+        the first column). Text is formatted in row chunks by "output_parallelism" processes.
+
+    Args:
+        result_df: dataframe with row and column names.
+        file_name: output file name (see get_output_type_suffix).
+        run_parameters: parameter set dictionary with (optional) "output_format" and "output_parallelism" keys.
+        float_format: (optional) text format of the floating point values.
+    """
+
+    output_format = get_output_format(run_parameters)
+
+    if output_format == 'tsv' and get_output_parallelism(run_parameters) == 1:
+        result_df.to_csv(file_name, sep='\t', float_format=float_format)
+
+    elif output_format in ['tsv', 'tsv.gz']:
+        save_tsv_chunks(get_row_chunk_dfs(result_df), file_name, float_format, output_format == 'tsv.gz'
+                       , get_output_parallelism(run_parameters))
+
+    elif output_format == 'npz':
+        save_npz_df(result_df, file_name)
+
+    else:
+        if data_cache.is_sparse_df(result_df):
+            result_df = result_df.sparse.to_dense()
+        if output_format == 'parquet':
+            result_df.to_parquet(file_name)
+        else:
+            result_df.reset_index().to_feather(file_name)
+
+
+def save_consensus_df(consensus_matrix, sample_names, file_name, run_parameters, float_format='%g', sample_order=None):
+    """ write a consensus matrix (dense array or PackedConsensusMatrix) in the "output_format"; a packed
+        consensus keeps its packed (or sparse) values, in the sample order, in npz files (see
+        consensus_storage.load_npz) and is formatted one block of rows at a time as text.
+
+    Args:
+        consensus_matrix: samples x samples consensus matrix.
+        sample_names: row and column names.
+        file_name: output file name (see get_output_type_suffix).
+        run_parameters: parameter set dictionary with (optional) "output_format" and "output_parallelism" keys.
+        float_format: text format of the values.
+        sample_order: (optional) order of the rows and columns, e.g. the display order of the final clustering.
+    """
+
+    output_format = get_output_format(run_parameters)
+
+    if not isinstance(consensus_matrix, consensus_storage.PackedConsensusMatrix):
+        consensus_df = pd.DataFrame(data=consensus_matrix, columns=sample_names, index=sample_names)
+        if sample_order is not None:
+            consensus_df = consensus_df.iloc[sample_order, sample_order]
+        save_df(consensus_df, file_name, run_parameters, float_format)
+
+    elif output_format == 'tsv' and get_output_parallelism(run_parameters) == 1:
+        consensus_matrix.save_tsv(file_name, sample_names, float_format, sample_order)
+
+    elif output_format in ['tsv', 'tsv.gz']:
+        save_tsv_chunks(consensus_matrix.get_row_block_dfs(sample_names, sample_order), file_name, float_format, output_format == 'tsv.gz'
+                       , get_output_parallelism(run_parameters))
+
+    elif output_format == 'npz':
+        consensus_matrix.save_npz(file_name, sample_names)
+
+    else:
+        save_arrow_chunks(consensus_matrix.get_row_block_dfs(sample_names, sample_order), file_name, output_format)
+
+
+def save_arrow_chunks(row_chunk_dfs, file_name, output_format):
+    """ write dataframes of consecutive row chunks as one parquet file (a row group per chunk, index kept as
+        DataFrame.to_parquet) or one feather file (a record batch per chunk, index as the first column),
+        so only one chunk is in memory at a time.
+
+    Args:
+        row_chunk_dfs: iterable of dataframes with the same columns.
+        file_name: output file name.
+        output_format: 'parquet' or 'feather'.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    schema = None
+    try:
+        for chunk_df in row_chunk_dfs:
+            if output_format == 'parquet':
+                table = pa.Table.from_pandas(chunk_df, schema=schema)
+            else:
+                table = pa.Table.from_pandas(chunk_df.reset_index(), schema=schema, preserve_index=False)
+
+            if writer is None:
+                schema = table.schema
+                if output_format == 'parquet':
+                    writer = pq.ParquetWriter(file_name, schema)
+                else:
+                    writer = pa.ipc.new_file(file_name, schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def get_row_chunk_dfs(result_df, chunk_size=2**20):
+    """ consecutive blocks of rows of a dataframe.
+
+    Args:
+        result_df: dataframe.
+        chunk_size: approximate number of values per block.
+
+    Yields:
+        chunk_df: block of rows of result_df.
+    """
+
+    chunk_rows = max(1, chunk_size // max(result_df.shape[1], 1))
+    for start in range(0, max(result_df.shape[0], 1), chunk_rows):
+        yield result_df.iloc[start:start + chunk_rows]
+
+
+def format_tsv_chunk(chunk_df, header, float_format, compress):
+    """ tsv text of a block of rows (worker function of save_tsv_chunks).
+
+    Args:
+        chunk_df: block of rows.
+        header: True to start with the column names row.
+        float_format: text format of the floating point values.
+        compress: True for a gzip member (of fixed mtime, GZIP_COMPRESSLEVEL) of the text.
+
+    Returns:
+        chunk_bytes: encoded text.
+    """
+
+    chunk_bytes = chunk_df.to_csv(sep='\t', float_format=float_format, header=header).encode()
+    if compress:
+        chunk_bytes = gzip.compress(chunk_bytes, compresslevel=GZIP_COMPRESSLEVEL, mtime=0)
+
+    return chunk_bytes
+
+
+def save_tsv_chunks(chunk_dfs, file_name, float_format, compress, parallelism):
+    """ write dataframe row blocks as one tsv file (column names from the first block); the blocks are
+        formatted (and compressed) by a pool of processes, at most two blocks per process in flight,
+        and written in order as they finish. gzip members concatenate into one gzip file. While other
+        threads run (e.g. the background writers of start_results_writer) the blocks are formatted
+        in this thread: forking a multi-threaded process can copy locks held by the other threads.
+
+    Args:
+        chunk_dfs: iterable of row block dataframes.
+        file_name: output file name.
+        float_format: text format of the floating point values.
+        compress: True for a gzip compressed file.
+        parallelism: number of formatting processes (1 formats in this process).
+    """
+    import multiprocessing
+    import threading
+
+    with open(file_name, 'wb') as file_handle:
+        if parallelism == 1 or threading.active_count() > 1:
+            for chunk_number, chunk_df in enumerate(chunk_dfs):
+                file_handle.write(format_tsv_chunk(chunk_df, chunk_number == 0, float_format, compress))
+            return
+
+        pending = collections.deque()
+        with multiprocessing.Pool(processes=parallelism) as pool:
+            for chunk_number, chunk_df in enumerate(chunk_dfs):
+                if len(pending) == 2 * parallelism:
+                    file_handle.write(pending.popleft().get())
+                pending.append(pool.apply_async(format_tsv_chunk, (chunk_df, chunk_number == 0, float_format, compress)))
+
+            while pending:
+                file_handle.write(pending.popleft().get())
+
+
+def save_npz_df(result_df, file_name):
+    """ write a numeric dataframe as npz arrays: row_names, column_names and either the dense values or the
+        csc components (data, indices, indptr) of a dataframe of sparse columns.
+
+    Args:
+        result_df: numeric dataframe.
+        file_name: output .npz file name.
+    """
+
+    arrays = { 'row_names'   : np.array(result_df.index.values,   dtype=str)
+             , 'column_names': np.array(result_df.columns.values, dtype=str) }
+
+    if data_cache.is_sparse_df(result_df):
+        values_mat = result_df.sparse.to_coo().tocsc()
+        arrays.update(data=values_mat.data, indices=values_mat.indices, indptr=values_mat.indptr)
+    else:
+        arrays['values'] = result_df.values
+
+    np.savez(file_name, **arrays)
+
+
+def load_npz_df(file_name):
+    """ read a dataframe written by save_npz_df, or a consensus matrix of PackedConsensusMatrix.save_npz.
+
+    Args:
+        file_name: .npz file name.
+
+    Returns:
+        result_df: dense dataframe.
+    """
+
+    with np.load(file_name) as arrays:
+        if 'storage' in arrays:
+            consensus_matrix, sample_names = consensus_storage.load_npz(file_name)
+            return pd.DataFrame(np.asarray(consensus_matrix), index=sample_names, columns=sample_names)
+
+        row_names, column_names = arrays['row_names'], arrays['column_names']
+        if 'values' in arrays:
+            values = arrays['values']
+        else:
+            values = sparse.csc_matrix( (arrays['data'], arrays['indices'], arrays['indptr'])
+                                      , shape=(row_names.shape[0], column_names.shape[0]) ).toarray()
+
+    return pd.DataFrame(values, index=row_names, columns=column_names)
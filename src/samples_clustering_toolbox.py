@@ -2,14 +2,19 @@
 @author: The KnowEnG dev team
 """
 import os
+import threading
 import numpy as np
 import pandas as pd
+import scipy.sparse as spar
+from   scipy.sparse.linalg import splu
 import knpackage.toolbox as kn
 import knpackage.distributed_computing_utils as dstutil
 
 import clustering_eval_toolbox  as     cluster_eval
-from   sklearn.metrics          import silhouette_score, silhouette_samples
-from   sklearn.metrics.pairwise import pairwise_distances
+import consensus_storage_toolbox as    consensus_storage
+import data_cache_toolbox       as     data_cache
+import results_writer_toolbox   as     results_writer
+from   sklearn.metrics.pairwise import euclidean_distances
 
 
 def run_nmf(run_parameters):
@@ -24,27 +29,34 @@ def run_nmf(run_parameters):
     number_of_clusters         = run_parameters['number_of_clusters'        ]
     spreadsheet_name_full_path = run_parameters['spreadsheet_name_full_path']
 
-    spreadsheet_df             = kn.get_spreadsheet_df(spreadsheet_name_full_path)
+    spreadsheet_df             = get_nmf_spreadsheet_df(spreadsheet_name_full_path, run_parameters)
+    spreadsheet_df             = set_spreadsheet_precision(spreadsheet_df, run_parameters)
 
-    spreadsheet_mat            = spreadsheet_df.values
-    spreadsheet_mat            = kn.get_quantile_norm_matrix(spreadsheet_mat)
+    spreadsheet_mat            = get_spreadsheet_matrix(spreadsheet_df)
+    spreadsheet_mat            = normalize_spreadsheet_matrix(spreadsheet_mat, run_parameters)
 
-    h_mat                      = kn.perform_nmf(spreadsheet_mat, run_parameters)
+    h_mat,                     \
+    nmf_iterations,            \
+    nmf_seconds                = perform_nmf_with_solver(spreadsheet_mat, run_parameters)
 
-    linkage_matrix             = np.zeros((spreadsheet_mat.shape[1], spreadsheet_mat.shape[1]))
+    linkage_matrix             = np.zeros((spreadsheet_mat.shape[1], spreadsheet_mat.shape[1]), dtype=get_precision_dtype(run_parameters))
     sample_perm                = np.arange(0, spreadsheet_mat.shape[1])
     linkage_matrix             = kn.update_linkage_matrix(h_mat, sample_perm, linkage_matrix)
 
-    labels                     = kn.perform_kmeans(linkage_matrix, number_of_clusters)
+    labels,                    \
+    sample_order               = cluster_consensus_matrix(linkage_matrix, number_of_clusters, run_parameters)
 
     sample_names               = spreadsheet_df.columns
 
-    distance_matrix            =  pairwise_distances( h_mat.T, n_jobs = -1 ) # [n_samples, n_features]  use all available cores
+    h_mat                      = h_mat.astype(get_precision_dtype(run_parameters), copy=False)
+    writer_state               = results_writer.start_results_writer(run_parameters)
 
-    save_consensus_clustering            (linkage_matrix,  sample_names, labels, run_parameters)
-    calculate_and_save_silhouette_scores (distance_matrix, sample_names, labels, run_parameters)
-    save_final_samples_clustering        (                 sample_names, labels, run_parameters)
-    save_spreadsheet_and_variance_heatmap(spreadsheet_df,                labels, run_parameters)
+    save_consensus_clustering            (linkage_matrix,  sample_names, labels, run_parameters, writer_state, sample_order)
+    calculate_and_save_silhouette_scores (h_mat.T,         sample_names, labels, run_parameters, writer_state)
+    save_final_samples_clustering        (                 sample_names, labels, run_parameters, writer_state)
+    save_spreadsheet_and_variance_heatmap(spreadsheet_df,                labels, run_parameters, writer_state=writer_state)
+    save_nmf_convergence                 (run_parameters, [[0, nmf_iterations, nmf_seconds]], writer_state)
+    results_writer.stop_results_writer   (writer_state, run_parameters)
 
 
 def run_net_nmf(run_parameters):
@@ -61,34 +73,41 @@ def run_net_nmf(run_parameters):
     spreadsheet_name_full_path = run_parameters['spreadsheet_name_full_path']
 
     network_mat,               \
-    unique_gene_names          = kn.get_sparse_network_matrix(gg_network_name_full_path)
-    network_mat                = kn.normalize_sparse_mat_by_diagonal(network_mat)
-    lap_diag, lap_pos          = kn.form_network_laplacian_matrix(network_mat)
+    unique_gene_names,         \
+    lap_diag, lap_pos          = data_cache.get_network_matrices(gg_network_name_full_path, run_parameters)
+    network_mat,               \
+    lap_diag, lap_pos          = set_network_precision(network_mat, lap_diag, lap_pos, run_parameters)
 
-    spreadsheet_df             = kn.get_spreadsheet_df(spreadsheet_name_full_path)
-    spreadsheet_df             = kn.update_spreadsheet_df(spreadsheet_df, unique_gene_names)
+    spreadsheet_df             = data_cache.get_network_spreadsheet_df(spreadsheet_name_full_path, unique_gene_names, run_parameters)
+    spreadsheet_df             = set_spreadsheet_precision(spreadsheet_df, run_parameters)
 
     sample_names               = spreadsheet_df.columns
 
     spreadsheet_mat            = spreadsheet_df.values
-    spreadsheet_mat,           \
-    iterations                 = kn.smooth_matrix_with_rwr  (spreadsheet_mat, network_mat, run_parameters)
-    spreadsheet_mat            = kn.get_quantile_norm_matrix(spreadsheet_mat)
+    smooth_spreadsheet_mat,    \
+    iterations                 = smooth_matrix_with_rwr     (spreadsheet_mat, network_mat, run_parameters)
+    spreadsheet_mat            = normalize_spreadsheet_matrix(smooth_spreadsheet_mat, run_parameters)
 
-    h_mat                      = kn.perform_net_nmf         (spreadsheet_mat, lap_pos, lap_diag, run_parameters)
+    h_mat,                     \
+    nmf_iterations,            \
+    nmf_seconds                = perform_nmf_with_solver    (spreadsheet_mat, run_parameters, lap_diag, lap_pos)
 
-    linkage_matrix             = np.zeros((spreadsheet_mat.shape[1], spreadsheet_mat.shape[1]))
+    linkage_matrix             = np.zeros((spreadsheet_mat.shape[1], spreadsheet_mat.shape[1]), dtype=get_precision_dtype(run_parameters))
     sample_perm                = np.arange(0, spreadsheet_mat.shape[1])
     linkage_matrix             = kn.update_linkage_matrix(h_mat, sample_perm, linkage_matrix)
-    labels                     = kn.perform_kmeans(linkage_matrix, number_of_clusters)
+    labels,                    \
+    sample_order               = cluster_consensus_matrix(linkage_matrix, number_of_clusters, run_parameters)
 
-    distance_matrix            =  pairwise_distances( h_mat.T, n_jobs = -1) # [n_samples, n_features]. Use all available cores  
+    h_mat                      = h_mat.astype(get_precision_dtype(run_parameters), copy=False)
+    writer_state               = results_writer.start_results_writer(run_parameters)
 
-
-    save_consensus_clustering            (linkage_matrix,  sample_names, labels, run_parameters)
-    calculate_and_save_silhouette_scores (distance_matrix, sample_names, labels, run_parameters)
-    save_final_samples_clustering        (                 sample_names, labels, run_parameters)
-    save_spreadsheet_and_variance_heatmap(spreadsheet_df,                labels, run_parameters)
+    save_consensus_clustering            (linkage_matrix,  sample_names, labels, run_parameters, writer_state, sample_order)
+    calculate_and_save_silhouette_scores (h_mat.T,         sample_names, labels, run_parameters, writer_state)
+    save_final_samples_clustering        (                 sample_names, labels, run_parameters, writer_state)
+    save_spreadsheet_and_variance_heatmap(spreadsheet_df,                labels, run_parameters, writer_state=writer_state)
+    save_rwr_convergence                 (spreadsheet_df.values, network_mat, smooth_spreadsheet_mat, iterations, run_parameters, writer_state)
+    save_nmf_convergence                 (run_parameters, [[0, nmf_iterations, nmf_seconds]], writer_state)
+    results_writer.stop_results_writer   (writer_state, run_parameters)
 
 
 def run_cc_nmf(run_parameters):
@@ -104,26 +123,48 @@ def run_cc_nmf(run_parameters):
 
     processing_method          = run_parameters['processing_method'         ]
     number_of_bootstraps       = run_parameters['number_of_bootstraps'      ]
-    number_of_clusters         = run_parameters['number_of_clusters'        ]
     spreadsheet_name_full_path = run_parameters['spreadsheet_name_full_path']
 
-    spreadsheet_df             = kn.get_spreadsheet_df(spreadsheet_name_full_path)
+    spreadsheet_df             = get_nmf_spreadsheet_df(spreadsheet_name_full_path, run_parameters)
+    spreadsheet_df             = set_spreadsheet_precision(spreadsheet_df, run_parameters)
 
-    spreadsheet_mat            = spreadsheet_df.values
-    spreadsheet_mat            = kn.get_quantile_norm_matrix(spreadsheet_mat)
+    spreadsheet_mat            = get_spreadsheet_matrix(spreadsheet_df)
+    spreadsheet_mat            = normalize_spreadsheet_matrix(spreadsheet_mat, run_parameters)
 
     number_of_samples          = spreadsheet_mat.shape[1]
 
-    if   processing_method == 'serial':
-        for sample in range(0, number_of_bootstraps):
-                    run_cc_nmf_clusters_worker(spreadsheet_mat, run_parameters, sample)
+    if get_nmf_initialization(run_parameters) == 'warm':
+        prepare_nmf_warm_start(spreadsheet_mat, run_parameters)
 
-    elif processing_method == 'parallel':
-        find_and_save_cc_nmf_clusters_parallel(spreadsheet_mat, run_parameters, number_of_bootstraps)
+    linkage_matrix,            \
+    indicator_matrix           = initialize_consensus_matrices(number_of_samples, run_parameters)
+
+    if   processing_method == 'serial':
+        jobs_id                = range(0, number_of_bootstraps)
+        checkpointed           = load_bootstrap_checkpoint(run_parameters)
+        missing_jobs           = [ sample for sample in jobs_id if sample not in checkpointed ]
+        clusterings            = run_bootstrap_jobs( run_cc_nmf_clusters_worker, run_cc_nmf_clusters_batch_worker
+                                                   , [spreadsheet_mat], run_parameters, missing_jobs )
+        clusterings            = merge_checkpointed_clusterings(jobs_id, checkpointed, clusterings)
+        linkage_matrix,        \
+        indicator_matrix       = accumulate_clusterings(clusterings, linkage_matrix, indicator_matrix, run_parameters)
+
+    elif processing_method in ['parallel', 'threads']:
+        linkage_matrix,        \
+        indicator_matrix       = find_and_save_cc_nmf_clusters_parallel(spreadsheet_mat, run_parameters, number_of_bootstraps)
 
     elif processing_method == 'distribute':
         func_args          = [ spreadsheet_mat,            run_parameters ]
-        dependency_list    = [ run_cc_nmf_clusters_worker, save_a_clustering_to_tmp, dstutil.determine_parallelism_locally]
+        dependency_list    = [ run_cc_nmf_clusters_worker, save_or_return_a_clustering, save_a_clustering
+                             , is_consensus_accumulated_on_disk, perform_nmf_with_solver, update_nmf_factors_multiplicative
+                             , get_nmf_initial_factors, perform_batched_nmf, apply_network_to_stack
+                             , update_nmf_factors_hals, update_nmf_factors_anls_bpp, update_w_matrix_hals, get_laplacian_blocks
+                             , solve_nnls_with_bpp, solve_nnls_passive_sets, record_nmf_convergence
+                             , is_nmf_convergence_recorded, get_nmf_initialization, get_warm_start_factors
+                             , sample_a_spreadsheet_matrix, stack_matrices, get_xht_stack, get_wtx_stack
+                             , update_h_coordinate_matrix, perform_nmf_for_cluster_numbers, get_cluster_numbers
+                             , is_cluster_number_sweep, get_cluster_number_parameters, get_bootstrap_random_state
+                             , dstutil.determine_parallelism_locally]
         cluster_ip_address = run_parameters['cluster_ip_address']
         dstutil.execute_distribute_computing_job( cluster_ip_address
                                                 , number_of_bootstraps
@@ -133,18 +174,26 @@ def run_cc_nmf(run_parameters):
     else:
         raise ValueError('processing_method contains bad value.')
 
-    consensus_matrix = form_consensus_matrix( run_parameters,   number_of_samples  )
-    distance_matrix  = pairwise_distances   ( consensus_matrix, n_jobs = -1        ) # [n_samples, n_samples] use all available cores
-    labels           = kn.perform_kmeans    ( consensus_matrix, number_of_clusters )
+    consensus_matrix = form_consensus_matrix    ( run_parameters,   linkage_matrix, indicator_matrix )
+    writer_state     = results_writer.start_results_writer(run_parameters)
+    consensus_matrix, \
+    labels,           \
+    sample_order     = select_number_of_clusters( consensus_matrix, run_parameters, writer_state )
 
     sample_names     = spreadsheet_df.columns
 
-    save_consensus_clustering            (consensus_matrix, sample_names, labels, run_parameters)
-    calculate_and_save_silhouette_scores (distance_matrix,  sample_names, labels, run_parameters)
-    save_final_samples_clustering        (                  sample_names, labels, run_parameters)
-    save_spreadsheet_and_variance_heatmap(spreadsheet_df,                 labels, run_parameters)
+    save_consensus_clustering            (consensus_matrix, sample_names, labels, run_parameters, writer_state, sample_order)
+    calculate_and_save_silhouette_scores (consensus_matrix, sample_names, labels, run_parameters, writer_state)
+    save_final_samples_clustering        (                  sample_names, labels, run_parameters, writer_state)
+    save_spreadsheet_and_variance_heatmap(spreadsheet_df,                 labels, run_parameters, writer_state=writer_state)
+    save_bootstrap_convergence           (                                        run_parameters, writer_state)
+    save_nmf_warm_start_comparison       (consensus_matrix, labels, run_cc_nmf_clusters_worker, run_cc_nmf_clusters_batch_worker,
+                                          [spreadsheet_mat], run_parameters, writer_state)
+    save_nmf_convergence                 (                                        run_parameters, writer_state=writer_state)
+    results_writer.stop_results_writer   (writer_state,                           run_parameters)
 
     kn.remove_dir(run_parameters["tmp_directory"])
+    remove_bootstrap_checkpoint(run_parameters)
 
 
 def run_cc_net_nmf(run_parameters):
@@ -159,33 +208,61 @@ def run_cc_net_nmf(run_parameters):
     run_parameters             = update_tmp_directory(run_parameters, tmp_dir)
 
     processing_method          = run_parameters['processing_method'         ]
-    number_of_clusters         = run_parameters['number_of_clusters'        ]
     number_of_bootstraps       = run_parameters['number_of_bootstraps'      ]
     gg_network_name_full_path  = run_parameters['gg_network_name_full_path' ]
     spreadsheet_name_full_path = run_parameters['spreadsheet_name_full_path']
 
     network_mat,               \
-             unique_gene_names = kn.get_sparse_network_matrix(gg_network_name_full_path)
-    network_mat                = kn.normalize_sparse_mat_by_diagonal(network_mat)
-    lap_diag, lap_pos          = kn.form_network_laplacian_matrix(network_mat)
+    unique_gene_names,         \
+    lap_diag, lap_pos          = data_cache.get_network_matrices(gg_network_name_full_path, run_parameters)
+    network_mat,               \
+    lap_diag, lap_pos          = set_network_precision(network_mat, lap_diag, lap_pos, run_parameters)
 
-    spreadsheet_df             = kn.get_spreadsheet_df(spreadsheet_name_full_path)
-    spreadsheet_df             = kn.update_spreadsheet_df(spreadsheet_df, unique_gene_names)
+    spreadsheet_df             = data_cache.get_network_spreadsheet_df(spreadsheet_name_full_path, unique_gene_names, run_parameters)
+    spreadsheet_df             = set_spreadsheet_precision(spreadsheet_df, run_parameters)
 
     spreadsheet_mat            = spreadsheet_df.values
     number_of_samples          = spreadsheet_mat.shape[1]
     sample_names               = spreadsheet_df.columns
 
-    if   processing_method == 'serial':
-        for sample in range(0, number_of_bootstraps):
-            run_cc_net_nmf_clusters_worker            (network_mat, spreadsheet_mat, lap_diag, lap_pos, run_parameters, sample              )
+    smooth_spreadsheet_mat,    \
+    iterations                 = smooth_matrix_with_rwr(spreadsheet_mat, network_mat, run_parameters)
+    smooth_bootstrap_mat       = get_smooth_bootstrap_matrix(smooth_spreadsheet_mat, run_parameters)
+
+    if get_nmf_initialization(run_parameters) == 'warm':
+        prepare_nmf_warm_start(normalize_spreadsheet_matrix(smooth_spreadsheet_mat, run_parameters), run_parameters, lap_diag, lap_pos)
 
-    elif processing_method == 'parallel':
-            find_and_save_cc_net_nmf_clusters_parallel(network_mat, spreadsheet_mat, lap_diag, lap_pos, run_parameters, number_of_bootstraps)
+    linkage_matrix,            \
+    indicator_matrix           = initialize_consensus_matrices(number_of_samples, run_parameters)
+
+    if   processing_method == 'serial':
+        jobs_id                = range(0, number_of_bootstraps)
+        checkpointed           = load_bootstrap_checkpoint(run_parameters)
+        missing_jobs           = [ sample for sample in jobs_id if sample not in checkpointed ]
+        clusterings            = run_bootstrap_jobs( run_cc_net_nmf_clusters_worker, run_cc_net_nmf_clusters_batch_worker
+                                                   , [network_mat, spreadsheet_mat, smooth_bootstrap_mat, lap_diag, lap_pos]
+                                                   , run_parameters, missing_jobs )
+        clusterings            = merge_checkpointed_clusterings(jobs_id, checkpointed, clusterings)
+        linkage_matrix,        \
+        indicator_matrix       = accumulate_clusterings(clusterings, linkage_matrix, indicator_matrix, run_parameters)
+
+    elif processing_method in ['parallel', 'threads']:
+        linkage_matrix,        \
+        indicator_matrix       = find_and_save_cc_net_nmf_clusters_parallel(network_mat, spreadsheet_mat, smooth_bootstrap_mat, lap_diag, lap_pos, run_parameters, number_of_bootstraps)
 
     elif processing_method == 'distribute':
-        func_args          = [network_mat, spreadsheet_mat, lap_diag, lap_pos, run_parameters]
-        dependency_list    = [run_cc_net_nmf_clusters_worker, save_a_clustering_to_tmp, dstutil.determine_parallelism_locally]
+        func_args          = [network_mat, spreadsheet_mat, smooth_bootstrap_mat, lap_diag, lap_pos, run_parameters]
+        dependency_list    = [run_cc_net_nmf_clusters_worker, save_or_return_a_clustering, save_a_clustering
+                             , is_consensus_accumulated_on_disk, smooth_matrix_with_rwr, get_rwr_solver
+                             , solve_rwr_with_block_cg, perform_nmf_with_solver, update_nmf_factors_multiplicative
+                             , get_nmf_initial_factors, perform_batched_nmf, apply_network_to_stack
+                             , update_nmf_factors_hals, update_nmf_factors_anls_bpp, update_w_matrix_hals, get_laplacian_blocks
+                             , solve_nnls_with_bpp, solve_nnls_passive_sets, record_nmf_convergence
+                             , is_nmf_convergence_recorded, get_nmf_initialization, get_warm_start_factors
+                             , normalize_spreadsheet_matrix, stack_matrices, get_xht_stack, get_wtx_stack
+                             , update_h_coordinate_matrix, perform_nmf_for_cluster_numbers, get_cluster_numbers
+                             , is_cluster_number_sweep, get_cluster_number_parameters, get_bootstrap_random_state
+                             , sample_a_spreadsheet_matrix, dstutil.determine_parallelism_locally]
         cluster_ip_address = run_parameters['cluster_ip_address']
         dstutil.execute_distribute_computing_job( cluster_ip_address
                                                 , number_of_bootstraps
@@ -195,16 +272,25 @@ def run_cc_net_nmf(run_parameters):
     else:
         raise ValueError('processing_method contains bad value.')
 
-    consensus_matrix = form_consensus_matrix(run_parameters, number_of_samples)
-    distance_matrix  = pairwise_distances(consensus_matrix , n_jobs = -1      ) # [n_samples, n_samples] use all available cores
-    labels           = kn.perform_kmeans (consensus_matrix, number_of_clusters)
-
-    save_consensus_clustering            (consensus_matrix, sample_names, labels, run_parameters             )
-    calculate_and_save_silhouette_scores (distance_matrix,  sample_names, labels, run_parameters             )
-    save_final_samples_clustering        (                  sample_names, labels, run_parameters             )
-    save_spreadsheet_and_variance_heatmap(spreadsheet_df,                 labels, run_parameters, network_mat)
+    consensus_matrix = form_consensus_matrix    (run_parameters,   linkage_matrix, indicator_matrix)
+    writer_state     = results_writer.start_results_writer(run_parameters)
+    consensus_matrix, \
+    labels,           \
+    sample_order     = select_number_of_clusters(consensus_matrix, run_parameters, writer_state)
+
+    save_consensus_clustering            (consensus_matrix, sample_names, labels, run_parameters, writer_state, sample_order)
+    calculate_and_save_silhouette_scores (consensus_matrix, sample_names, labels, run_parameters, writer_state)
+    save_final_samples_clustering        (                  sample_names, labels, run_parameters, writer_state)
+    save_spreadsheet_and_variance_heatmap(spreadsheet_df,                 labels, run_parameters, smooth_spreadsheet_mat, writer_state)
+    save_bootstrap_convergence           (                                        run_parameters, writer_state)
+    save_rwr_convergence                 (spreadsheet_mat, network_mat, smooth_spreadsheet_mat, iterations, run_parameters, writer_state)
+    save_nmf_warm_start_comparison       (consensus_matrix, labels, run_cc_net_nmf_clusters_worker, run_cc_net_nmf_clusters_batch_worker,
+                                          [network_mat, spreadsheet_mat, smooth_bootstrap_mat, lap_diag, lap_pos], run_parameters, writer_state)
+    save_nmf_convergence                 (run_parameters, writer_state=writer_state)
+    results_writer.stop_results_writer   (writer_state, run_parameters)
 
     kn.remove_dir(run_parameters["tmp_directory"])
+    remove_bootstrap_checkpoint(run_parameters)
 
 
 def find_and_save_cc_nmf_clusters_parallel(spreadsheet_mat, run_parameters, local_parallelism):
@@ -215,10 +301,13 @@ def find_and_save_cc_nmf_clusters_parallel(spreadsheet_mat, run_parameters, loca
         spreadsheet_mat: genes x samples matrix.
         run_parameters: dictionary of run-time parameters.
         number_of_cpus: number of processes to be running in parallel
+
+    Returns:
+        linkage_matrix: sum of the bootstrap linkage matrices (not returned to a distribute head node).
+        indicator_matrix: sum of the bootstrap indicator matrices (not returned to a distribute head node).
     """
 
     jobs_id          = range(0, local_parallelism)
-    zipped_arguments = dstutil.zip_parameters(spreadsheet_mat, run_parameters, jobs_id)
 
     if 'parallelism' in run_parameters:
         parallelism = dstutil.determine_parallelism_locally(local_parallelism, run_parameters['parallelism'])
@@ -226,24 +315,36 @@ def find_and_save_cc_nmf_clusters_parallel(spreadsheet_mat, run_parameters, loca
     else:
         parallelism = dstutil.determine_parallelism_locally(local_parallelism)
 
-    dstutil.parallelize_processes_locally(run_cc_nmf_clusters_worker, zipped_arguments, parallelism)
+    if run_parameters['processing_method'] == 'distribute':
+        zipped_arguments = dstutil.zip_parameters(spreadsheet_mat, run_parameters, jobs_id)
+        dstutil.parallelize_processes_locally(run_cc_nmf_clusters_worker, zipped_arguments, parallelism)
+        return None
+
+    shared_arguments = [spreadsheet_mat]
+
+    return accumulate_clusterings_locally(run_cc_nmf_clusters_worker, shared_arguments, run_parameters, jobs_id, parallelism, spreadsheet_mat.shape[1],
+                                          run_cc_nmf_clusters_batch_worker)
 
 
-def find_and_save_cc_net_nmf_clusters_parallel(network_mat, spreadsheet_mat, lap_diag, lap_pos, run_parameters, local_parallelism):
+def find_and_save_cc_net_nmf_clusters_parallel(network_mat, spreadsheet_mat, smooth_spreadsheet_mat, lap_diag, lap_pos, run_parameters, local_parallelism):
     """ central loop: compute components for the consensus matrix from the input
         network and spreadsheet matrices and save them to temp files.
 
     Args:
         network_mat: genes x genes symmetric matrix.
         spreadsheet_mat: genes x samples matrix.
+        smooth_spreadsheet_mat: smoothed genes x samples matrix to slice, or None (see get_smooth_bootstrap_matrix).
         lap_dag: laplacian matrix component, L = lap_dag - lap_val.
         lap_val: laplacian matrix component, L = lap_dag - lap_val.
         run_parameters: dictionary of run-time parameters.
         number_of_cpus: number of processes to be running in parallel
+
+    Returns:
+        linkage_matrix: sum of the bootstrap linkage matrices (not returned to a distribute head node).
+        indicator_matrix: sum of the bootstrap indicator matrices (not returned to a distribute head node).
     """
 
     jobs_id          = range(0, local_parallelism)
-    zipped_arguments = dstutil.zip_parameters(network_mat, spreadsheet_mat, lap_diag, lap_pos, run_parameters, jobs_id)
 
     if 'parallelism' in run_parameters:
         parallelism = dstutil.determine_parallelism_locally(local_parallelism, run_parameters['parallelism'])
@@ -251,363 +352,3252 @@ def find_and_save_cc_net_nmf_clusters_parallel(network_mat, spreadsheet_mat, lap
     else:
         parallelism = dstutil.determine_parallelism_locally(local_parallelism)
 
-    dstutil.parallelize_processes_locally(run_cc_net_nmf_clusters_worker, zipped_arguments, parallelism)
+    if run_parameters['processing_method'] == 'distribute':
+        zipped_arguments = dstutil.zip_parameters(network_mat, spreadsheet_mat, smooth_spreadsheet_mat, lap_diag, lap_pos, run_parameters, jobs_id)
+        dstutil.parallelize_processes_locally(run_cc_net_nmf_clusters_worker, zipped_arguments, parallelism)
+        return None
 
+    shared_arguments = [network_mat, spreadsheet_mat, smooth_spreadsheet_mat, lap_diag, lap_pos]
+
+    return accumulate_clusterings_locally(run_cc_net_nmf_clusters_worker, shared_arguments, run_parameters, jobs_id, parallelism, spreadsheet_mat.shape[1],
+                                          run_cc_net_nmf_clusters_batch_worker)
 
-def run_cc_nmf_clusters_worker(spreadsheet_mat, run_parameters, sample):
-    """Worker to execute nmf_clusters in a single process
+
+def accumulate_clusterings_locally(worker, shared_arguments, run_parameters, jobs_id, parallelism, number_of_samples, batch_worker=None):
+    """ run the bootstrap worker in one warm local process pool and sum the returned clusterings
+        into the linkage and indicator matrices as they arrive (in bootstrap order when convergence
+        is tracked, so that the stopping point does not depend on timing). The read-only worker
+        arguments are shared with the pool once instead of being pickled for every job. With a
+        "bootstrap_batch_size" above one, each job is a batch of bootstraps for the batch worker.
+        The 'threads' "processing_method" runs the jobs in a pool of threads of this process instead,
+        all reading the same arguments (see get_bootstrap_random_state).
 
     Args:
-        spreadsheet_mat: genes x samples matrix.
+        worker: bootstrap worker function, worker(*shared_arguments, run_parameters, sample),
+                returning a clustering (see update_consensus_matrices).
+        shared_arguments: list of the read-only (dense or sparse matrix) worker arguments.
         run_parameters: dictionary of run-time parameters.
-        sample: each loops.
+        jobs_id: bootstrap sample numbers.
+        parallelism: number of processes to be running in parallel.
+        number_of_samples: number of spreadsheet columns.
+        batch_worker: (optional) batch worker function, batch_worker(*shared_arguments, run_parameters, samples),
+                returning the list of clusterings of the samples.
 
     Returns:
-        None
-
+        linkage_matrix: sum of the bootstrap linkage matrices.
+        indicator_matrix: sum of the bootstrap indicator matrices.
     """
+    import functools
 
-    np.random.seed(sample)
+    linkage_matrix, indicator_matrix = initialize_consensus_matrices(number_of_samples, run_parameters)
 
-    rows_sampling_fraction = run_parameters["rows_sampling_fraction"]
-    cols_sampling_fraction = run_parameters["cols_sampling_fraction"]
+    checkpointed = load_bootstrap_checkpoint(run_parameters)
+    missing_jobs = [ sample for sample in jobs_id if sample not in checkpointed ]
 
-    spreadsheet_mat,       \
-    sample_permutation     = kn.sample_a_matrix( spreadsheet_mat
-                                               , rows_sampling_fraction
-                                               , cols_sampling_fraction )
+    batch_size   = get_bootstrap_batch_size(run_parameters)
+    if batch_worker is not None and batch_size > 1:
+        worker       = batch_worker
+        missing_jobs = get_bootstrap_batches(missing_jobs, batch_size)
 
-    h_mat                 = kn.perform_nmf(spreadsheet_mat, run_parameters)
+    if run_parameters['processing_method'] == 'threads':
+        pool, shared_blocks = start_bootstrap_threads(parallelism), []
+        run_job             = functools.partial(worker, *shared_arguments, run_parameters)
+    else:
+        pool, shared_blocks = start_bootstrap_pool(worker, shared_arguments, run_parameters, parallelism)
+        run_job             = run_shared_worker
+    try:
+        chunk_size  = get_bootstrap_chunk_size(run_parameters, len(missing_jobs), parallelism)
+        if is_bootstrap_convergence_tracked(run_parameters):
+            clusterings = pool.imap          (run_job, missing_jobs, chunksize=chunk_size)
+        else:
+            clusterings = pool.imap_unordered(run_job, missing_jobs, chunksize=chunk_size)
+        if worker is batch_worker:
+            clusterings = ( clustering for batch in clusterings for clustering in batch )
+        clusterings = merge_checkpointed_clusterings(jobs_id, checkpointed, clusterings)
+        linkage_matrix, indicator_matrix = accumulate_clusterings(clusterings, linkage_matrix, indicator_matrix, run_parameters)
+    finally:
+        stop_bootstrap_pool(pool, shared_blocks)
 
-    save_a_clustering_to_tmp(h_mat, sample_permutation, run_parameters, sample)
+    return linkage_matrix, indicator_matrix
 
 
-def run_cc_net_nmf_clusters_worker(network_mat, spreadsheet_mat, lap_dag, lap_val, run_parameters, sample):
-    """Worker to execute net_nmf_clusters in a single process
+def start_bootstrap_pool(worker, shared_arguments, run_parameters, parallelism):
+    """ share the read-only worker arguments and start the pool of worker processes used
+        for all the bootstraps of a run; each process attaches the arguments once.
 
     Args:
-        network_mat: genes x genes symmetric matrix.
-        spreadsheet_mat: genes x samples matrix.
-        lap_dag: laplacian matrix component, L = lap_dag - lap_val.
-        lap_val: laplacian matrix component, L = lap_dag - lap_val.
-        run_parameters: dictionay of run-time parameters.
-        sample: each single loop.
+        worker: bootstrap worker function, worker(*shared_arguments, run_parameters, sample).
+        shared_arguments: list of the read-only (dense or sparse matrix) worker arguments.
+        run_parameters: dictionary of run-time parameters.
+        parallelism: number of processes to be running in parallel.
 
     Returns:
-        None
+        pool: multiprocessing pool; submit bootstrap sample numbers to run_shared_worker.
+        shared_blocks: shared memory blocks to be freed by stop_bootstrap_pool.
     """
+    import multiprocessing
 
-    np.random.seed(sample)
-    rows_sampling_fraction = run_parameters["rows_sampling_fraction"]
-    cols_sampling_fraction = run_parameters["cols_sampling_fraction"]
-
-    spreadsheet_mat,       \
-    sample_permutation     = kn.sample_a_matrix( spreadsheet_mat
-                                               , rows_sampling_fraction
-                                               , cols_sampling_fraction )
-    
-    spreadsheet_mat,       \
-    iterations             = kn.smooth_matrix_with_rwr(spreadsheet_mat, network_mat, run_parameters)
-    spreadsheet_mat        = kn.get_quantile_norm_matrix(spreadsheet_mat)
- 
-    h_mat                  = kn.perform_net_nmf(spreadsheet_mat, lap_val, lap_dag, run_parameters)
+    descriptors, shared_blocks = share_arguments(shared_arguments, run_parameters)
+    try:
+        pool = multiprocessing.Pool( processes   = parallelism
+                                   , initializer = initialize_shared_worker
+                                   , initargs    = (worker, descriptors, run_parameters) )
+    except:
+        release_shared_blocks(shared_blocks)
+        raise
 
-    save_a_clustering_to_tmp(h_mat, sample_permutation, run_parameters, sample)
+    return pool, shared_blocks
 
 
-def save_a_clustering_to_tmp(h_matrix, sample_permutation, run_parameters, sequence_number):
-    """ save one h_matrix and one permutation in temorary files with sequence_number appended names.
+def start_bootstrap_threads(parallelism):
+    """ start the pool of worker threads used for all the bootstraps of a 'threads' run; the numpy
+        and scipy kernels that take the time release the GIL, so the threads factor concurrently.
 
     Args:
-        h_matrix: k x permutation size matrix.
-        sample_permutation: indices of h_matrix columns permutation.
-        run_parameters: parmaeters including the "tmp_directory" name.
-        sequence_number: temporary file name suffix.
+        parallelism: number of threads to be running in parallel.
+
+    Returns:
+        pool: thread pool with the multiprocessing pool interface (stop it with stop_bootstrap_pool).
     """
+    from multiprocessing.pool import ThreadPool
 
-    tmp_dir = run_parameters["tmp_directory"]
+    return ThreadPool(processes=parallelism)
 
-    os.makedirs(tmp_dir, mode=0o755, exist_ok=True)
 
-    hname = os.path.join(tmp_dir, 'tmp_h_%d'%(sequence_number))
-    pname = os.path.join(tmp_dir, 'tmp_p_%d'%(sequence_number))
+def stop_bootstrap_pool(pool, shared_blocks):
+    """ stop the worker processes (including any still running jobs) and free the shared arguments.
+        A thread pool drops its waiting jobs and lets the running ones finish.
 
-    cluster_id = np.argmax(h_matrix, 0)
-    with open(hname, 'wb') as fh0:
-        cluster_id.dump(fh0)
-    with open(pname, 'wb') as fh1:
-        sample_permutation.dump(fh1)
+    Args:
+        pool: pool from start_bootstrap_pool or start_bootstrap_threads.
+        shared_blocks: shared memory blocks from start_bootstrap_pool.
+    """
 
+    pool.terminate()
+    pool.join()
+    release_shared_blocks(shared_blocks)
 
-def form_consensus_matrix(run_parameters, number_of_samples):
-    """ compute the consensus matrix from the indicator and linkage matrix inputs
-        formed by the bootstrap "temp_*" files.
+
+def run_bootstrap_jobs(worker, batch_worker, arguments, run_parameters, samples):
+    """ generate the clusterings of the bootstrap samples in this process, one worker call per sample,
+        or "bootstrap_batch_size" samples per batch worker call.
 
     Args:
-        run_parameters: parameter set dictionary with "tmp_directory" key.
-        linkage_matrix: linkage matrix from initialization or previous call.
-        indicator_matrix: indicator matrix from initialization or previous call.
+        worker: bootstrap worker function, worker(*arguments, run_parameters, sample).
+        batch_worker: batch worker function, batch_worker(*arguments, run_parameters, samples).
+        arguments: list of the read-only worker arguments.
+        run_parameters: dictionary with (optional) "bootstrap_batch_size" key.
+        samples: bootstrap sample numbers.
 
     Returns:
-        consensus_matrix: (sum of linkage matrices) / (sum of indicator matrices).
+        clusterings: generator of the clusterings of the samples, in samples order.
     """
 
-    linkage_matrix   = np.zeros((number_of_samples, number_of_samples))
-    indicator_matrix = linkage_matrix.copy()
+    batch_size = get_bootstrap_batch_size(run_parameters)
 
-    linkage_matrix, indicator_matrix = get_linkage_matrix(run_parameters, linkage_matrix, indicator_matrix)
-    consensus_matrix                 = linkage_matrix / np.maximum(indicator_matrix, 1)
+    if batch_size == 1:
+        for sample in samples:
+            yield worker(*arguments, run_parameters, sample)
+        return
 
-    return consensus_matrix
+    for batch in get_bootstrap_batches(samples, batch_size):
+        for clustering in batch_worker(*arguments, run_parameters, batch):
+            yield clustering
 
 
-def get_linkage_matrix(run_parameters, linkage_matrix, indicator_matrix):
-    """ read bootstrap temp_h* and temp_p* files, compute and add the linkage_matrix.
+def get_bootstrap_batch_size(run_parameters):
+    """ number of bootstraps factorized together by the batched nmf engine (1: one at a time).
 
     Args:
-        run_parameters: parameter set dictionary.
-        linkage_matrix: connectivity matrix from initialization or previous call.
+        run_parameters: dictionary with (optional) "bootstrap_batch_size" key.
 
     Returns:
-        linkage_matrix: summed with "temp_h*" files in run_parameters["tmp_directory"].
+        batch_size: positive integer.
     """
 
-    if run_parameters['processing_method'] == 'distribute':
-        tmp_dir = os.path.join(run_parameters['cluster_shared_volumn'],
-                               os.path.basename(os.path.normpath(run_parameters['tmp_directory'])))
+    if 'bootstrap_batch_size' not in run_parameters:
+        return 1
 
-    else:
-        tmp_dir = run_parameters["tmp_directory"]
-        
-    dir_list = os.listdir(tmp_dir)
+    batch_size = int(run_parameters['bootstrap_batch_size'])
+    if batch_size < 1:
+        raise ValueError('bootstrap_batch_size contains bad value.')
 
-    for tmp_f in dir_list:
-        if tmp_f[0:6] == 'tmp_p_':
-            pname = os.path.join(tmp_dir, tmp_f)
-            hname = os.path.join(tmp_dir, 'tmp_h_' + tmp_f[6:len(tmp_f)])
+    return batch_size
 
-            sample_permutation = np.load(pname)
-            h_mat              = np.load(hname)
 
-            linkage_matrix   = kn.update_linkage_matrix(h_mat, sample_permutation, linkage_matrix)
-            indicator_matrix = kn.update_indicator_matrix(sample_permutation, indicator_matrix)
+def get_bootstrap_batches(samples, batch_size):
+    """ split the bootstrap sample numbers into consecutive batches.
 
-    return linkage_matrix, indicator_matrix
+    Args:
+        samples: bootstrap sample numbers.
+        batch_size: number of samples per batch.
+
+    Returns:
+        batches: list of lists of sample numbers.
+    """
 
+    samples = list(samples)
+
+    return [ samples[start:start + batch_size] for start in range(0, len(samples), batch_size) ]
+
+
+def get_bootstrap_chunk_size(run_parameters, number_of_jobs, parallelism):
+    """ number of bootstraps handed to a worker process at a time: about four chunks per process
+        so that slow bootstraps are balanced over the pool, unless "bootstrap_chunk_size" is set.
 
-def save_spreadsheet_and_variance_heatmap(spreadsheet_df, labels, run_parameters, network_mat=None):
-    """ save the full genes by samples spreadsheet as processed or smoothed if network is provided.
-        Also save variance in separate file.
     Args:
-        spreadsheet_df: the dataframe as processed
-        run_parameters: with keys for "results_directory", "method", (optional - "top_number_of_genes")
-        network_mat:    (if appropriate) normalized network adjacency matrix used in processing
+        run_parameters: dictionary with (optional) "bootstrap_chunk_size" key.
+        number_of_jobs: number of bootstraps to be scheduled.
+        parallelism: number of processes in the pool.
 
-    Output:
-        genes_by_samples_heatmp_{method}_{timestamp}_viz.tsv
-        genes_averages_by_cluster_{method}_{timestamp}_viz.tsv
-        top_genes_by_cluster_{method}_{timestamp}_download.tsv
+    Returns:
+        chunk_size: positive integer.
     """
 
-    top_number_of_genes = run_parameters['top_number_of_genes']
+    if 'bootstrap_chunk_size' in run_parameters:
+        return max(1, int(run_parameters['bootstrap_chunk_size']))
 
-    if network_mat is not None:
-        sample_smooth, nun = kn.smooth_matrix_with_rwr(spreadsheet_df.values, network_mat, run_parameters)
-        clusters_df        = pd.DataFrame(sample_smooth, index=spreadsheet_df.index.values, columns=spreadsheet_df.columns.values)
+    return max(1, int(np.ceil(number_of_jobs / (4 * parallelism))))
 
-    else:
-        clusters_df = spreadsheet_df
 
-    clusters_df.to_csv(get_output_file_name(run_parameters, 'genes_by_samples_heatmap', 'viz'), sep='\t')
+SHARED_WORKER = {}
 
-    cluster_ave_df = pd.DataFrame({i: spreadsheet_df.iloc[:, labels == i].mean(axis=1) for i in np.unique(labels)})
 
-    col_labels = []
-    for cluster_number in np.unique(labels):
-        col_labels.append('Cluster_%d'%(cluster_number))
+def initialize_shared_worker(worker, descriptors, run_parameters):
+    """ pool initializer: attach the shared worker arguments once per worker process.
+
+    Args:
+        worker: bootstrap worker function.
+        descriptors: shared argument descriptors from share_arguments.
+        run_parameters: dictionary of run-time parameters.
+    """
+
+    SHARED_WORKER['worker'        ] = worker
+    SHARED_WORKER['run_parameters'] = run_parameters
+    SHARED_WORKER['blocks'        ] = []
+    SHARED_WORKER['arguments'     ] = [ attach_an_argument(descriptor, SHARED_WORKER['blocks'])
+                                        for descriptor in descriptors ]
 
-    cluster_ave_df.columns = col_labels
-    cluster_ave_df.to_csv(get_output_file_name(run_parameters, 'genes_averages_by_cluster', 'viz'), sep='\t')
 
-    clusters_variance_df   = pd.DataFrame(clusters_df.var(axis=1), columns=['variance'])
-    clusters_variance_df.to_csv(get_output_file_name(run_parameters, 'genes_variance', 'viz'), sep='\t',float_format='%g')
+def run_shared_worker(sample):
+    """ call the worker of this pool process with its attached arguments.
 
-    top_number_of_genes_df = pd.DataFrame(data=np.zeros((cluster_ave_df.shape)), columns=cluster_ave_df.columns,
-                                          index=cluster_ave_df.index.values)
+    Args:
+        sample: bootstrap sample number.
 
-    for sample in top_number_of_genes_df.columns.values:
-        top_index = np.argsort(cluster_ave_df[sample].values)[::-1]
-        top_number_of_genes_df[sample].iloc[top_index[0:top_number_of_genes]] = 1
+    Returns:
+        the worker return value.
+    """
 
-    top_number_of_genes_df.to_csv(get_output_file_name(run_parameters, 'top_genes_by_cluster', 'download'), sep='\t')
+    return SHARED_WORKER['worker'](*SHARED_WORKER['arguments'], SHARED_WORKER['run_parameters'], sample)
 
 
-def save_consensus_clustering(consensus_matrix, sample_names, labels, run_parameters):
-    """ write the consensus matrix as a dataframe with sample_names column lablels
-        and cluster labels as row labels.
+def share_arguments(arguments, run_parameters):
+    """ copy dense arrays and the components of sparse matrices into shared memory blocks,
+        or memory-mapped files in the tmp directory when "shared_inputs" is 'memmap'.
 
     Args:
-        consensus_matrix: sample_names x sample_names numerical matrix.
-        sample_names:     data identifiers for column names.
-        labels:           cluster numbers for row names.
-        run_parameters:   path to write to consensus_data file (run_parameters["results_directory"]).
+        arguments: list of numpy arrays, scipy sparse matrices or other (picklable) objects.
+        run_parameters: dictionary with "tmp_directory" and (optional) "shared_inputs"
+                        ('shared_memory' (default) or 'memmap') keys.
 
-    Output:
-        consensus_matrix_{method}_{timestamp}_viz.tsv
-        silhouette_average_{method}_{timestamp}_viz.tsv
+    Returns:
+        descriptors: list of small picklable argument descriptions for attach_an_argument.
+        shared_blocks: shared memory blocks to be freed with release_shared_blocks.
     """
+    import scipy.sparse as spar
 
-    file_name_mat     = get_output_file_name(run_parameters, 'consensus_matrix',             'viz')
+    shared_blocks = []
+    descriptors   = []
 
-    out_df = pd.DataFrame(data=consensus_matrix, columns=sample_names, index=sample_names)
-    out_df.to_csv(file_name_mat, sep='\t', float_format='%g')
+    for argument_number, argument in enumerate(arguments):
+        name = 'arg%d'%(argument_number)
+        if spar.issparse(argument):
+            argument    = spar.csr_matrix(argument)
+            descriptors.append(('csr', argument.shape
+                               , share_an_array(argument.data,    name + '_data',    run_parameters, shared_blocks)
+                               , share_an_array(argument.indices, name + '_indices', run_parameters, shared_blocks)
+                               , share_an_array(argument.indptr,  name + '_indptr',  run_parameters, shared_blocks)))
+        elif isinstance(argument, np.ndarray):
+            descriptors.append(('dense', share_an_array(argument, name, run_parameters, shared_blocks)))
+        else:
+            descriptors.append(('object', argument))
 
+    return descriptors, shared_blocks
 
-def calculate_and_save_silhouette_scores(distance_matrix, sample_names, labels, run_parameters):
-    """ Calculate the silhouette scores of a distance matrix [n_samples,n_samples]
+
+def share_an_array(array, name, run_parameters, shared_blocks):
+    """ copy one array into a new shared memory block or memory-mapped tmp file.
 
     Args:
-        matrix:           sample_names x sample_names numerical matrix.
-        labels:           cluster numbers for row names.
-        run_parameters:   path to write to consensus_data file (run_parameters["results_directory"]).
+        array: numpy array.
+        name: file name for the memory-mapped tmp file.
+        run_parameters: dictionary with "tmp_directory" and (optional) "shared_inputs" keys.
+        shared_blocks: list the new shared memory block is appended to.
 
-    Output:
-            silhouette_overall_score_{method}_{timestamp}_viz.tsv
-        silhouette_per_cluster_score_{method}_{timestamp}_viz.tsv
-         silhouette_per_sample_score_{method}_{timestamp}_viz.tsv
+    Returns:
+        descriptor: (storage, shared memory block name or file name, shape, dtype string).
     """
 
-    file_name_all     = get_output_file_name(run_parameters, 'silhouette_overall_score',     'viz')
-    file_name_cluster = get_output_file_name(run_parameters, 'silhouette_per_cluster_score', 'viz')
-    file_name_sample  = get_output_file_name(run_parameters, 'silhouette_per_sample_score',  'viz')
+    if 'shared_inputs' in run_parameters and run_parameters['shared_inputs'] == 'memmap':
+        file_name = os.path.join(run_parameters['tmp_directory'], 'shared_%s.npy'%(name))
+        np.save(file_name, array)
+        return 'memmap', file_name, array.shape, array.dtype.str
 
+    from multiprocessing import shared_memory
 
-    n_clusters,       \
-    overall,          \
-    per_cluster,      \
-    per_sample        = get_clustering_scores(distance_matrix,labels) # distance matrix
+    block        = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    shared_array[...] = array
+    shared_blocks.append(block)
 
-    with open(file_name_all,     'w') as fh_all:
-                fh_all.write( "%d\t%g\n" %(n_clusters,overall) )
+    return 'shared_memory', block.name, array.shape, array.dtype.str
 
-    with open(file_name_cluster, 'w') as fh_cluster:
-        for i in range(n_clusters):
-            fh_cluster.write( "%d\t%g\n" %(i, per_cluster[i]) )
 
+def attach_an_argument(descriptor, shared_blocks):
+    """ rebuild a worker argument from its descriptor without copying the shared data.
 
-    per_sample_df = pd.DataFrame(data=per_sample, index=sample_names)
-    per_sample_df.to_csv(file_name_sample, sep='\t', header=None, float_format='%g')
+    Args:
+        descriptor: descriptor from share_arguments.
+        shared_blocks: list the attached shared memory blocks are appended to (keeps them open).
 
+    Returns:
+        argument: read-only numpy array, scipy csr matrix, or the original object.
+    """
+    import scipy.sparse as spar
+
+    if descriptor[0] == 'csr':
+        shape, data, indices, indptr = descriptor[1:]
+        argument = spar.csr_matrix(( attach_an_array(data,    shared_blocks)
+                                   , attach_an_array(indices, shared_blocks)
+                                   , attach_an_array(indptr,  shared_blocks) ), shape=shape, copy=False)
+    elif descriptor[0] == 'dense':
+        argument = attach_an_array(descriptor[1], shared_blocks)
+    else:
+        argument = descriptor[1]
 
-def get_clustering_scores(matrix,labels):
-    """ computes three levels silhoutte scores,overall, per_cluster, and per_sample
+    return argument
+
+
+def attach_an_array(array_descriptor, shared_blocks):
+    """ map one shared memory block or memory-mapped tmp file as a read-only numpy array.
 
     Args:
-        matrix: sample_names x sample_names numerical matrix.
-        labels: samples label
+        array_descriptor: descriptor from share_an_array.
+        shared_blocks: list the attached shared memory block is appended to.
 
-    Output:
-        overall:         overall silhoutte score
-        per_cluster: per cluster silhoutte score
-        per_sample : per sample  silhoutte score
+    Returns:
+        array: read-only numpy array backed by the shared data.
     """
 
-    n_clusters = len(set(labels))
+    storage, name, shape, dtype = array_descriptor
 
-    if n_clusters > 1:
-        silhouette_values = silhouette_samples(matrix, labels, metric='precomputed')
-    else:
-        silhouette_values = np.ones(len(labels) )
+    if storage == 'memmap':
+        return np.load(name, mmap_mode='r')
 
-    cluster_mean = np.empty([n_clusters])
-    cluster_size = np.empty([n_clusters])
+    from multiprocessing import shared_memory
 
-    for i in range(n_clusters):
-        cluster_values  = silhouette_values[labels == i]
-        cluster_mean[i] = cluster_values.mean()  
-        cluster_size[i] = cluster_values.shape[0]
+    block = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    array.flags.writeable = False
+    shared_blocks.append(block)
 
-    overall      = cluster_mean.dot(cluster_size) / len(labels)
-    per_cluster  = cluster_mean
-    per_sample   = silhouette_values
+    return array
 
-    return n_clusters, overall, per_cluster, per_sample
 
+def release_shared_blocks(shared_blocks):
+    """ close and free the shared memory blocks created by share_arguments.
 
-def save_final_samples_clustering(sample_names, labels, run_parameters):
-    """ wtite .tsv file that assings a cluster number label to the sample_names.
+    Args:
+        shared_blocks: list of shared memory blocks.
+    """
+
+    for block in shared_blocks:
+        block.close()
+        block.unlink()
+
+
+def get_bootstrap_random_state(sample, run_parameters):
+    """ the random number source of a bootstrap: the global numpy random state seeded with the sample
+        number, or, for the 'threads' "processing_method", a np.random.Generator of its own, spawned as
+        child "sample" of SeedSequence(0), so that concurrent bootstraps neither share nor disturb a
+        state and every bootstrap draws the same numbers whichever thread runs it.
 
     Args:
-        sample_names: (unique) data identifiers.
-        labels: cluster number assignments.
-        run_parameters: write path (run_parameters["results_directory"]).
+        sample: bootstrap sample number.
+        run_parameters: dictionary with (optional) "processing_method" key.
 
-    Output:
-        samples_labeled_by_cluster_{method}_{timestamp}_viz.tsv
-        phenotypes_labeled_by_cluster_{method}_{timestamp}_viz.tsv
+    Returns:
+        random_state: np.random.Generator, or None for the (seeded) global random state.
     """
 
-    cluster_labels_df         = kn.create_df_with_sample_labels(sample_names, labels)
-    cluster_mapping_full_path = get_output_file_name(run_parameters, 'samples_label_by_cluster', 'viz')
-    cluster_labels_df.to_csv(cluster_mapping_full_path, sep='\t', header=None)
+    if 'processing_method' in run_parameters and run_parameters['processing_method'] == 'threads':
+        return np.random.default_rng(np.random.SeedSequence(0, spawn_key=(sample,)))
 
-    if 'phenotype_name_full_path' in run_parameters.keys():
-        run_parameters['cluster_mapping_full_path'] = cluster_mapping_full_path
-        cluster_eval.clustering_evaluation(run_parameters)
+    np.random.seed(sample)
 
+    return None
+
+
+def run_cc_nmf_clusters_worker(spreadsheet_mat, run_parameters, sample):
+    """Worker to execute nmf_clusters in a single process
 
-def get_output_file_name(run_parameters, prefix_string, suffix_string='', type_suffix='tsv'):
-    """ get the full directory / filename for writing
     Args:
-        run_parameters: dictionary with keys: "results_directory", "method" and "correlation_measure"
-        prefix_string:  the first letters of the ouput file name
-        suffix_string:  the last letters of the output file name before '.tsv'
+        spreadsheet_mat: genes x samples matrix.
+        run_parameters: dictionary of run-time parameters.
+        sample: each loops.
 
     Returns:
-        output_file_name:   full file and directory name suitable for file writing
+        clustering: (cluster_id, sample_permutation), or None when saved to the tmp directory.
     """
 
-    method            = run_parameters['method'] 
-    results_directory = run_parameters["results_directory"]
+    random_state = get_bootstrap_random_state(sample, run_parameters)
 
-    output_file_name = os.path.join(results_directory,    prefix_string + '_' + method)
-    output_file_name = kn.create_timestamped_filename(output_file_name) + '_' + suffix_string + '.' + type_suffix
+    rows_sampling_fraction = run_parameters["rows_sampling_fraction"]
+    cols_sampling_fraction = run_parameters["cols_sampling_fraction"]
 
-    return output_file_name
+    spreadsheet_mat,       \
+    sample_permutation     = sample_a_spreadsheet_matrix( spreadsheet_mat
+                                                        , rows_sampling_fraction
+                                                        , cols_sampling_fraction
+                                                        , random_state )
 
+    h_mat,                \
+    nmf_iterations,       \
+    nmf_seconds           = perform_nmf_for_cluster_numbers(spreadsheet_mat, sample_permutation, run_parameters,
+                                                            random_state=random_state)
+    record_nmf_convergence(sample, nmf_iterations, nmf_seconds, run_parameters)
+
+    return save_or_return_a_clustering(h_mat, sample_permutation, run_parameters, sample)
 
-def update_tmp_directory(run_parameters, tmp_dir):
-    """ Update tmp_directory value in rum_parameters dictionary
+
+def run_cc_net_nmf_clusters_worker(network_mat, spreadsheet_mat, smooth_spreadsheet_mat, lap_dag, lap_val, run_parameters, sample):
+    """Worker to execute net_nmf_clusters in a single process
 
     Args:
-        run_parameters: run_parameters as the dictionary config
-        tmp_dir: temporary directory prefix subjected to different functions
+        network_mat: genes x genes symmetric matrix.
+        spreadsheet_mat: genes x samples matrix.
+        smooth_spreadsheet_mat: smoothed genes x samples matrix to slice, or None to smooth the sample.
+        lap_dag: laplacian matrix component, L = lap_dag - lap_val.
+        lap_val: laplacian matrix component, L = lap_dag - lap_val.
+        run_parameters: dictionay of run-time parameters.
+        sample: each single loop.
 
     Returns:
-        run_parameters: an updated run_parameters
+        clustering: (cluster_id, sample_permutation), or None when saved to the tmp directory.
     """
 
-    if (run_parameters['processing_method'] == 'distribute'):
-        run_parameters["tmp_directory"] = kn.create_dir(run_parameters['cluster_shared_volumn'], tmp_dir)
+    random_state = get_bootstrap_random_state(sample, run_parameters)
+    rows_sampling_fraction = run_parameters["rows_sampling_fraction"]
+    cols_sampling_fraction = run_parameters["cols_sampling_fraction"]
+
+    spreadsheet_mat,       \
+    sample_permutation     = sample_a_spreadsheet_matrix( spreadsheet_mat
+                                                        , rows_sampling_fraction
+                                                        , cols_sampling_fraction
+                                                        , random_state )
+    
+    if smooth_spreadsheet_mat is None:
+        spreadsheet_mat,   \
+        iterations         = smooth_matrix_with_rwr(spreadsheet_mat, network_mat, run_parameters)
     else:
-        run_parameters["tmp_directory"] = kn.create_dir(run_parameters["run_directory"], tmp_dir)
+        spreadsheet_mat    = smooth_spreadsheet_mat[:, sample_permutation]
 
-    return run_parameters
+    spreadsheet_mat        = normalize_spreadsheet_matrix(spreadsheet_mat, run_parameters)
+ 
+    h_mat,                 \
+    nmf_iterations,        \
+    nmf_seconds            = perform_nmf_for_cluster_numbers(spreadsheet_mat, sample_permutation, run_parameters, lap_dag, lap_val,
+                                                             random_state)
+    record_nmf_convergence(sample, nmf_iterations, nmf_seconds, run_parameters)
+
+    return save_or_return_a_clustering(h_mat, sample_permutation, run_parameters, sample)
 
-def form_consensus_matrix_graphic(consensus_matrix, k=3):
-    """ use K-means to reorder the consensus matrix for graphic display.
+
+def sample_a_spreadsheet_matrix(spreadsheet_mat, rows_fraction, cols_fraction, random_state=None):
+    """ kn.sample_a_matrix for dense or sparse spreadsheets: the columns sampled with "cols_fraction",
+        the rows left out with "rows_fraction" set to zero and the all zero columns dropped. A sparse
+        spreadsheet draws the same permutations and stays sparse (the left out rows are removed from
+        its stored values). Given a random_state, the permutations are drawn from it instead of the
+        global random state.
 
     Args:
-        consensus_matrix: calculated consensus matrix in samples x samples order.
-        k: number of clusters estimate (inner diminsion k of factored h_matrix).
+        spreadsheet_mat: genes x samples (dense or scipy sparse) matrix.
+        rows_fraction: fraction of the rows kept.
+        cols_fraction: fraction of the columns sampled.
+        random_state: (optional) np.random.Generator (see get_bootstrap_random_state).
+
+    Returns:
+        sample_random: sampled genes x samples matrix (scipy csc matrix for a sparse spreadsheet).
+        sample_permutation: indices of the sampled columns.
+    """
+    import scipy.sparse as spar
+
+    if random_state is None:
+        if not spar.issparse(spreadsheet_mat):
+            return kn.sample_a_matrix(spreadsheet_mat, rows_fraction, cols_fraction)
+        random_state = np.random
+
+    features_size        = int(np.round(spreadsheet_mat.shape[0] * (1 - rows_fraction)))
+    features_permutation = random_state.permutation(spreadsheet_mat.shape[0])[0:features_size]
+
+    patients_size        = int(np.round(spreadsheet_mat.shape[1] * cols_fraction))
+    sample_permutation   = random_state.permutation(spreadsheet_mat.shape[1])[0:patients_size]
+
+    if not spar.issparse(spreadsheet_mat):
+        sample_random    = spreadsheet_mat[:, sample_permutation]
+        sample_random[features_permutation, :] = 0
+        positive_col_set = np.sum(sample_random, axis=0) > 0
+        return sample_random[:, positive_col_set], sample_permutation[positive_col_set]
+
+    features_left_out    = np.zeros(spreadsheet_mat.shape[0], dtype=bool)
+    features_left_out[features_permutation] = True
+
+    sample_random        = spar.csc_matrix(spreadsheet_mat)[:, sample_permutation]
+    sample_random.data[features_left_out[sample_random.indices]] = 0
+    sample_random.eliminate_zeros()
+
+    positive_col_set     = np.asarray(sample_random.sum(axis=0)).ravel() > 0
+    sample_random        = sample_random[:, positive_col_set]
+    sample_permutation   = sample_permutation[positive_col_set]
+
+    return sample_random, sample_permutation
+
+
+def perform_nmf_with_solver(x_matrix, run_parameters, lap_diag=None, lap_pos=None, initial_factors=None, random_state=None):
+    """ nonnegative matrix factorization X ~ W.H (network based when the laplacian components are given,
+        minimizing ||X-WH|| + lambda.tr(W'.L.W)) with the "nmf_solver" engine: kn multiplicative updates
+        when no solver is given; 'multiplicative' the same updates with the iterations counted; 'hals'
+        hierarchical alternating least squares; 'anls_bpp' alternating nonnegative least squares by block
+        principal pivoting (with the graph regularized hals update of W for network based nmf). Every
+        engine stops on the kn rule: argmax(H) unchanged for "nmf_max_invariance" iterations. A sparse X
+        is always factored by the local engines, with sparse-dense products, and so are the factors drawn
+        from a random_state (the kn engine draws from the global random state).
+
+    Args:
+        x_matrix: the postive (dense or scipy sparse) matrix (X) to be decomposed into W.H
+        run_parameters: parameters dictionary with keys "number_of_clusters", "nmf_max_iterations",
+            "nmf_max_invariance", "nmf_conv_check_freq", "nmf_penalty_parameter" and (optional) "nmf_solver".
+        lap_diag: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        lap_pos: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        initial_factors: (optional) initial (W, H), e.g. from get_warm_start_factors; random (as kn) when None.
+        random_state: (optional) np.random.Generator the random initial factors are drawn from.
+
+    Returns:
+        h_matrix: nonnegative right factor (H) matrix.
+        iterations: number of W, H updates (None for the kn engine).
+        seconds: wall time of the factorization.
+    """
+    import time
+    import scipy.sparse as spar
+
+    start_time = time.perf_counter()
+
+    if 'nmf_solver' not in run_parameters and initial_factors is None and random_state is None and not spar.issparse(x_matrix):
+        if lap_diag is None:
+            h_matrix = kn.perform_nmf(x_matrix, run_parameters)
+        else:
+            h_matrix = kn.perform_net_nmf(x_matrix, lap_pos, lap_diag, run_parameters)
+
+        return h_matrix, None, time.perf_counter() - start_time
+
+    if initial_factors is None:
+        initial_factors = get_nmf_initial_factors(x_matrix, run_parameters, random_state)
+
+    w_matrix,   \
+    h_matrix    = initial_factors
+    w_stack,    \
+    h_stack,    \
+    iterations, \
+    seconds     = perform_batched_nmf( stack_matrices([x_matrix]), w_matrix[np.newaxis], h_matrix[np.newaxis]
+                                     , run_parameters, lap_diag, lap_pos )
+
+    return h_stack[0], iterations[0], time.perf_counter() - start_time
+
+
+def perform_nmf_for_cluster_numbers(x_matrix, sample_permutation, run_parameters, lap_diag=None, lap_pos=None, random_state=None):
+    """ factor a bootstrap matrix (perform_nmf_with_solver, warm started when asked) for the number of
+        clusters, or for every number of clusters of a sweep, in sweep order from the same random state.
+
+    Args:
+        x_matrix: the postive matrix (X) to be decomposed into W.H
+        sample_permutation: indices of the sampled columns.
+        run_parameters: parameters dictionary (see perform_nmf_with_solver).
+        lap_diag: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        lap_pos: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        random_state: (optional) np.random.Generator of the bootstrap (see get_bootstrap_random_state).
+
+    Returns:
+        h_matrix: nonnegative right factor (H) matrix, or the list of them for a sweep.
+        iterations: number of W, H updates, summed over a sweep (None for the kn engine).
+        seconds: wall time of the factorizations.
+    """
+
+    if not is_cluster_number_sweep(run_parameters):
+        return perform_nmf_with_solver( x_matrix, run_parameters, lap_diag, lap_pos
+                                      , get_warm_start_factors(sample_permutation, run_parameters, random_state), random_state )
+
+    h_matrices, iterations, seconds = [], 0, 0
+    for cluster_parameters in get_cluster_number_parameters(run_parameters):
+        h_matrix,     \
+        k_iterations, \
+        k_seconds     = perform_nmf_with_solver( x_matrix, cluster_parameters, lap_diag, lap_pos
+                                               , get_warm_start_factors(sample_permutation, cluster_parameters, random_state)
+                                               , random_state )
+        h_matrices.append(h_matrix)
+        seconds       = seconds + k_seconds
+        if iterations is not None and k_iterations is not None:
+            iterations = iterations + k_iterations
+        else:
+            iterations = None
+
+    return h_matrices, iterations, seconds
+
+
+def get_cluster_numbers(run_parameters):
+    """ the numbers of clusters of the run: "number_of_clusters" is one number, or a list of numbers
+        and 'first..last' ranges (e.g. [2..10] or [2, 4, 6]) for a sweep.
+
+    Args:
+        run_parameters: dictionary with "number_of_clusters" key.
 
     Returns:
-        cc_cm: consensus_matrix with rows and columns in K-means sort order.
+        cluster_numbers: list of the numbers of clusters, in sweep order.
     """
 
-    cc_cm         = consensus_matrix.copy()
-    labels        = kn.perform_kmeans(consensus_matrix, k)
-    sorted_labels = np.argsort(labels)
+    number_of_clusters = run_parameters['number_of_clusters']
+    if not isinstance(number_of_clusters, (list, tuple)):
+        number_of_clusters = [number_of_clusters]
+
+    cluster_numbers = []
+    for cluster_range in number_of_clusters:
+        try:
+            if isinstance(cluster_range, str) and '..' in cluster_range:
+                first, last = cluster_range.split('..')
+                cluster_numbers.extend(range(int(first), int(last) + 1))
+            else:
+                cluster_numbers.append(int(cluster_range))
+        except ValueError:
+            raise ValueError('number_of_clusters contains bad value.')
+
+    if len(cluster_numbers) == 0 or min(cluster_numbers) < 1 or len(set(cluster_numbers)) < len(cluster_numbers):
+        raise ValueError('number_of_clusters contains bad value.')
+
+    return cluster_numbers
+
+
+def is_cluster_number_sweep(run_parameters):
+    """ decide whether "number_of_clusters" is a sweep (a list, or a 'first..last' range such as the
+        string read from "number_of_clusters: 2..10", see get_cluster_numbers).
+
+    Args:
+        run_parameters: dictionary with (optional) "number_of_clusters" key.
+
+    Returns:
+        True for a sweep, otherwise False.
+    """
+
+    if 'number_of_clusters' not in run_parameters:
+        return False
+
+    number_of_clusters = run_parameters['number_of_clusters']
+
+    return isinstance(number_of_clusters, (list, tuple)) or (isinstance(number_of_clusters, str) and '..' in number_of_clusters)
+
+
+def get_cluster_number_parameters(run_parameters):
+    """ one copy of the run parameters for each number of clusters of the run.
+
+    Args:
+        run_parameters: dictionary with "number_of_clusters" key.
+
+    Returns:
+        list of run parameters dictionaries with a single "number_of_clusters".
+    """
+
+    if not is_cluster_number_sweep(run_parameters):
+        return [run_parameters]
+
+    return [ dict(run_parameters, number_of_clusters=k) for k in get_cluster_numbers(run_parameters) ]
+
+
+def get_nmf_initialization(run_parameters):
+    """ bootstrap nmf initialization: 'random' (default) or 'warm', starting from the factors of the
+        full matrix (see prepare_nmf_warm_start).
+
+    Args:
+        run_parameters: dictionary with (optional) "nmf_initialization" key.
+
+    Returns:
+        nmf_initialization: 'random' or 'warm'.
+    """
+
+    if 'nmf_initialization' not in run_parameters:
+        return 'random'
+
+    nmf_initialization = run_parameters['nmf_initialization']
+    if nmf_initialization not in ['random', 'warm']:
+        raise ValueError('nmf_initialization contains bad value.')
+
+    return nmf_initialization
+
+
+def prepare_nmf_warm_start(x_matrix, run_parameters, lap_diag=None, lap_pos=None):
+    """ for the 'warm' "nmf_initialization", factor the full (quantile normalized, or smoothed) matrix
+        once (for every number of clusters of a sweep) and save W and H in the tmp directory, where the
+        bootstrap workers read them.
+
+    Args:
+        x_matrix: the full genes x samples matrix (X) the bootstraps are drawn from.
+        run_parameters: dictionary of run-time parameters with "tmp_directory".
+        lap_diag: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        lap_pos: laplacian matrix component, L = lap_diag - lap_pos, or None.
+    """
+
+    if get_nmf_initialization(run_parameters) != 'warm':
+        return
+
+    np.random.seed(0)
+    os.makedirs(run_parameters['tmp_directory'], mode=0o755, exist_ok=True)
+
+    for cluster_parameters in get_cluster_number_parameters(run_parameters):
+        w_matrix,   \
+        h_matrix    = get_nmf_initial_factors(x_matrix, cluster_parameters)
+        w_stack,    \
+        h_stack,    \
+        iterations, \
+        seconds     = perform_batched_nmf( stack_matrices([x_matrix]), w_matrix[np.newaxis], h_matrix[np.newaxis]
+                                         , cluster_parameters, lap_diag, lap_pos )
+
+        k = cluster_parameters['number_of_clusters']
+        np.save(os.path.join(run_parameters['tmp_directory'], 'nmf_warm_start_w_%d.npy'%(k)), w_stack[0])
+        np.save(os.path.join(run_parameters['tmp_directory'], 'nmf_warm_start_h_%d.npy'%(k)), h_stack[0])
+
+
+def get_warm_start_factors(sample_permutation, run_parameters, random_state=None):
+    """ initial W and H of a bootstrap for the 'warm' "nmf_initialization": the full matrix factors with
+        H restricted to the sampled columns, multiplied by 1 + uniform(-jitter, jitter) noise drawn from
+        the bootstrap seed when "nmf_warm_start_jitter" is given.
+
+    Args:
+        sample_permutation: indices of the sampled columns.
+        run_parameters: dictionary with keys "tmp_directory", "number_of_clusters", (optional)
+                        "nmf_initialization" and (optional) "nmf_warm_start_jitter".
+        random_state: (optional) np.random.Generator the noise is drawn from (global random state when None).
+
+    Returns:
+        initial_factors: (W, H), or None for the 'random' initialization.
+    """
+
+    if get_nmf_initialization(run_parameters) != 'warm':
+        return None
+
+    epsilon  = 1e-15
+    k        = run_parameters['number_of_clusters']
+    w_matrix = np.load(os.path.join(run_parameters['tmp_directory'], 'nmf_warm_start_w_%d.npy'%(k)))
+    h_matrix = np.load(os.path.join(run_parameters['tmp_directory'], 'nmf_warm_start_h_%d.npy'%(k)))[:, sample_permutation]
+
+    if random_state is None:
+        random_state = np.random
+
+    if 'nmf_warm_start_jitter' in run_parameters:
+        jitter   = float(run_parameters['nmf_warm_start_jitter'])
+        w_matrix = w_matrix * (1 + jitter * (2 * random_state.random(w_matrix.shape) - 1)).astype(w_matrix.dtype, copy=False)
+        w_matrix = np.maximum(w_matrix / np.maximum(w_matrix.sum(axis=0), epsilon), epsilon)
+        h_matrix = h_matrix * (1 + jitter * (2 * random_state.random(h_matrix.shape) - 1)).astype(h_matrix.dtype, copy=False)
+
+    return w_matrix, h_matrix
+
+
+def get_nmf_initial_factors(x_matrix, run_parameters, random_state=None):
+    """ random initial W, normalized to unit column sums, and H, drawn as kn.perform_nmf draws them
+        (in the precision of X when an "nmf_solver" is given, otherwise in double precision as kn).
+
+    Args:
+        x_matrix: the postive matrix (X) to be decomposed into W.H
+        run_parameters: parameters dictionary with keys "number_of_clusters" and (optional) "nmf_solver".
+        random_state: (optional) np.random.Generator to draw from (global random state when None).
+
+    Returns:
+        w_matrix: nonnegative left factor (W) matrix.
+        h_matrix: nonnegative right factor (H) matrix.
+    """
+    epsilon = 1e-15
+    k       = run_parameters['number_of_clusters']
+
+    if 'nmf_solver' in run_parameters:
+        dtype = np.result_type(x_matrix.dtype, np.float32)
+    else:
+        dtype = np.float64
+
+    if random_state is None:
+        random_state = np.random
+
+    w_matrix = random_state.random((x_matrix.shape[0], k)).astype(dtype, copy=False)
+    w_matrix = np.maximum(w_matrix / np.maximum(w_matrix.sum(axis=0), epsilon), epsilon)
+    h_matrix = random_state.random((k, x_matrix.shape[1])).astype(dtype, copy=False)
+
+    return w_matrix, h_matrix
+
+
+def perform_batched_nmf(x_stack, w_stack, h_stack, run_parameters, lap_diag=None, lap_pos=None):
+    """ factor a stack of equally shaped bootstrap matrices X[b] ~ W[b].H[b] together with stacked
+        (batched) matrix products, with the "nmf_solver" engine ('multiplicative' when none is given,
+        which repeats the kn updates exactly). Each bootstrap keeps its own kn convergence count and
+        leaves the stack when argmax(H[b]) has been unchanged for "nmf_max_invariance" iterations,
+        so every bootstrap gets the factors it would get on its own.
+
+    Args:
+        x_stack: bootstraps x genes x samples stack of the postive matrices (X) to be decomposed,
+                 or a stack of sparse matrices (see stack_matrices).
+        w_stack: bootstraps x genes x k stack of initial left factors (W), see get_nmf_initial_factors.
+        h_stack: bootstraps x k x samples stack of initial right factors (H).
+        run_parameters: parameters dictionary with keys "nmf_max_iterations", "nmf_max_invariance",
+            "nmf_conv_check_freq", "nmf_penalty_parameter" and (optional) "nmf_solver".
+        lap_diag: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        lap_pos: laplacian matrix component, L = lap_diag - lap_pos, or None.
+
+    Returns:
+        w_stack: stack of the nonnegative left factor (W) matrices.
+        h_stack: stack of the nonnegative right factor (H) matrices.
+        iterations: number of W, H updates of each bootstrap.
+        seconds: wall time of the batch.
+    """
+    import time
+
+    start_time = time.perf_counter()
+
+    if 'nmf_solver' in run_parameters:
+        nmf_solver = run_parameters['nmf_solver']
+    else:
+        nmf_solver = 'multiplicative'
+
+    if   nmf_solver == 'multiplicative':
+        update_factors = update_nmf_factors_multiplicative
+    elif nmf_solver == 'hals':
+        update_factors = update_nmf_factors_hals
+    elif nmf_solver == 'anls_bpp':
+        update_factors = update_nmf_factors_anls_bpp
+    else:
+        raise ValueError('nmf_solver contains bad value.')
+
+    nmf_conv_check_freq   = run_parameters['nmf_conv_check_freq']
+    nmf_max_invariance    = run_parameters['nmf_max_invariance']
+    nmf_penalty_parameter = float(run_parameters['nmf_penalty_parameter'])
+
+    w_result   = np.array(w_stack)
+    h_result   = np.array(h_stack)
+    iterations = np.full(h_stack.shape[0], run_parameters['nmf_max_iterations'])
+    active     = np.arange(h_stack.shape[0])
+    h_clust_eq = np.argmax(h_stack, 1)
+    h_eq_count = np.zeros(h_stack.shape[0], dtype=int)
+
+    for itr in range(0, run_parameters['nmf_max_iterations']):
+        if np.mod(itr, nmf_conv_check_freq) == 0:
+            h_clusters = np.argmax(h_stack, 1)
+            if itr > 0:
+                h_eq_count = np.where(np.all(h_clust_eq == h_clusters, axis=1), h_eq_count + nmf_conv_check_freq, 0)
+            h_clust_eq = h_clusters
+
+            converged  = h_eq_count >= nmf_max_invariance
+            if np.any(converged):
+                w_result  [active[converged]] = w_stack[converged]
+                h_result  [active[converged]] = h_stack[converged]
+                iterations[active[converged]] = itr
+                running    = ~converged
+                active     = active    [running]
+                x_stack    = x_stack   [running]
+                w_stack    = w_stack   [running]
+                h_stack    = h_stack   [running]
+                h_clust_eq = h_clust_eq[running]
+                h_eq_count = h_eq_count[running]
+                if active.size == 0:
+                    break
+
+        w_stack,   \
+        h_stack    = update_factors(x_stack, w_stack, h_stack, lap_diag, lap_pos, nmf_penalty_parameter)
+
+    w_result[active] = w_stack
+    h_result[active] = h_stack
+
+    return w_result, h_result, iterations, time.perf_counter() - start_time
+
+
+def stack_matrices(matrices):
+    """ stack the bootstrap matrices for perform_batched_nmf: equally shaped dense matrices as one
+        bootstraps x genes x samples array; sparse matrices as a one dimensional object array of
+        csr matrices, multiplied one at a time by get_xht_stack and get_wtx_stack.
+
+    Args:
+        matrices: list of dense or scipy sparse genes x samples matrices.
+
+    Returns:
+        x_stack: stack of the matrices.
+    """
+    import scipy.sparse as spar
+
+    if not any(spar.issparse(matrix) for matrix in matrices):
+        if len(matrices) == 1:
+            return np.asarray(matrices[0])[np.newaxis]
+        return np.array(matrices)
+
+    x_stack = np.empty(len(matrices), dtype=object)
+    for number, matrix in enumerate(matrices):
+        x_stack[number] = spar.csr_matrix(matrix)
+
+    return x_stack
+
+
+def get_xht_stack(x_stack, h_stack):
+    """ X.H' of every bootstrap of a (dense or sparse, see stack_matrices) stack.
+
+    Args:
+        x_stack: stack of the genes x samples matrices (X).
+        h_stack: stack of the k x samples right factors (H).
+
+    Returns:
+        bootstraps x genes x k stack of the products.
+    """
+
+    if x_stack.dtype != object:
+        return np.matmul(x_stack, h_stack.swapaxes(1, 2))
+
+    return np.array([ x_matrix.dot(h_matrix.T) for x_matrix, h_matrix in zip(x_stack, h_stack) ])
+
+
+def get_wtx_stack(w_stack, x_stack):
+    """ W'.X of every bootstrap of a (dense or sparse, see stack_matrices) stack.
+
+    Args:
+        w_stack: stack of the genes x k left factors (W).
+        x_stack: stack of the genes x samples matrices (X).
+
+    Returns:
+        bootstraps x k x samples stack of the products.
+    """
+
+    if x_stack.dtype != object:
+        return np.matmul(w_stack.swapaxes(1, 2), x_stack)
+
+    return np.array([ x_matrix.T.dot(w_matrix).T for x_matrix, w_matrix in zip(x_stack, w_stack) ])
+
+
+def apply_network_to_stack(network_component, w_stack):
+    """ multiply every matrix of a bootstraps x genes x k stack by a genes x genes (sparse) matrix.
+
+    Args:
+        network_component: genes x genes matrix (laplacian component).
+        w_stack: bootstraps x genes x k stack.
+
+    Returns:
+        bootstraps x genes x k stack of the products.
+    """
+    n_stack, n_genes, k = w_stack.shape
+    product = network_component.dot(w_stack.transpose(1, 0, 2).reshape(n_genes, n_stack * k))
+
+    return np.asarray(product).reshape(n_genes, n_stack, k).transpose(1, 0, 2)
+
+
+def update_nmf_factors_multiplicative(x_stack, w_stack, h_stack, lap_diag, lap_pos, nmf_penalty_parameter):
+    """ one kn.perform_nmf (or kn.perform_net_nmf) iteration for a stack of bootstraps: multiplicative
+        update of W, normalized to unit column sums, then H by update_h_coordinate_matrix.
+
+    Args:
+        x_stack: stack of the postive matrices (X) to be decomposed into W.H
+        w_stack: stack of nonnegative left factor (W) matrices.
+        h_stack: stack of nonnegative right factor (H) matrices.
+        lap_diag: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        lap_pos: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        nmf_penalty_parameter: network penalty (lambda).
+
+    Returns:
+        w_stack: updated left factor (W) matrices.
+        h_stack: updated right factor (H) matrices.
+    """
+    epsilon     = 1e-15
+    numerator   = get_xht_stack(x_stack, h_stack)
+    denominator = np.matmul(w_stack, np.matmul(h_stack, h_stack.swapaxes(1, 2)))
+
+    if lap_diag is not None:
+        numerator   = numerator   + nmf_penalty_parameter * apply_network_to_stack(lap_pos,  w_stack)
+        denominator = denominator + nmf_penalty_parameter * apply_network_to_stack(lap_diag, w_stack)
+
+    w_stack = w_stack * (np.maximum(numerator, epsilon) / np.maximum(denominator, epsilon))
+    w_stack = np.maximum(w_stack / np.maximum(w_stack.sum(axis=1, keepdims=True), epsilon), epsilon)
+    wtw     = np.matmul(w_stack.swapaxes(1, 2), w_stack)
+    wtx     = get_wtx_stack(w_stack, x_stack)
+    h_stack = np.array([ update_h_coordinate_matrix(wtw[b], wtx[b]) for b in range(wtx.shape[0]) ])
+
+    return w_stack, h_stack
+
+
+def update_h_coordinate_matrix(wtw, wtx):
+    """ nonnegative right factor H of X ~ W.H as kn.update_h_coordinate_matrix computes it, from the
+        products W'.W and W'.X (so X may be sparse): the least squares H, with the columns holding
+        negative values solved again on their positive rows until none is left.
+
+    Args:
+        wtw: W'.W, k x k matrix.
+        wtx: W'.X, k x samples matrix.
+
+    Returns:
+        h_matrix: nonnegative right factor (H) matrix.
+    """
+    number_of_clusters = wtw.shape[0]
+    colix    = np.arange(0, wtx.shape[1])
+    rowix    = np.arange(0, wtw.shape[1])
+    h_matrix = np.dot(np.linalg.pinv(wtw), wtx)
+    h_pos    = h_matrix > 0
+    h_matrix[~h_pos] = 0
+    col_list = colix[(h_pos == 0).sum(axis=0) > 0]
+
+    for cluster in range(0, number_of_clusters):
+        if col_list.size == 0:
+            break
+        w_ette     = wtx[:, col_list]
+        h_ette     = np.zeros(w_ette.shape)
+        h_pos_ette = h_pos[:, col_list]
+        mcoding    = np.dot(2 ** (np.arange(0, w_ette.shape[0])), np.int_(h_pos_ette))
+        for u_n in np.unique(mcoding):
+            c_pat     = np.flatnonzero(mcoding == u_n)
+            r_pat     = rowix[h_pos_ette[:, c_pat[0]]]
+            atmp      = wtw[r_pat[:, None], r_pat]
+            btmp      = w_ette[r_pat[:, None], c_pat]
+            h_ette[r_pat[:, None], c_pat] = np.dot(np.linalg.pinv(np.dot(atmp.T, atmp)), np.dot(atmp.T, btmp))
+            h_matrix[:, col_list] = h_ette
+        h_pos    = h_matrix > 0
+        h_matrix[~h_pos] = 0
+        col_list = colix[(h_pos == 0).sum(axis=0) > 0]
+
+    return h_matrix
+
+
+def update_nmf_factors_hals(x_stack, w_stack, h_stack, lap_diag, lap_pos, nmf_penalty_parameter):
+    """ one hierarchical alternating least squares iteration for a stack of bootstraps: exact nonnegative
+        update of each column of W in turn (graph regularized when the laplacian is given), W columns
+        normalized to unit sums with H rescaled to keep W.H, then each row of H in turn.
+
+    Args:
+        x_stack: stack of the postive matrices (X) to be decomposed into W.H
+        w_stack: stack of nonnegative left factor (W) matrices.
+        h_stack: stack of nonnegative right factor (H) matrices.
+        lap_diag: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        lap_pos: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        nmf_penalty_parameter: network penalty (lambda).
+
+    Returns:
+        w_stack: updated left factor (W) matrices.
+        h_stack: updated right factor (H) matrices.
+    """
+    epsilon = 1e-15
+    w_stack = update_w_matrix_hals(x_stack, w_stack, h_stack, lap_diag, lap_pos, nmf_penalty_parameter)
+
+    w_scale = np.maximum(w_stack.sum(axis=1, keepdims=True), epsilon)
+    w_stack = w_stack / w_scale
+    h_stack = h_stack * w_scale.swapaxes(1, 2)
+
+    wtw     = np.matmul(w_stack.swapaxes(1, 2), w_stack)
+    wtx     = get_wtx_stack(w_stack, x_stack)
+    for row in range(0, h_stack.shape[1]):
+        h_step           = (wtx[:, row] - np.matmul(wtw[:, row:row + 1], h_stack)[:, 0]) / np.maximum(wtw[:, row, row:row + 1], epsilon)
+        h_stack[:, row]  = np.maximum(h_stack[:, row] + h_step, 0)
+
+    return w_stack, h_stack
+
+
+def update_nmf_factors_anls_bpp(x_stack, w_stack, h_stack, lap_diag, lap_pos, nmf_penalty_parameter):
+    """ one alternating nonnegative least squares iteration for a stack of bootstraps: W solved exactly
+        by block principal pivoting (or by the graph regularized hals update when the laplacian is given),
+        normalized to unit column sums, then H solved exactly by block principal pivoting.
+
+    Args:
+        x_stack: stack of the postive matrices (X) to be decomposed into W.H
+        w_stack: stack of nonnegative left factor (W) matrices.
+        h_stack: stack of nonnegative right factor (H) matrices.
+        lap_diag: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        lap_pos: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        nmf_penalty_parameter: network penalty (lambda).
+
+    Returns:
+        w_stack: updated left factor (W) matrices.
+        h_stack: updated right factor (H) matrices.
+    """
+    epsilon = 1e-15
+
+    if lap_diag is None:
+        hht     = np.matmul(h_stack, h_stack.swapaxes(1, 2))
+        hxt     = get_xht_stack(x_stack, h_stack).swapaxes(1, 2)
+        w_stack = np.array([ solve_nnls_with_bpp(hht[b], hxt[b]).T for b in range(x_stack.shape[0]) ])
+    else:
+        w_stack = update_w_matrix_hals(x_stack, w_stack, h_stack, lap_diag, lap_pos, nmf_penalty_parameter)
+
+    w_stack = np.maximum(w_stack / np.maximum(w_stack.sum(axis=1, keepdims=True), epsilon), epsilon)
+    wtw     = np.matmul(w_stack.swapaxes(1, 2), w_stack)
+    wtx     = get_wtx_stack(w_stack, x_stack)
+    h_stack = np.array([ solve_nnls_with_bpp(wtw[b], wtx[b]) for b in range(x_stack.shape[0]) ])
+
+    return w_stack, h_stack
+
+
+def update_w_matrix_hals(x_stack, w_stack, h_stack, lap_diag, lap_pos, nmf_penalty_parameter):
+    """ update each column w of every W in turn to the nonnegative minimizer of ||X-WH|| with the other
+        columns fixed; with the laplacian, ||X-WH|| + lambda.w'.L.w is minimized gene by gene with its
+        network neighbours fixed (Gauss-Seidel), a block of genes without edges between them at a time
+        (see get_laplacian_blocks), so every step is exact and the objective does not increase.
+
+    Args:
+        x_stack: stack of the postive matrices (X) to be decomposed into W.H
+        w_stack: stack of nonnegative left factor (W) matrices.
+        h_stack: stack of nonnegative right factor (H) matrices.
+        lap_diag: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        lap_pos: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        nmf_penalty_parameter: network penalty (lambda).
+
+    Returns:
+        w_stack: updated left factor (W) matrices.
+    """
+    epsilon = 1e-15
+    w_stack = np.array(w_stack)
+    xht     = get_xht_stack(x_stack, h_stack)
+    hht     = np.matmul(h_stack, h_stack.swapaxes(1, 2))
+
+    if lap_diag is not None:
+        lap_degree = lap_diag.diagonal()
+        lap_blocks = get_laplacian_blocks(lap_pos)
+
+    for column in range(0, w_stack.shape[2]):
+        hht_column  = hht[:, column, column][:, np.newaxis]
+        numerator   = xht[:, :, column] - np.matmul(w_stack, hht[:, :, column:column + 1])[:, :, 0] + hht_column * w_stack[:, :, column]
+
+        if lap_diag is None:
+            w_stack[:, :, column] = np.maximum(numerator / np.maximum(hht_column, epsilon), epsilon)
+            continue
+
+        for genes, lap_rows in lap_blocks:
+            neighbours  = lap_rows.dot(w_stack[:, :, column].T).T
+            denominator = hht_column + nmf_penalty_parameter * lap_degree[genes]
+            w_stack[:, genes, column] = np.maximum((numerator[:, genes] + nmf_penalty_parameter * neighbours)
+                                                   / np.maximum(denominator, epsilon), epsilon)
+
+    return w_stack
+
+
+LAPLACIAN_BLOCKS      = {}
+LAPLACIAN_BLOCKS_LOCK = threading.Lock()
+
+
+def get_laplacian_blocks(lap_pos):
+    """ partition the genes into blocks without network edges between the genes of a block (greedy
+        coloring, highest degree genes first), so the genes of a block can be updated together.
+        The blocks of the last network are kept in LAPLACIAN_BLOCKS.
+
+    Args:
+        lap_pos: laplacian matrix component, L = lap_diag - lap_pos (the network adjacency).
+
+    Returns:
+        lap_blocks: list of (genes, lap_pos rows of the genes) pairs covering every gene once.
+    """
+
+    with LAPLACIAN_BLOCKS_LOCK:
+        cached_blocks = LAPLACIAN_BLOCKS.get(id(lap_pos))
+        if cached_blocks is not None and cached_blocks[0] is lap_pos:
+            return cached_blocks[1]
+
+        lap_rows = spar.csr_matrix(lap_pos)
+        colors   = np.full(lap_rows.shape[0], -1)
+        for gene in np.argsort(-np.diff(lap_rows.indptr), kind='stable'):
+            neighbour_colors = set(colors[lap_rows.indices[lap_rows.indptr[gene]:lap_rows.indptr[gene + 1]]].tolist())
+            color            = 0
+            while color in neighbour_colors:
+                color += 1
+            colors[gene]     = color
+
+        lap_blocks = [ (genes, lap_rows[genes]) for genes in [ np.flatnonzero(colors == color) for color in range(colors.max() + 1) ] ]
+
+        LAPLACIAN_BLOCKS.clear()
+        LAPLACIAN_BLOCKS[id(lap_pos)] = (lap_pos, lap_blocks)
+
+    return lap_blocks
+
+
+def solve_nnls_with_bpp(ctc, ctb, max_iterations=100):
+    """ nonnegative least squares min ||C.X - B||, X >= 0, for all columns of B at once by block principal
+        pivoting (Kim and Park), with full exchanges of the infeasible variables backed up by single
+        exchanges; columns sharing a passive set share one linear solve.
+
+    Args:
+        ctc: C'.C, k x k matrix.
+        ctb: C'.B, k x n matrix.
+        max_iterations: limit on the pivoting rounds.
+
+    Returns:
+        x_matrix: nonnegative k x n solution (X).
+    """
+    k, n        = ctb.shape
+    passive     = np.zeros((k, n), dtype=bool)
+    x_matrix    = np.zeros((k, n), dtype=ctb.dtype)
+    infeasible  = ctb > 0
+    not_good    = infeasible.sum(axis=0)
+    not_optimal = not_good > 0
+    alpha       = np.full(n, 3)
+    beta        = np.full(n, k + 1)
+
+    for itr in range(0, max_iterations):
+        if not np.any(not_optimal):
+            break
+
+        full_exchange   = not_optimal & (not_good < beta)
+        backup_exchange = not_optimal & ~full_exchange & (alpha >= 1)
+        single_exchange = not_optimal & ~full_exchange & (alpha < 1)
+
+        beta[full_exchange]    = not_good[full_exchange]
+        alpha[full_exchange]   = 3
+        alpha[backup_exchange] = alpha[backup_exchange] - 1
+
+        exchange             = full_exchange | backup_exchange
+        passive[:, exchange] = passive[:, exchange] ^ infeasible[:, exchange]
+
+        single_columns = np.flatnonzero(single_exchange)
+        single_rows    = k - 1 - np.argmax(infeasible[::-1, single_columns], axis=0)
+        passive[single_rows, single_columns] = ~passive[single_rows, single_columns]
+
+        columns                = np.flatnonzero(not_optimal)
+        x_columns, y_columns   = solve_nnls_passive_sets(ctc, ctb[:, columns], passive[:, columns])
+        x_matrix[:, columns]   = x_columns
+        infeasible[:, columns] = ((x_columns < 0) & passive[:, columns]) | ((y_columns < 0) & ~passive[:, columns])
+        not_good[columns]      = infeasible[:, columns].sum(axis=0)
+        not_optimal[columns]   = not_good[columns] > 0
+
+    return np.maximum(x_matrix, 0)
+
+
+def solve_nnls_passive_sets(ctc, ctb, passive):
+    """ unconstrained least squares of the passive variables of each column with the others at zero,
+        one solve per distinct passive set.
+
+    Args:
+        ctc: C'.C, k x k matrix.
+        ctb: C'.B, k x n matrix.
+        passive: k x n boolean matrix of the passive (free) variables.
+
+    Returns:
+        x_matrix: k x n solution, zero outside the passive sets.
+        y_matrix: k x n gradient C'.C.X - C'.B, zero on the passive sets.
+    """
+    x_matrix = np.zeros(ctb.shape, dtype=ctb.dtype)
+
+    passive_sets, \
+    set_index     = np.unique(passive, axis=1, return_inverse=True)
+    set_index     = set_index.ravel()
+
+    for set_number in range(0, passive_sets.shape[1]):
+        rows    = np.flatnonzero(passive_sets[:, set_number])
+        columns = np.flatnonzero(set_index == set_number)
+        if rows.size == 0:
+            continue
+        try:
+            x_matrix[np.ix_(rows, columns)] = np.linalg.solve(ctc[np.ix_(rows, rows)], ctb[np.ix_(rows, columns)])
+        except np.linalg.LinAlgError:
+            x_matrix[np.ix_(rows, columns)] = np.linalg.lstsq(ctc[np.ix_(rows, rows)], ctb[np.ix_(rows, columns)], rcond=None)[0]
+
+    y_matrix          = np.dot(ctc, x_matrix) - ctb
+    y_matrix[passive] = 0
+
+    return x_matrix, y_matrix
+
+
+def is_nmf_convergence_recorded(run_parameters):
+    """ decide whether the iterations and wall time of the factorizations are recorded: with an
+        "nmf_solver" or the warm "nmf_initialization" (the kn engine does not count its iterations).
+
+    Args:
+        run_parameters: with (optional) keys "nmf_solver" and "nmf_initialization".
+
+    Returns:
+        True when recorded, otherwise False.
+    """
+
+    return 'nmf_solver' in run_parameters or get_nmf_initialization(run_parameters) == 'warm'
+
+
+def read_nmf_convergence_records(tmp_directory, record_name='nmf_convergence.tsv'):
+    """ read the bootstrap factorization records appended by record_nmf_convergence.
+
+    Args:
+        tmp_directory: directory of the record.
+        record_name: record file name.
+
+    Returns:
+        convergence_records: list of [bootstrap, iterations, seconds].
+    """
+
+    record_file = os.path.join(tmp_directory, record_name)
+    if not os.path.isfile(record_file):
+        return []
+
+    return np.loadtxt(record_file, ndmin=2).tolist()
+
+
+def record_nmf_convergence(sample, iterations, seconds, run_parameters, record_name='nmf_convergence.tsv'):
+    """ append the iterations and wall time of a bootstrap factorization to the tmp directory record
+        when an "nmf_solver" or the warm "nmf_initialization" is given (one short line per append, so
+        workers can share the file).
+
+    Args:
+        sample: bootstrap sample number.
+        iterations: number of W, H updates.
+        seconds: wall time of the factorization.
+        run_parameters: with keys "tmp_directory", (optional) "nmf_solver" and (optional) "nmf_initialization".
+        record_name: record file name.
+    """
+
+    if not is_nmf_convergence_recorded(run_parameters):
+        return
+
+    os.makedirs(run_parameters['tmp_directory'], mode=0o755, exist_ok=True)
+
+    fd = os.open(os.path.join(run_parameters['tmp_directory'], record_name), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, ('%d\t%d\t%.6f\n' % (sample, iterations, seconds)).encode())
+    finally:
+        os.close(fd)
+
+
+def run_cc_nmf_clusters_batch_worker(spreadsheet_mat, run_parameters, samples):
+    """ worker to factor a batch of bootstrap samples together (perform_batched_nmf); every sample is
+        drawn and initialized from its own seed as in run_cc_nmf_clusters_worker.
+
+    Args:
+        spreadsheet_mat: genes x samples matrix.
+        run_parameters: dictionary of run-time parameters.
+        samples: bootstrap sample numbers of the batch.
+
+    Returns:
+        clusterings: list of (cluster_id, sample_permutation), or of None when saved to the tmp directory.
+    """
+
+    rows_sampling_fraction = run_parameters["rows_sampling_fraction"]
+    cols_sampling_fraction = run_parameters["cols_sampling_fraction"]
+
+    x_stack, initial_factors, sample_permutations = [], [], []
+    for sample in samples:
+        random_state       = get_bootstrap_random_state(sample, run_parameters)
+
+        sample_mat,        \
+        sample_permutation = sample_a_spreadsheet_matrix( spreadsheet_mat
+                                                        , rows_sampling_fraction
+                                                        , cols_sampling_fraction
+                                                        , random_state )
+
+        x_stack.append(sample_mat)
+        initial_factors.append(get_bootstrap_initial_factors(sample_mat, sample_permutation, run_parameters, random_state))
+        sample_permutations.append(sample_permutation)
+
+    h_stack,               \
+    nmf_iterations,        \
+    nmf_seconds            = factor_bootstrap_batch_for_cluster_numbers(x_stack, initial_factors, run_parameters)
+
+    return save_or_return_clusterings(h_stack, sample_permutations, nmf_iterations, nmf_seconds, run_parameters, samples)
+
+
+def run_cc_net_nmf_clusters_batch_worker(network_mat, spreadsheet_mat, smooth_spreadsheet_mat, lap_dag, lap_val, run_parameters, samples):
+    """ worker to factor a batch of bootstrap samples together (perform_batched_nmf); every sample is
+        drawn, smoothed and initialized from its own seed as in run_cc_net_nmf_clusters_worker.
+
+    Args:
+        network_mat: genes x genes symmetric matrix.
+        spreadsheet_mat: genes x samples matrix.
+        smooth_spreadsheet_mat: smoothed genes x samples matrix to slice, or None to smooth the sample.
+        lap_dag: laplacian matrix component, L = lap_dag - lap_val.
+        lap_val: laplacian matrix component, L = lap_dag - lap_val.
+        run_parameters: dictionay of run-time parameters.
+        samples: bootstrap sample numbers of the batch.
+
+    Returns:
+        clusterings: list of (cluster_id, sample_permutation), or of None when saved to the tmp directory.
+    """
+
+    rows_sampling_fraction = run_parameters["rows_sampling_fraction"]
+    cols_sampling_fraction = run_parameters["cols_sampling_fraction"]
+
+    x_stack, initial_factors, sample_permutations = [], [], []
+    for sample in samples:
+        random_state       = get_bootstrap_random_state(sample, run_parameters)
+
+        sample_mat,        \
+        sample_permutation = sample_a_spreadsheet_matrix( spreadsheet_mat
+                                                        , rows_sampling_fraction
+                                                        , cols_sampling_fraction
+                                                        , random_state )
+
+        if smooth_spreadsheet_mat is None:
+            sample_mat,    \
+            iterations     = smooth_matrix_with_rwr(sample_mat, network_mat, run_parameters)
+        else:
+            sample_mat     = smooth_spreadsheet_mat[:, sample_permutation]
+
+        sample_mat         = normalize_spreadsheet_matrix(sample_mat, run_parameters)
+
+        x_stack.append(sample_mat)
+        initial_factors.append(get_bootstrap_initial_factors(sample_mat, sample_permutation, run_parameters, random_state))
+        sample_permutations.append(sample_permutation)
+
+    h_stack,               \
+    nmf_iterations,        \
+    nmf_seconds            = factor_bootstrap_batch_for_cluster_numbers(x_stack, initial_factors, run_parameters, lap_dag, lap_val)
+
+    return save_or_return_clusterings(h_stack, sample_permutations, nmf_iterations, nmf_seconds, run_parameters, samples)
+
+
+def get_bootstrap_initial_factors(x_matrix, sample_permutation, run_parameters, random_state=None):
+    """ initial W and H of a bootstrap for each number of clusters of the run (warm started when asked,
+        see get_warm_start_factors, otherwise random, see get_nmf_initial_factors), drawn in sweep order.
+
+    Args:
+        x_matrix: the bootstrap matrix (X).
+        sample_permutation: indices of the sampled columns.
+        run_parameters: dictionary of run-time parameters.
+        random_state: (optional) np.random.Generator of the bootstrap (see get_bootstrap_random_state).
+
+    Returns:
+        initial_factors: list of (W, H), one per number of clusters.
+    """
+
+    initial_factors = []
+    for cluster_parameters in get_cluster_number_parameters(run_parameters):
+        factors = get_warm_start_factors(sample_permutation, cluster_parameters, random_state)
+        if factors is None:
+            factors = get_nmf_initial_factors(x_matrix, cluster_parameters, random_state)
+        initial_factors.append(factors)
+
+    return initial_factors
+
+
+def factor_bootstrap_batch_for_cluster_numbers(x_matrices, initial_factors, run_parameters, lap_diag=None, lap_pos=None):
+    """ factor the bootstrap matrices of a batch (factor_bootstrap_batch) for the number of clusters,
+        or for every number of clusters of a sweep.
+
+    Args:
+        x_matrices: list of the bootstrap matrices (X).
+        initial_factors: list, for each bootstrap, of the initial (W, H) of each number of clusters
+                         (see get_bootstrap_initial_factors).
+        run_parameters: parameters dictionary (see perform_batched_nmf).
+        lap_diag: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        lap_pos: laplacian matrix component, L = lap_diag - lap_pos, or None.
+
+    Returns:
+        h_matrices: list of the right factor (H) matrix of each bootstrap, or of its list of them for a sweep.
+        iterations: number of W, H updates of each bootstrap, summed over a sweep.
+        seconds: wall time of the batch.
+    """
+
+    h_matrices = [ [] for x_matrix in x_matrices ]
+    iterations = np.zeros(len(x_matrices), dtype=int)
+    seconds    = 0
+
+    for number, cluster_parameters in enumerate(get_cluster_number_parameters(run_parameters)):
+        k_h_matrices, \
+        k_iterations, \
+        k_seconds     = factor_bootstrap_batch( x_matrices
+                                              , [ factors[number][0] for factors in initial_factors ]
+                                              , [ factors[number][1] for factors in initial_factors ]
+                                              , cluster_parameters, lap_diag, lap_pos )
+        for bootstrap, h_matrix in enumerate(k_h_matrices):
+            h_matrices[bootstrap].append(h_matrix)
+        iterations    = iterations + np.asarray(k_iterations)
+        seconds       = seconds + k_seconds
+
+    if not is_cluster_number_sweep(run_parameters):
+        h_matrices = [ h_matrix[0] for h_matrix in h_matrices ]
+
+    return h_matrices, iterations, seconds
+
+
+def factor_bootstrap_batch(x_matrices, w_matrices, h_matrices, run_parameters, lap_diag=None, lap_pos=None):
+    """ factor the bootstrap matrices of a batch with perform_batched_nmf: as one stack when they are
+        dense and equally shaped, otherwise (sparse matrices, or all zero columns dropped by the
+        sampling) one at a time.
+
+    Args:
+        x_matrices: list of the bootstrap matrices (X).
+        w_matrices: list of the initial left factors (W).
+        h_matrices: list of the initial right factors (H).
+        run_parameters: parameters dictionary (see perform_batched_nmf).
+        lap_diag: laplacian matrix component, L = lap_diag - lap_pos, or None.
+        lap_pos: laplacian matrix component, L = lap_diag - lap_pos, or None.
+
+    Returns:
+        h_matrices: stack or list of the nonnegative right factor (H) matrices.
+        iterations: number of W, H updates of each bootstrap.
+        seconds: wall time of the batch.
+    """
+    import scipy.sparse as spar
+
+    if len(set(h_matrix.shape for h_matrix in h_matrices)) == 1 and not any(spar.issparse(x_matrix) for x_matrix in x_matrices):
+        w_stack, h_stack, iterations, seconds = perform_batched_nmf( np.array(x_matrices), np.array(w_matrices), np.array(h_matrices)
+                                                                   , run_parameters, lap_diag, lap_pos )
+        return h_stack, iterations, seconds
+
+    h_stack, iterations, seconds = [], [], 0
+    for x_matrix, w_matrix, h_matrix in zip(x_matrices, w_matrices, h_matrices):
+        w_result, h_result, x_iterations, x_seconds = perform_batched_nmf( stack_matrices([x_matrix]), w_matrix[np.newaxis], h_matrix[np.newaxis]
+                                                                         , run_parameters, lap_diag, lap_pos )
+        h_stack.append(h_result[0])
+        iterations.append(x_iterations[0])
+        seconds = seconds + x_seconds
+
+    return h_stack, iterations, seconds
+
+
+def save_or_return_clusterings(h_stack, sample_permutations, nmf_iterations, nmf_seconds, run_parameters, samples):
+    """ record the nmf convergence of each bootstrap of a batch (sharing the batch wall time equally)
+        and save or return its clustering (see save_or_return_a_clustering).
+
+    Args:
+        h_stack: stack (or list) of k x permutation size matrices.
+        sample_permutations: list of the sample permutations.
+        nmf_iterations: number of W, H updates of each bootstrap.
+        nmf_seconds: wall time of the batch.
+        run_parameters: dictionary of run-time parameters.
+        samples: bootstrap sample numbers of the batch.
+
+    Returns:
+        clusterings: list of (cluster_id, sample_permutation), or of None when saved to the tmp directory.
+    """
+
+    clusterings = []
+    for h_matrix, sample_permutation, iterations, sample in zip(h_stack, sample_permutations, nmf_iterations, samples):
+        record_nmf_convergence(sample, iterations, nmf_seconds / len(samples), run_parameters)
+        clusterings.append(save_or_return_a_clustering(h_matrix, sample_permutation, run_parameters, sample))
+
+    return clusterings
+
+
+def get_smooth_bootstrap_matrix(smooth_spreadsheet_mat, run_parameters):
+    """ decide whether the bootstrap workers can slice the columns of the smoothed full spreadsheet
+        instead of smoothing each sample. Random walk with restart smooths every column independently,
+        so a column sample of the smoothed spreadsheet is the smoothed column sample; this stops being
+        exact when "rows_sampling_fraction" < 1 zeroes rows before smoothing.
+
+    Args:
+        smooth_spreadsheet_mat: smoothed genes x samples matrix.
+        run_parameters: dictionary with "rows_sampling_fraction" key.
+
+    Returns:
+        smooth_spreadsheet_mat: the smoothed matrix when no rows are zeroed, otherwise None.
+    """
+
+    number_of_rows_zeroed = int(np.round(smooth_spreadsheet_mat.shape[0] * (1 - run_parameters['rows_sampling_fraction'])))
+
+    if number_of_rows_zeroed == 0:
+        return smooth_spreadsheet_mat
+
+    return None
+
+
+def smooth_matrix_with_rwr(restart, network_mat, run_parameters):
+    """ smooth the restart columns by random walk with restart on the network with the "rwr_solver" engine:
+        'power' (default) iterates R_n+1 = a*N*R_n + (1-a)*R_0 (kn.smooth_matrix_with_rwr); 'direct' and
+        'cg' solve the steady state (I - a*N) R = (1-a)*R_0 for all columns at once, with a sparse LU
+        factorization or block conjugate gradients set up once per network.
+
+    Args:
+        restart: genes x samples restart matrix.
+        network_mat: normalized (symmetric) genes x genes network matrix.
+        run_parameters: parameters dictionary with "rwr_restart_probability", "rwr_convergence_tolerence",
+                        "rwr_max_iterations" and (optional) "rwr_solver" keys.
+
+    Returns:
+        smooth: smoothed restart matrix.
+        iterations: number of iterations (0 for the direct solver).
+    """
+
+    if 'rwr_solver' not in run_parameters or run_parameters['rwr_solver'] == 'power':
+        return kn.smooth_matrix_with_rwr(restart, network_mat, run_parameters)
+
+    rwr_solve = get_rwr_solver(network_mat, run_parameters)
+
+    restart   = np.asarray(restart, dtype=np.result_type(restart, np.float32))
+
+    return rwr_solve((1. - run_parameters['rwr_restart_probability']) * restart)
+
+
+RWR_SOLVERS      = {}
+RWR_SOLVERS_LOCK = threading.Lock()
+
+
+def get_rwr_solver(network_mat, run_parameters):
+    """ set up the steady state solver of (I - a*N) R = B for the network: factor the matrix for the
+        'direct' solver or form it for the 'cg' solver. The solver of the last network is kept in
+        RWR_SOLVERS, so each (worker) process sets it up once per network; the bootstrap threads of
+        a process wait for the one setting it up rather than factoring the matrix again.
+
+    Args:
+        network_mat: normalized (symmetric) genes x genes network matrix.
+        run_parameters: parameters dictionary with "rwr_solver", "rwr_restart_probability",
+                        "rwr_convergence_tolerence" and "rwr_max_iterations" keys.
+
+    Returns:
+        rwr_solve: function of the right hand side B returning (R, iterations).
+    """
+
+    rwr_solver     = run_parameters['rwr_solver'               ]
+    alpha          = run_parameters['rwr_restart_probability'  ]
+    tolerance      = run_parameters['rwr_convergence_tolerence']
+    max_iterations = run_parameters['rwr_max_iterations'       ]
+
+    solver_key     = (id(network_mat), rwr_solver, alpha, tolerance, max_iterations)
+
+    with RWR_SOLVERS_LOCK:
+        cached_solver = RWR_SOLVERS.get(solver_key)
+        if cached_solver is not None and cached_solver[0] is network_mat:
+            return cached_solver[1]
+
+        system_mat = spar.identity(network_mat.shape[0], dtype=network_mat.dtype, format='csc') - alpha * spar.csc_matrix(network_mat)
+
+        if   rwr_solver == 'direct':
+            system_lu  = splu(system_mat, permc_spec='MMD_AT_PLUS_A')
+            rwr_solve  = lambda rhs: (system_lu.solve(rhs), 0)
+
+        elif rwr_solver == 'cg':
+            system_mat = system_mat.tocsr()
+            rwr_solve  = lambda rhs: solve_rwr_with_block_cg(system_mat, rhs, tolerance, max_iterations)
+
+        else:
+            raise ValueError('rwr_solver contains bad value.')
+
+        RWR_SOLVERS.clear()
+        RWR_SOLVERS[solver_key] = (network_mat, rwr_solve)
+
+    return rwr_solve
+
+
+def solve_rwr_with_block_cg(system_mat, rhs, tolerance, max_iterations):
+    """ solve system_mat X = rhs for all columns of rhs by conjugate gradients, with one sparse
+        matrix product per iteration for the whole block (system_mat must be symmetric positive definite).
+
+    Args:
+        system_mat: sparse (I - a*N) matrix.
+        rhs: genes x samples right hand side.
+        tolerance: Frobenius norm of the residual to stop at.
+        max_iterations: maximum number of iterations.
+
+    Returns:
+        smooth: solution X.
+        iterations: number of iterations.
+    """
+
+    smooth     = rhs.copy()
+    residual   = rhs - system_mat.dot(smooth)
+    direction  = residual.copy()
+    rr         = np.sum(residual * residual, axis=0)
+
+    iterations = 0
+    while iterations < max_iterations and np.sqrt(rr.sum()) >= tolerance:
+        product    = system_mat.dot(direction)
+        p_product  = np.sum(direction * product, axis=0)
+        step       = np.divide(rr, p_product, out=np.zeros_like(rr), where=p_product > 0)
+        smooth    += step * direction
+        residual  -= step * product
+        rr_next    = np.sum(residual * residual, axis=0)
+        direction  = residual + np.divide(rr_next, rr, out=np.zeros_like(rr), where=rr > 0) * direction
+        rr         = rr_next
+        iterations += 1
+
+    return smooth, iterations
+
+
+def save_or_return_a_clustering(h_matrix, sample_permutation, run_parameters, sequence_number):
+    """ hand a bootstrap clustering back to the caller, recording it in the checkpoint directory
+        when one is given, or save it to the tmp directory when accumulated on disk.
+
+    Args:
+        h_matrix: k x permutation size matrix, or the list of them of a number of clusters sweep.
+        sample_permutation: indices of h_matrix columns permutation.
+        run_parameters: parameters including the "tmp_directory" and (optional) "checkpoint_directory".
+        sequence_number: bootstrap sample number.
+
+    Returns:
+        clustering: (cluster_id, sample_permutation), or None when saved to the tmp directory; the
+                    cluster_id of a sweep has one row per number of clusters.
+    """
+
+    if isinstance(h_matrix, list):
+        cluster_id = np.array([ np.argmax(k_h_matrix, 0) for k_h_matrix in h_matrix ])
+    else:
+        cluster_id = np.argmax(h_matrix, 0)
+
+    if 'checkpoint_directory' in run_parameters:
+        save_a_clustering(cluster_id, sample_permutation, run_parameters['checkpoint_directory'], sequence_number)
+
+    if is_consensus_accumulated_on_disk(run_parameters):
+        save_a_clustering(cluster_id, sample_permutation, run_parameters['tmp_directory'], sequence_number)
+        return None
+
+    return cluster_id, sample_permutation
+
+
+def save_a_clustering(cluster_id, sample_permutation, tmp_dir, sequence_number, store_name='bootstrap_clusterings.bin'):
+    """ append one bootstrap clustering to the single bootstrap store file in tmp_dir.
+        A record is a header (magic, sequence_number, permutation size, cluster id bytes) followed by
+        the uint32 sample permutation and the small integer cluster ids, padded to 8 bytes; the cluster
+        id bytes field holds (rows - 1) * 256 + bytes per id for the several rows of a sweep. The record
+        is written with one append under an exclusive lock, so many workers can share the store.
+
+    Args:
+        cluster_id: cluster number of each sampled column (one row per number of clusters of a sweep).
+        sample_permutation: indices of the sampled columns.
+        tmp_dir: directory to write to.
+        sequence_number: bootstrap sample number.
+        store_name: bootstrap store file name.
+    """
+    import fcntl
+
+    if np.max(cluster_id) < 2**8:
+        cluster_id = np.asarray(cluster_id, dtype='<u1')
+    else:
+        cluster_id = np.asarray(cluster_id, dtype='<u2')
+
+    cluster_id_rows = 1 if cluster_id.ndim == 1 else cluster_id.shape[0]
+    header = np.array([0x4b4e4243, sequence_number, len(sample_permutation), (cluster_id_rows - 1) * 256 + cluster_id.itemsize], dtype='<i8')
+    record = header.tobytes() + np.asarray(sample_permutation, dtype='<u4').tobytes() + cluster_id.tobytes()
+    record = record + bytes(-len(record) % 8)
+
+    os.makedirs(tmp_dir, mode=0o755, exist_ok=True)
+
+    fd = os.open(os.path.join(tmp_dir, store_name), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+        written = 0
+        while written < len(record):
+            written += os.write(fd, record[written:])
+    finally:
+        os.close(fd)
+
+
+def is_consensus_accumulated_on_disk(run_parameters):
+    """ decide whether bootstrap clusterings go through "tmp_*" files or are returned to the caller.
+
+    Args:
+        run_parameters: parameter set dictionary with "processing_method" and
+                        (optional) "consensus_accumulation" ('memory' or 'disk') keys.
+
+    Returns:
+        True for the distribute method or when 'disk' is requested, otherwise False.
+    """
+
+    if run_parameters['processing_method'] == 'distribute':
+        return True
+
+    if 'consensus_accumulation' in run_parameters:
+        return run_parameters['consensus_accumulation'] == 'disk'
+
+    return False
+
+
+def initialize_consensus_matrices(number_of_samples, run_parameters):
+    """ allocate zero linkage and indicator matrices; with the 'packed' "consensus_storage" only their
+        (symmetric) upper triangles are kept, packed in one dimensional count arrays (see
+        consensus_storage_toolbox), uint16 up to 65535 bootstraps.
+
+    Args:
+        number_of_samples: number of spreadsheet columns.
+        run_parameters: dictionary with (optional) "consensus_dtype" key, e.g. 'float64', 'float32'
+                        or an integer count type such as 'int32' (default: the run precision, or the
+                        smallest unsigned count type for the packed storage), and (optional)
+                        "consensus_storage" key.
+
+    Returns:
+        linkage_matrix: number_of_samples x number_of_samples zero matrix (a stack of one per number of
+                        clusters for a sweep, see get_cluster_numbers), or its packed upper triangle.
+        indicator_matrix: number_of_samples x number_of_samples zero matrix, or its packed upper triangle.
+    """
+
+    if 'consensus_dtype' in run_parameters:
+        consensus_dtype = np.dtype(run_parameters['consensus_dtype'])
+    elif is_consensus_packed(run_parameters):
+        if 'number_of_bootstraps' in run_parameters and run_parameters['number_of_bootstraps'] < 2**16:
+            consensus_dtype = np.dtype(np.uint16)
+        else:
+            consensus_dtype = np.dtype(np.uint32)
+    else:
+        consensus_dtype = get_precision_dtype(run_parameters)
+
+    if is_consensus_packed(run_parameters):
+        matrix_shape = (consensus_storage.get_packed_size(number_of_samples),)
+    else:
+        matrix_shape = (number_of_samples, number_of_samples)
+
+    indicator_matrix = np.zeros(matrix_shape, dtype=consensus_dtype)
+    if is_cluster_number_sweep(run_parameters):
+        linkage_matrix = np.zeros((len(get_cluster_numbers(run_parameters)),) + matrix_shape, dtype=consensus_dtype)
+    else:
+        linkage_matrix = indicator_matrix.copy()
+
+    return linkage_matrix, indicator_matrix
+
+
+def is_consensus_packed(run_parameters):
+    """ decide whether the consensus matrices are kept as packed upper triangles.
+
+    Args:
+        run_parameters: parameter set dictionary with (optional) "consensus_storage" ('dense' or 'packed') key.
+
+    Returns:
+        True for the 'packed' storage, otherwise False.
+    """
+
+    if 'consensus_storage' not in run_parameters:
+        return False
+
+    if run_parameters['consensus_storage'] not in ['dense', 'packed']:
+        raise ValueError('consensus_storage contains bad value.')
+
+    return run_parameters['consensus_storage'] == 'packed'
+
+
+def accumulate_clusterings(clusterings, linkage_matrix, indicator_matrix, run_parameters):
+    """ sum a stream of bootstrap clusterings into the linkage and indicator matrices,
+        "consensus_batch_size" clusterings at a time. When bootstrap convergence is tracked
+        the stream is abandoned as soon as the running consensus is stable.
+
+    Args:
+        clusterings: iterable of clusterings (see update_consensus_matrices).
+        linkage_matrix: linkage matrix from initialization or previous call.
+        indicator_matrix: indicator matrix from initialization or previous call.
+        run_parameters: dictionary with (optional) "consensus_batch_size" key and the
+                        bootstrap convergence keys (see is_bootstrap_convergence_tracked).
+
+    Returns:
+        linkage_matrix: linkage matrix summed with the clusterings.
+        indicator_matrix: indicator matrix summed with the clusterings.
+    """
+
+    if 'consensus_batch_size' in run_parameters:
+        consensus_batch_size = max(1, int(run_parameters['consensus_batch_size']))
+    else:
+        consensus_batch_size = 100
+
+    track_convergence     = is_bootstrap_convergence_tracked(run_parameters)
+    convergence_state     = {'consensus': None, 'labels': None, 'stable_checks': 0, 'history': []}
+    number_of_clusterings = 0
+
+    batch = []
+    for clustering in clusterings:
+        if clustering is None:
+            continue
+        batch.append(clustering)
+        number_of_clusterings += 1
+        check_convergence = track_convergence and number_of_clusterings % run_parameters['bootstrap_convergence_check_freq'] == 0
+        if len(batch) == consensus_batch_size or check_convergence:
+            linkage_matrix, indicator_matrix = update_consensus_matrices(batch, linkage_matrix, indicator_matrix)
+            batch = []
+        if check_convergence:
+            if update_bootstrap_convergence(linkage_matrix, indicator_matrix, number_of_clusterings, convergence_state, run_parameters):
+                break
+
+    linkage_matrix, indicator_matrix = update_consensus_matrices(batch, linkage_matrix, indicator_matrix)
+
+    if track_convergence:
+        if number_of_clusterings % run_parameters['bootstrap_convergence_check_freq'] != 0:
+            update_bootstrap_convergence(linkage_matrix, indicator_matrix, number_of_clusterings, convergence_state, run_parameters)
+        run_parameters['bootstrap_convergence'    ] = convergence_state['history']
+        run_parameters['number_of_bootstraps_used'] = number_of_clusterings
+
+    return linkage_matrix, indicator_matrix
+
+
+def is_bootstrap_convergence_tracked(run_parameters):
+    """ decide whether bootstraps stop early once the consensus is stable. Tracking is on when
+        "bootstrap_convergence_tolerance" is given and the clusterings are accumulated in memory;
+        "number_of_bootstraps" is then the maximum number of bootstraps. Missing optional keys
+        are set to their defaults: "bootstrap_convergence_check_freq" (10),
+        "bootstrap_convergence_window" (3) and "min_number_of_bootstraps" (0).
+
+    Args:
+        run_parameters: parameter set dictionary.
+
+    Returns:
+        True when bootstrap convergence is tracked, otherwise False.
+    """
+
+    if 'bootstrap_convergence_tolerance' not in run_parameters or is_consensus_accumulated_on_disk(run_parameters):
+        return False
+
+    run_parameters.setdefault('bootstrap_convergence_check_freq', 10)
+    run_parameters.setdefault('bootstrap_convergence_window',      3)
+    run_parameters.setdefault('min_number_of_bootstraps',          0)
+
+    return True
+
+
+def update_bootstrap_convergence(linkage_matrix, indicator_matrix, number_of_clusterings, convergence_state, run_parameters):
+    """ compare the running consensus matrix and its labels (cluster_consensus_matrix) with those of the previous check
+        (for a sweep: the mean change of all the consensus matrices and the largest label change).
+
+    Args:
+        linkage_matrix: running linkage matrix.
+        indicator_matrix: running indicator matrix.
+        number_of_clusterings: number of bootstraps summed in the matrices.
+        convergence_state: dictionary with the previous "consensus", "labels", the number of
+                           consecutive "stable_checks" and the "history" rows; updated in place.
+        run_parameters: dictionary with "number_of_clusters", "bootstrap_convergence_tolerance",
+                        "bootstrap_convergence_window" and "min_number_of_bootstraps" keys.
+
+    Returns:
+        True when the change stayed below tolerance for the window and the minimum is reached.
+    """
+    from sklearn.metrics import adjusted_rand_score
+
+    consensus_matrix = linkage_matrix / np.maximum(indicator_matrix, 1)
+    k_matrices       = consensus_matrix.reshape((-1,) + indicator_matrix.shape)
+    if indicator_matrix.ndim == 1:
+        number_of_samples = consensus_storage.get_number_of_samples(indicator_matrix.shape[0])
+        k_matrices        = [ consensus_storage.PackedConsensusMatrix(k_values, number_of_samples) for k_values in k_matrices ]
+
+    labels           = [ cluster_consensus_matrix(k_consensus_matrix, k, run_parameters)[0] for k_consensus_matrix, k
+                         in zip(k_matrices, get_cluster_numbers(run_parameters)) ]
+
+    if convergence_state['consensus'] is None:
+        consensus_change = np.inf
+        labels_change    = np.inf
+    else:
+        if indicator_matrix.ndim == 1:
+            consensus_change = consensus_storage.get_packed_mean(np.abs(consensus_matrix - convergence_state['consensus']), number_of_samples)
+        else:
+            consensus_change = np.mean(np.abs(consensus_matrix - convergence_state['consensus']))
+        labels_change    = max( 1 - adjusted_rand_score(previous_labels, k_labels)
+                                for previous_labels, k_labels in zip(convergence_state['labels'], labels) )
+
+    tolerance = float(run_parameters['bootstrap_convergence_tolerance'])
+    if consensus_change < tolerance and labels_change < tolerance:
+        convergence_state['stable_checks'] += 1
+    else:
+        convergence_state['stable_checks']  = 0
+
+    convergence_state['consensus'] = consensus_matrix
+    convergence_state['labels'   ] = labels
+    convergence_state['history'  ].append([number_of_clusterings, consensus_change, labels_change])
+
+    return convergence_state['stable_checks'] >= run_parameters['bootstrap_convergence_window'] \
+       and number_of_clusterings              >= run_parameters['min_number_of_bootstraps']
+
+
+def update_consensus_matrices(clusterings, linkage_matrix, indicator_matrix, block_size=2**22):
+    """ add a batch of bootstrap clusterings to the linkage and indicator matrices: stack the
+        clusterings as one-hot (samples x clusters) and presence (samples x bootstraps) matrices
+        and form the sums with blocked matrix multiplies. A sweep adds each row of the cluster ids to
+        its own linkage matrix of the stack. Packed upper triangle matrices (one dimensional, see
+        initialize_consensus_matrices) get the products of the upper triangle blocks only.
+
+    Args:
+        clusterings: list of (cluster_id, sample_permutation) as returned by a bootstrap worker;
+                     None entries (clusterings saved to the tmp directory) are skipped.
+        linkage_matrix: linkage matrix (or sweep stack) from initialization or previous call.
+        indicator_matrix: indicator matrix from initialization or previous call.
+        block_size: approximate number of elements in each matrix product block.
+
+    Returns:
+        linkage_matrix: linkage matrix summed with the clusterings.
+        indicator_matrix: indicator matrix summed with the clusterings.
+    """
+
+    clusterings = [clustering for clustering in clusterings if clustering is not None]
+    if len(clusterings) == 0:
+        return linkage_matrix, indicator_matrix
+
+    if np.issubdtype(linkage_matrix.dtype, np.floating):
+        product_dtype = linkage_matrix.dtype
+    else:
+        product_dtype = np.float32      # integer counts are exact in float32 up to 2**24 per batch
+
+    packed            = indicator_matrix.ndim == 1
+    if packed:
+        number_of_samples = consensus_storage.get_number_of_samples(indicator_matrix.shape[0])
+    else:
+        number_of_samples = indicator_matrix.shape[0]
+    rows_per_block    = max(1, block_size // number_of_samples)
+    linkage_stack     = linkage_matrix.reshape((-1,) + indicator_matrix.shape)
+
+    for cluster_row, k_linkage_matrix in enumerate(linkage_stack):
+        cluster_ids    = [ np.atleast_2d(cluster_id)[cluster_row] for cluster_id, sample_permutation in clusterings ]
+        cluster_offset = np.cumsum([0] + [int(np.max(cluster_id)) + 1 for cluster_id in cluster_ids])
+        cluster_mat    = np.zeros((number_of_samples, cluster_offset[-1]), dtype=product_dtype)
+
+        for bootstrap, cluster_id in enumerate(cluster_ids):
+            cluster_mat[clusterings[bootstrap][1], cluster_offset[bootstrap] + cluster_id] = 1
+
+        for row in range(0, number_of_samples, rows_per_block):
+            rows = slice(row, row + rows_per_block)
+            if packed:
+                consensus_storage.add_to_packed_rows(k_linkage_matrix, row, cluster_mat[rows].dot(cluster_mat[row:].T))
+            else:
+                np.add(k_linkage_matrix[rows], cluster_mat[rows].dot(cluster_mat.T), out=k_linkage_matrix[rows], casting='unsafe')
+
+    presence_mat = np.zeros((number_of_samples, len(clusterings)), dtype=product_dtype)
+    for bootstrap, (cluster_id, sample_permutation) in enumerate(clusterings):
+        presence_mat[sample_permutation, bootstrap] = 1
+
+    for row in range(0, number_of_samples, rows_per_block):
+        rows = slice(row, row + rows_per_block)
+        if packed:
+            consensus_storage.add_to_packed_rows(indicator_matrix, row, presence_mat[rows].dot(presence_mat[row:].T))
+        else:
+            np.add(indicator_matrix[rows], presence_mat[rows].dot(presence_mat.T), out=indicator_matrix[rows], casting='unsafe')
+
+    return linkage_matrix, indicator_matrix
+
+
+def form_consensus_matrix(run_parameters, linkage_matrix, indicator_matrix):
+    """ compute the consensus matrix from the indicator and linkage matrix inputs
+        and, when accumulated on disk, the bootstrap store.
+
+    Args:
+        run_parameters: parameter set dictionary with "tmp_directory" key.
+        linkage_matrix: linkage matrix from initialization or previous call.
+        indicator_matrix: indicator matrix from initialization or previous call.
+
+    Returns:
+        consensus_matrix: (sum of linkage matrices) / (sum of indicator matrices); a PackedConsensusMatrix
+                          (a list of them for a sweep) for the packed storage, held sparse without the
+                          values below "consensus_threshold" when one is given.
+    """
+
+    if is_consensus_accumulated_on_disk(run_parameters):
+        linkage_matrix, indicator_matrix = get_linkage_matrix(run_parameters, linkage_matrix, indicator_matrix)
+
+    if indicator_matrix.ndim == 1:
+        return form_packed_consensus_matrix(run_parameters, linkage_matrix, indicator_matrix)
+
+    consensus_matrix = linkage_matrix / np.maximum(indicator_matrix, 1)
+
+    return consensus_matrix.astype(get_precision_dtype(run_parameters), copy=False)
+
+
+def form_packed_consensus_matrix(run_parameters, linkage_matrix, indicator_matrix, block_size=2**24):
+    """ compute the consensus values of packed linkage and indicator counts, a block of values at a time.
+
+    Args:
+        run_parameters: parameter set dictionary with (optional) "precision" and "consensus_threshold" keys.
+        linkage_matrix: packed linkage counts (or the sweep stack of them).
+        indicator_matrix: packed indicator counts.
+        block_size: number of values divided at a time.
+
+    Returns:
+        consensus_matrix: PackedConsensusMatrix, or the list of them for a sweep.
+    """
+
+    number_of_samples = consensus_storage.get_number_of_samples(indicator_matrix.shape[0])
+    precision_dtype   = get_precision_dtype(run_parameters)
+
+    consensus_matrices = []
+    for k_linkage_matrix in linkage_matrix.reshape((-1,) + indicator_matrix.shape):
+        consensus_values = np.empty(indicator_matrix.shape, dtype=precision_dtype)
+        for start in range(0, indicator_matrix.shape[0], block_size):
+            values = slice(start, start + block_size)
+            consensus_values[values] = k_linkage_matrix[values] / np.maximum(indicator_matrix[values], 1)
+
+        consensus_matrix = consensus_storage.PackedConsensusMatrix(consensus_values, number_of_samples)
+        if 'consensus_threshold' in run_parameters:
+            consensus_matrix = consensus_matrix.sparsify(float(run_parameters['consensus_threshold']))
+        consensus_matrices.append(consensus_matrix)
+
+    if linkage_matrix.ndim == 1:
+        return consensus_matrices[0]
+
+    return consensus_matrices
+
+
+def get_linkage_matrix(run_parameters, linkage_matrix, indicator_matrix):
+    """ read the bootstrap store, compute and add the linkage and indicator matrices.
+
+    Args:
+        run_parameters: parameter set dictionary.
+        linkage_matrix: connectivity matrix from initialization or previous call.
+        indicator_matrix: indicator matrix from initialization or previous call.
+
+    Returns:
+        linkage_matrix: summed with the clusterings in the run_parameters["tmp_directory"] store.
+        indicator_matrix: summed with the clusterings in the run_parameters["tmp_directory"] store.
+    """
+
+    if run_parameters['processing_method'] == 'distribute':
+        tmp_dir = os.path.join(run_parameters['cluster_shared_volumn'],
+                               os.path.basename(os.path.normpath(run_parameters['tmp_directory'])))
+
+    else:
+        tmp_dir = run_parameters["tmp_directory"]
+
+    clusterings = ( clustering for sequence_number, clustering in read_saved_clusterings(tmp_dir) )
+
+    return accumulate_clusterings(clusterings, linkage_matrix, indicator_matrix, run_parameters)
+
+
+def read_saved_clusterings(tmp_dir, store_name='bootstrap_clusterings.bin'):
+    """ generate the clusterings appended to the bootstrap store by save_a_clustering with their
+        sequence numbers, read through a memory map. An incomplete last record is ignored.
+
+    Args:
+        tmp_dir: directory with the bootstrap store.
+        store_name: bootstrap store file name.
+
+    Yields:
+        sequence_number: bootstrap sample number.
+        clustering: (cluster_id, sample_permutation) of that bootstrap.
+    """
+
+    store_name = os.path.join(tmp_dir, store_name)
+    if not os.path.exists(store_name) or os.path.getsize(store_name) == 0:
+        return
+
+    store = np.memmap(store_name, dtype=np.uint8, mode='r')
+
+    for sequence_number, permutation_offset, number_of_columns, cluster_id_bytes in get_bootstrap_store_records(store)[0]:
+        cluster_id_rows    = cluster_id_bytes // 256 + 1
+        cluster_id_offset  = permutation_offset + 4 * number_of_columns
+        sample_permutation = np.frombuffer(store, dtype='<u4', count=number_of_columns, offset=permutation_offset)
+        cluster_id         = np.frombuffer(store, dtype='<u%d'%(cluster_id_bytes % 256), count=cluster_id_rows * number_of_columns,
+                                           offset=cluster_id_offset)
+        if cluster_id_rows > 1:
+            cluster_id     = cluster_id.reshape(cluster_id_rows, number_of_columns)
+
+        yield sequence_number, (cluster_id, sample_permutation)
+
+
+def get_bootstrap_store_records(store):
+    """ locate the complete records of a bootstrap store.
+
+    Args:
+        store: bootstrap store file contents as a uint8 array.
+
+    Returns:
+        records: list of (sequence_number, permutation offset, permutation size, cluster id bytes).
+        store_size: size in bytes of the complete records.
+    """
+
+    records    = []
+    store_size = 0
+    while store_size + 32 <= len(store):
+        magic, sequence_number, number_of_columns, cluster_id_bytes = \
+            np.frombuffer(store, dtype='<i8', count=4, offset=store_size)
+        if magic != 0x4b4e4243:
+            break
+        record_size = 32 + (4 + (int(cluster_id_bytes) // 256 + 1) * (int(cluster_id_bytes) % 256)) * int(number_of_columns)
+        record_size = record_size + (-record_size % 8)
+        if store_size + record_size > len(store):
+            break
+        records.append((int(sequence_number), store_size + 32, int(number_of_columns), int(cluster_id_bytes)))
+        store_size += record_size
+
+    return records, store_size
+
+
+def load_bootstrap_checkpoint(run_parameters):
+    """ read the clusterings of the bootstraps completed by an earlier, interrupted run with
+        the same parameters from the "checkpoint_directory".
+
+    Args:
+        run_parameters: parameter set dictionary with (optional) "checkpoint_directory" key.
+
+    Returns:
+        checkpointed: dictionary of bootstrap sample number to clustering (empty without checkpoint).
+    """
+    import json
+
+    if 'checkpoint_directory' not in run_parameters:
+        return {}
+
+    checkpoint_dir = run_parameters['checkpoint_directory']
+    os.makedirs(checkpoint_dir, mode=0o755, exist_ok=True)
+
+    parameters_name       = os.path.join(checkpoint_dir, 'checkpoint_parameters.json')
+    checkpoint_parameters = json.dumps(get_checkpoint_parameters(run_parameters), sort_keys=True, default=str)
+
+    if os.path.exists(parameters_name):
+        with open(parameters_name, 'r') as fh:
+            if fh.read() != checkpoint_parameters:
+                raise ValueError('checkpoint_directory holds bootstraps of a run with different parameters.')
+    else:
+        with open(parameters_name, 'w') as fh:
+            fh.write(checkpoint_parameters)
+
+    truncate_bootstrap_store(checkpoint_dir)
+
+    return dict(read_saved_clusterings(checkpoint_dir))
+
+
+def truncate_bootstrap_store(tmp_dir, store_name='bootstrap_clusterings.bin'):
+    """ drop an incomplete last record (left by an interrupted append) from the bootstrap store,
+        so that new records are appended after the complete ones.
+
+    Args:
+        tmp_dir: directory with the bootstrap store.
+        store_name: bootstrap store file name.
+    """
+
+    store_name = os.path.join(tmp_dir, store_name)
+    if not os.path.exists(store_name) or os.path.getsize(store_name) == 0:
+        return
+
+    with open(store_name, 'r+b') as fh:
+        store_size = get_bootstrap_store_records(np.frombuffer(fh.read(), dtype=np.uint8))[1]
+        fh.truncate(store_size)
+
+
+def get_checkpoint_parameters(run_parameters):
+    """ select the run parameters that determine the bootstrap clusterings.
+
+    Args:
+        run_parameters: parameter set dictionary.
+
+    Returns:
+        checkpoint_parameters: run_parameters without the directory, scheduling and output keys; the
+                               bootstraps of a 'threads' run draw from other random streams, so it is marked.
+    """
+
+    scheduling_keys = [ 'run_directory', 'run_file', 'results_directory', 'tmp_directory', 'checkpoint_directory'
+                      , 'network_cache_directory', 'spreadsheet_cache_directory'
+                      , 'processing_method', 'parallelism', 'cluster_ip_address', 'cluster_shared_volumn', 'cluster_shared_ram'
+                      , 'number_of_bootstraps', 'bootstrap_chunk_size', 'shared_inputs', 'consensus_accumulation'
+                      , 'consensus_batch_size', 'phenotype_name_full_path', 'threshold', 'top_number_of_genes'
+                      , 'silhouette_working_memory', 'bootstrap_batch_size', 'nmf_warm_start_comparison'
+                      , 'final_clustering', 'final_clustering_neighbors', 'final_clustering_rank'
+                      , 'consensus_storage', 'consensus_threshold', 'output_format', 'output_parallelism', 'consensus_matrix_order'
+                      , 'output_writers' ]
+
+    checkpoint_parameters = { key: value for key, value in run_parameters.items()
+                              if key not in scheduling_keys and not key.startswith('bootstrap_convergence') }
+
+    if 'processing_method' in run_parameters and run_parameters['processing_method'] == 'threads':
+        checkpoint_parameters['bootstrap_random_state'] = 'SeedSequence'
+
+    return checkpoint_parameters
+
+
+def merge_checkpointed_clusterings(jobs_id, checkpointed, computed_clusterings):
+    """ generate the clusterings of all jobs in jobs_id order, taking the checkpointed ones from the
+        checkpoint and the others from computed_clusterings (the bootstraps missing from the checkpoint).
+
+    Args:
+        jobs_id: bootstrap sample numbers.
+        checkpointed: dictionary of bootstrap sample number to clustering.
+        computed_clusterings: iterable of the clusterings of the missing bootstraps.
+
+    Yields:
+        clustering: one clustering per bootstrap.
+    """
+
+    computed_clusterings = iter(computed_clusterings)
+
+    for sample in jobs_id:
+        if sample in checkpointed:
+            yield checkpointed[sample]
+        else:
+            yield next(computed_clusterings)
+
+
+def remove_bootstrap_checkpoint(run_parameters):
+    """ remove the checkpoint files of a completed run (and the checkpoint directory if it is then empty).
+
+    Args:
+        run_parameters: parameter set dictionary with (optional) "checkpoint_directory" key.
+    """
+
+    if 'checkpoint_directory' not in run_parameters:
+        return
+
+    checkpoint_dir = run_parameters['checkpoint_directory']
+
+    for tmp_f in os.listdir(checkpoint_dir):
+        if tmp_f in ['bootstrap_clusterings.bin', 'checkpoint_parameters.json']:
+            os.remove(os.path.join(checkpoint_dir, tmp_f))
+
+    if len(os.listdir(checkpoint_dir)) == 0:
+        os.rmdir(checkpoint_dir)
+
+
+def save_spreadsheet_and_variance_heatmap(spreadsheet_df, labels, run_parameters, smooth_spreadsheet_mat=None, writer_state=None):
+    """ save the full genes by samples spreadsheet as processed or smoothed if provided.
+        Also save variance in separate file. The files are written in the "output_format".
+    Args:
+        spreadsheet_df: the dataframe as processed
+        run_parameters: with keys for "results_directory", "method", (optional - "top_number_of_genes",
+                        "output_format", "output_parallelism")
+        smooth_spreadsheet_mat: (if appropriate) spreadsheet smoothed with the network used in processing
+        writer_state: (optional) background results writer (see results_writer.start_results_writer)
+
+    Output:
+        genes_by_samples_heatmp_{method}_{timestamp}_viz.tsv
+        genes_averages_by_cluster_{method}_{timestamp}_viz.tsv
+        genes_variance_{method}_{timestamp}_viz.tsv
+        top_genes_by_cluster_{method}_{timestamp}_download.tsv
+    """
+
+    top_number_of_genes = run_parameters['top_number_of_genes']
+    type_suffix         = results_writer.get_output_type_suffix(run_parameters)
+
+    if smooth_spreadsheet_mat is not None:
+        clusters_df = pd.DataFrame(smooth_spreadsheet_mat, index=spreadsheet_df.index.values, columns=spreadsheet_df.columns.values)
+
+    else:
+        clusters_df = spreadsheet_df
+
+    file_name           = get_output_file_name(run_parameters, 'genes_by_samples_heatmap', 'viz', type_suffix)
+    results_writer.submit_result(writer_state, file_name, results_writer.save_df, clusters_df, file_name, run_parameters)
+
+    cluster_averages,    \
+    gene_variance        = get_cluster_summary(get_spreadsheet_matrix(spreadsheet_df), labels, smooth_spreadsheet_mat)
+
+    col_labels = []
+    for cluster_number in np.unique(labels):
+        col_labels.append('Cluster_%d'%(cluster_number))
+
+    cluster_ave_df         = pd.DataFrame(cluster_averages, index=spreadsheet_df.index, columns=col_labels)
+    file_name              = get_output_file_name(run_parameters, 'genes_averages_by_cluster', 'viz', type_suffix)
+    results_writer.submit_result(writer_state, file_name, results_writer.save_df, cluster_ave_df, file_name, run_parameters)
+
+    clusters_variance_df = pd.DataFrame(gene_variance, index=spreadsheet_df.index, columns=['variance'])
+    file_name = get_output_file_name(run_parameters, 'genes_variance', 'viz', type_suffix)
+    results_writer.submit_result(writer_state, file_name, results_writer.save_df, clusters_variance_df, file_name, run_parameters, float_format='%g')
+
+    top_gene_index         = get_top_gene_index(cluster_averages, top_number_of_genes)
+    top_gene_flags         = np.zeros(cluster_averages.shape)
+    top_gene_flags[top_gene_index, np.arange(cluster_averages.shape[1])] = 1
+    top_number_of_genes_df = pd.DataFrame(data=top_gene_flags, columns=col_labels, index=cluster_ave_df.index.values)
+
+    file_name = get_output_file_name(run_parameters, 'top_genes_by_cluster', 'download', type_suffix)
+    results_writer.submit_result(writer_state, file_name, results_writer.save_df, top_number_of_genes_df, file_name, run_parameters)
+
+
+def get_cluster_summary(spreadsheet_mat, labels, variance_mat=None, block_size=2**18):
+    """ cluster averages of the genes (rows) of a spreadsheet matrix and the gene variance, from one pass
+        over blocks of rows: the cluster sums are a matrix multiply with the samples x clusters indicator
+        matrix, and the variance (ddof 1) is taken about the row means from the same sums. A sparse
+        spreadsheet uses sparse products and is never made dense; its variance is centred as well, over
+        the stored values and the count of left out zeros.
+
+    Args:
+        spreadsheet_mat: genes x samples dense or scipy sparse matrix.
+        labels: cluster number of each sample.
+        variance_mat: (optional) genes x samples dense matrix whose gene variance is wanted instead
+                      (the smoothed spreadsheet of the network methods).
+        block_size: approximate number of values per block of rows.
+
+    Returns:
+        cluster_averages: genes x clusters matrix (clusters in np.unique(labels) order); float64, or
+                          float32 for a float32 spreadsheet (as the pandas means).
+        gene_variance: variance of each gene over the samples.
+    """
+    import scipy.sparse as spar
+
+    number_of_genes,   \
+    number_of_samples  = spreadsheet_mat.shape
+    clusters,          \
+    cluster_index      = np.unique(labels, return_inverse=True)
+    cluster_index      = cluster_index.ravel()
+    cluster_sizes      = np.bincount(cluster_index)
+
+    if spar.issparse(spreadsheet_mat):
+        spreadsheet_mat = spreadsheet_mat.tocsr().astype(np.float64)
+        indicator_mat   = spar.csr_matrix( (np.ones(number_of_samples), (np.arange(number_of_samples), cluster_index))
+                                         , shape=(number_of_samples, clusters.size) )
+        cluster_sums    = spreadsheet_mat.dot(indicator_mat).toarray()
+        gene_mean       = cluster_sums.sum(axis=1) / number_of_samples
+
+        # centred sums of squares: the stored values about their row mean, plus the left out zeros
+        nonzero_rows    = np.repeat(np.arange(number_of_genes), np.diff(spreadsheet_mat.indptr))
+        deviations      = spreadsheet_mat.data - gene_mean[nonzero_rows]
+        gene_squares    = np.bincount(nonzero_rows, weights=deviations * deviations, minlength=number_of_genes) \
+                        + (number_of_samples - np.diff(spreadsheet_mat.indptr)) * gene_mean ** 2
+        gene_variance   = gene_squares / (number_of_samples - 1)
+        if variance_mat is not None:
+            gene_variance = get_cluster_summary(variance_mat, labels, block_size=block_size)[1]
+
+        return cluster_sums / cluster_sizes, gene_variance
+
+    # the indicator multiply runs in BLAS, faster than a sparse indicator for dense blocks
+    indicator_mat      = np.zeros((number_of_samples, clusters.size))
+    indicator_mat[np.arange(number_of_samples), cluster_index] = 1
+
+    if np.issubdtype(spreadsheet_mat.dtype, np.floating):
+        averages_dtype = np.result_type(spreadsheet_mat.dtype, np.float32)
+    else:
+        averages_dtype = np.float64
+    cluster_averages   = np.empty((number_of_genes, clusters.size), dtype=averages_dtype)
+    gene_variance      = np.empty(number_of_genes)
+    block_rows         = max(1, block_size // max(number_of_samples, 1))
+    for start in range(0, number_of_genes, block_rows):
+        block          = np.asarray(spreadsheet_mat[start:start + block_rows], dtype=np.float64)
+        cluster_sums   = block.dot(indicator_mat)
+        cluster_averages[start:start + block_rows] = cluster_sums / cluster_sizes
+
+        if variance_mat is None:
+            block_mean = cluster_sums.sum(axis=1) / number_of_samples
+        else:
+            block      = np.asarray(variance_mat[start:start + block_rows], dtype=np.float64)
+            block_mean = block.mean(axis=1)
+        deviations     = block - block_mean[:, None]
+        gene_variance[start:start + block_rows] = np.einsum('ij,ij->i', deviations, deviations) / (number_of_samples - 1)
+
+    return cluster_averages, gene_variance
+
+
+def get_top_gene_index(cluster_averages, top_number_of_genes):
+    """ the genes of the highest averages in each cluster (unordered; ties at the cutoff go to either gene).
+
+    Args:
+        cluster_averages: genes x clusters matrix.
+        top_number_of_genes: number of genes per cluster.
+
+    Returns:
+        top_gene_index: top_number_of_genes (at most the number of genes) x clusters matrix of gene rows.
+    """
+
+    top_number_of_genes = min(int(top_number_of_genes), cluster_averages.shape[0])
+    if top_number_of_genes == cluster_averages.shape[0]:
+        return np.tile(np.arange(top_number_of_genes)[:, None], (1, cluster_averages.shape[1]))
+
+    return np.argpartition(-cluster_averages, top_number_of_genes - 1, axis=0)[0:top_number_of_genes]
+
+
+def save_consensus_clustering(consensus_matrix, sample_names, labels, run_parameters, writer_state=None, sample_order=None):
+    """ write the consensus matrix as a dataframe with sample_names column lablels
+        and cluster labels as row labels, in the "output_format"; with "consensus_matrix_order"
+        'clusters' the rows and columns are in the final clustering display order.
+
+    Args:
+        consensus_matrix: sample_names x sample_names numerical matrix.
+        sample_names:     data identifiers for column names.
+        labels:           cluster numbers for row names.
+        run_parameters:   path to write to consensus_data file (run_parameters["results_directory"]),
+                          (optional) "output_format", "output_parallelism" and "consensus_matrix_order".
+        writer_state:     (optional) background results writer (see results_writer.start_results_writer).
+        sample_order:     (optional) display order from cluster_consensus_matrix.
+
+    Output:
+        consensus_matrix_{method}_{timestamp}_viz.tsv
+        silhouette_average_{method}_{timestamp}_viz.tsv
+    """
+
+    file_name_mat     = get_output_file_name(run_parameters, 'consensus_matrix', 'viz', results_writer.get_output_type_suffix(run_parameters))
+
+    if get_consensus_matrix_order(run_parameters) == 'samples':
+        sample_order  = None
+    elif sample_order is None:
+        sample_order  = cluster_consensus_matrix(consensus_matrix, np.unique(labels).size, run_parameters)[1]
+
+    results_writer.submit_result(writer_state, file_name_mat, results_writer.save_consensus_df, consensus_matrix, sample_names, file_name_mat, run_parameters
+                                , sample_order=sample_order)
+
+
+def get_consensus_matrix_order(run_parameters):
+    """ order of the rows and columns of the consensus matrix output: 'samples' (default, the spreadsheet
+        order) or 'clusters' (the final clustering display order, see form_consensus_matrix_graphic).
+
+    Args:
+        run_parameters: parameter set dictionary with (optional) "consensus_matrix_order" key.
+
+    Returns:
+        consensus_matrix_order: 'samples' or 'clusters'.
+    """
+
+    if 'consensus_matrix_order' in run_parameters:
+        consensus_matrix_order = run_parameters['consensus_matrix_order']
+    else:
+        consensus_matrix_order = 'samples'
+
+    if consensus_matrix_order not in ['samples', 'clusters']:
+        raise ValueError('consensus_matrix_order contains bad value.')
+
+    return consensus_matrix_order
+
+
+def calculate_and_save_silhouette_scores(feature_matrix, sample_names, labels, run_parameters, writer_state=None):
+    """ Calculate the silhouette scores of the euclidean distances between the rows of a feature matrix.
+
+    Args:
+        feature_matrix:   n_samples x n_features numerical matrix (consensus matrix or transposed h matrix).
+        sample_names:     row names of the feature matrix.
+        labels:           cluster numbers for row names.
+        run_parameters:   path to write to consensus_data file (run_parameters["results_directory"]).
+        writer_state:     (optional) background results writer (see results_writer.start_results_writer).
+
+    Output:
+            silhouette_overall_score_{method}_{timestamp}_viz.tsv
+        silhouette_per_cluster_score_{method}_{timestamp}_viz.tsv
+         silhouette_per_sample_score_{method}_{timestamp}_viz.tsv
+    """
+
+    file_name_all     = get_output_file_name(run_parameters, 'silhouette_overall_score',     'viz')
+    file_name_cluster = get_output_file_name(run_parameters, 'silhouette_per_cluster_score', 'viz')
+    file_name_sample  = get_output_file_name(run_parameters, 'silhouette_per_sample_score',  'viz')
+
+
+    n_clusters,       \
+    overall,          \
+    per_cluster,      \
+    per_sample        = get_clustering_scores(feature_matrix, labels, run_parameters)
+
+    results_writer.submit_result(writer_state, file_name_all,     results_writer.save_text, file_name_all,
+                                 "%d\t%g\n" %(n_clusters,overall) )
+
+    results_writer.submit_result(writer_state, file_name_cluster, results_writer.save_text, file_name_cluster,
+                                 ''.join( "%d\t%g\n" %(i, per_cluster[i]) for i in range(n_clusters) ))
+
+
+    per_sample_df = pd.DataFrame(data=per_sample, index=sample_names)
+    results_writer.submit_result(writer_state, file_name_sample, per_sample_df.to_csv, file_name_sample, sep='\t', header=None, float_format='%g')
+
+
+def get_clustering_scores(feature_matrix, labels, run_parameters):
+    """ computes three levels silhoutte scores,overall, per_cluster, and per_sample
+
+    Args:
+        feature_matrix: n_samples x n_features numerical matrix.
+        labels:         samples label
+        run_parameters: parameter set dictionary (optional silhouette_working_memory).
+
+    Output:
+        overall:         overall silhoutte score
+        per_cluster: per cluster silhoutte score
+        per_sample : per sample  silhoutte score
+    """
+
+    n_clusters = len(set(labels))
+
+    if n_clusters > 1:
+        silhouette_values = get_silhouette_samples(feature_matrix, labels, run_parameters)
+    else:
+        silhouette_values = np.ones(len(labels) )
+
+    cluster_mean = np.empty([n_clusters])
+    cluster_size = np.empty([n_clusters])
+
+    for i in range(n_clusters):
+        cluster_values  = silhouette_values[labels == i]
+        cluster_mean[i] = cluster_values.mean()  
+        cluster_size[i] = cluster_values.shape[0]
+
+    overall      = cluster_mean.dot(cluster_size) / len(labels)
+    per_cluster  = cluster_mean
+    per_sample   = silhouette_values
+
+    return n_clusters, overall, per_cluster, per_sample
+
+
+def get_silhouette_samples(feature_matrix, labels, run_parameters):
+    """ silhouette value of each row of the feature matrix under the euclidean distance, computed from
+        blocks of distance rows so that the n_samples x n_samples distance matrix is never formed;
+        matches sklearn silhouette_samples of pairwise_distances(feature_matrix).
+
+    Args:
+        feature_matrix: n_samples x n_features numerical matrix.
+        labels:         samples label
+        run_parameters: parameter set dictionary (optional silhouette_working_memory, MiB per block).
+
+    Returns:
+        silhouette_values: per sample silhouette values.
+    """
+    silhouette_working_memory = 1024
+    if 'silhouette_working_memory' in run_parameters:
+        silhouette_working_memory = float(run_parameters['silhouette_working_memory'])
+    if not silhouette_working_memory > 0:
+        raise ValueError('silhouette_working_memory contains bad value.')
+
+    n_samples          = feature_matrix.shape[0]
+    label_values,      \
+    label_index        = np.unique(labels, return_inverse=True)
+    label_freqs        = np.bincount(label_index)
+    distance_dtype     = np.result_type(feature_matrix.dtype, np.float32)
+    label_indicator    = np.zeros((n_samples, label_values.shape[0]), dtype=distance_dtype)
+    label_indicator[np.arange(n_samples), label_index] = 1
+
+    # a distance block and its squared-norm temporaries take about two rows of n_samples values
+    block_rows         = int(silhouette_working_memory * 2 ** 20 // (2 * n_samples * np.dtype(distance_dtype).itemsize))
+    block_rows         = min(max(block_rows, 1), n_samples)
+
+    # a packed consensus feature matrix is read in blocks of rows on both sides
+    if isinstance(feature_matrix, consensus_storage.PackedConsensusMatrix):
+        column_rows    = block_rows
+    else:
+        column_rows    = n_samples
+
+    # each block of rows meets only the columns from its first row on; the transposed block
+    # supplies the cluster sums of the later rows, so every distance is computed once
+    cluster_distances  = np.zeros((n_samples, label_values.shape[0]), dtype=distance_dtype)
+    for start in range(0, n_samples, block_rows):
+        stop           = min(start + block_rows, n_samples)
+        row_block      = feature_matrix[start:stop]
+        for column in range(start, n_samples, column_rows):
+            column_stop    = min(column + column_rows, n_samples)
+            distance_block = euclidean_distances(row_block, feature_matrix[column:column_stop])
+            if column == start:
+                distance_block[np.arange(stop - start), np.arange(stop - start)] = 0
+
+            later_columns  = max(stop - column, 0)
+            cluster_distances[start:stop]        += distance_block.dot(label_indicator[column:column_stop])
+            cluster_distances[column + later_columns:column_stop] += \
+                distance_block[:, later_columns:].T.dot(label_indicator[start:stop])
+
+    intra_index        = (np.arange(n_samples), label_index)
+    intra_distances    = cluster_distances[intra_index]
+    cluster_distances[intra_index] = np.inf
+    inter_distances    = (cluster_distances / label_freqs).min(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        intra_distances  /= (label_freqs - 1)[label_index]
+        silhouette_values = (inter_distances - intra_distances) / np.maximum(intra_distances, inter_distances)
+
+    return np.nan_to_num(silhouette_values)
+
+
+def save_bootstrap_convergence(run_parameters, writer_state=None):
+    """ write the running consensus changes recorded when bootstrap convergence is tracked;
+        the last row holds the number of bootstraps actually used.
+
+    Args:
+        run_parameters: with keys "results_directory", "method" and (optional) "bootstrap_convergence".
+        writer_state: (optional) background results writer (see results_writer.start_results_writer).
+
+    Output:
+        bootstrap_convergence_{method}_{timestamp}_download.tsv
+    """
+
+    if 'bootstrap_convergence' not in run_parameters:
+        return
+
+    convergence_df = pd.DataFrame( run_parameters['bootstrap_convergence']
+                                 , columns=['number_of_bootstraps', 'consensus_change', 'labels_change'])
+    file_name      = get_output_file_name(run_parameters, 'bootstrap_convergence', 'download')
+    results_writer.submit_result(writer_state, file_name, convergence_df.to_csv, file_name, sep='\t', index=False, float_format='%g')
+
+
+def save_rwr_convergence(restart, network_mat, smooth, iterations, run_parameters, writer_state=None):
+    """ write the random walk with restart solver, its iterations and the Frobenius norm of the
+        steady state residual (I - a*N) R - (1-a)*R_0, to compare the "rwr_solver" engines.
+
+    Args:
+        restart: genes x samples restart matrix.
+        network_mat: normalized genes x genes network matrix.
+        smooth: smoothed restart matrix.
+        iterations: number of iterations of the solver.
+        run_parameters: with keys "results_directory", "method", "rwr_restart_probability" and (optional) "rwr_solver".
+        writer_state: (optional) background results writer (see results_writer.start_results_writer).
+
+    Output:
+        rwr_convergence_{method}_{timestamp}_download.tsv
+    """
+
+    alpha    = run_parameters['rwr_restart_probability']
+    residual = smooth - alpha * network_mat.dot(smooth) - (1. - alpha) * restart
+
+    if 'rwr_solver' in run_parameters:
+        rwr_solver = run_parameters['rwr_solver']
+    else:
+        rwr_solver = 'power'
+
+    convergence_df = pd.DataFrame( [[rwr_solver, iterations, np.linalg.norm(residual)]]
+                                 , columns=['rwr_solver', 'iterations', 'residual'])
+    file_name      = get_output_file_name(run_parameters, 'rwr_convergence', 'download')
+    results_writer.submit_result(writer_state, file_name, convergence_df.to_csv, file_name, sep='\t', index=False, float_format='%g')
+
+
+def save_nmf_convergence(run_parameters, convergence_records=None, writer_state=None):
+    """ write the "nmf_solver" engine with the iterations and wall time of each factorization (the
+        bootstrap records in the tmp directory unless given), to compare the engines on a dataset.
+
+    Args:
+        run_parameters: with keys "results_directory", "method", "tmp_directory", (optional) "nmf_solver"
+                        and (optional) "nmf_initialization".
+        convergence_records: list of [bootstrap, iterations, seconds], or None to read the tmp directory record.
+        writer_state: (optional) background results writer (see results_writer.start_results_writer).
+
+    Output:
+        nmf_convergence_{method}_{timestamp}_download.tsv
+    """
+
+    if not is_nmf_convergence_recorded(run_parameters):
+        return
+
+    if convergence_records is None:
+        convergence_records = read_nmf_convergence_records(run_parameters['tmp_directory'])
+
+    if 'nmf_solver' in run_parameters:
+        nmf_solver = run_parameters['nmf_solver']
+    else:
+        nmf_solver = 'multiplicative'
+
+    convergence_df = pd.DataFrame(convergence_records, columns=['bootstrap', 'iterations', 'seconds'])
+    convergence_df = convergence_df.astype({'bootstrap': int, 'iterations': int}).sort_values('bootstrap')
+    convergence_df.insert(0, 'nmf_solver', nmf_solver)
+    file_name      = get_output_file_name(run_parameters, 'nmf_convergence', 'download')
+    results_writer.submit_result(writer_state, file_name, convergence_df.to_csv, file_name, sep='\t', index=False, float_format='%g')
+
+
+def save_nmf_warm_start_comparison(consensus_matrix, labels, worker, batch_worker, arguments, run_parameters, writer_state=None):
+    """ with the warm "nmf_initialization" and "nmf_warm_start_comparison" (and a single number of
+        clusters), repeat the bootstraps serially
+        from random initializations (counting the iterations of the kn updates with the 'multiplicative'
+        engine when no "nmf_solver" is given) and write the mean iterations of both starts, the iteration savings,
+        the mean absolute difference of the consensus matrices and the adjusted Rand index of the labels.
+
+    Args:
+        consensus_matrix: warm start consensus matrix.
+        labels: warm start sample labels.
+        worker: bootstrap worker function, worker(*arguments, run_parameters, sample).
+        batch_worker: batch worker function, batch_worker(*arguments, run_parameters, samples).
+        arguments: list of the read-only worker arguments.
+        run_parameters: parameter set dictionary.
+        writer_state: (optional) background results writer (see results_writer.start_results_writer).
+
+    Output:
+        nmf_warm_start_{method}_{timestamp}_download.tsv
+    """
+    from sklearn.metrics import adjusted_rand_score
+
+    if get_nmf_initialization(run_parameters) != 'warm':
+        return
+
+    if 'nmf_warm_start_comparison' not in run_parameters or not run_parameters['nmf_warm_start_comparison']:
+        return
+
+    if is_cluster_number_sweep(run_parameters):
+        return
+
+    cold_parameters = { key: value for key, value in run_parameters.items()
+                        if key != 'checkpoint_directory' and not key.startswith('bootstrap_convergence') }
+    cold_parameters['nmf_initialization'    ] = 'random'
+    cold_parameters['processing_method'     ] = 'serial'
+    cold_parameters['consensus_accumulation'] = 'memory'
+    cold_parameters['tmp_directory'         ] = os.path.join(run_parameters['tmp_directory'], 'cold_start')
+    if 'nmf_solver' not in cold_parameters:
+        cold_parameters['nmf_solver'] = 'multiplicative'
+
+    if 'number_of_bootstraps_used' in run_parameters:
+        number_of_bootstraps = run_parameters['number_of_bootstraps_used']
+    else:
+        number_of_bootstraps = run_parameters['number_of_bootstraps']
+
+    linkage_matrix,    \
+    indicator_matrix   = initialize_consensus_matrices(consensus_matrix.shape[0], cold_parameters)
+    clusterings        = run_bootstrap_jobs(worker, batch_worker, arguments, cold_parameters, range(0, number_of_bootstraps))
+    linkage_matrix,    \
+    indicator_matrix   = accumulate_clusterings(clusterings, linkage_matrix, indicator_matrix, cold_parameters)
+    cold_consensus     = form_consensus_matrix(cold_parameters, linkage_matrix, indicator_matrix)
+    cold_labels        = cluster_consensus_matrix(cold_consensus, run_parameters['number_of_clusters'], run_parameters)[0]
+
+    warm_iterations    = np.mean([ record[1] for record in read_nmf_convergence_records(run_parameters['tmp_directory' ]) ])
+    cold_iterations    = np.mean([ record[1] for record in read_nmf_convergence_records(cold_parameters['tmp_directory']) ])
+    if os.path.isdir(cold_parameters['tmp_directory']):
+        kn.remove_dir(cold_parameters['tmp_directory'])
+
+    comparison_df = pd.DataFrame( [[ warm_iterations, cold_iterations, 1 - warm_iterations / cold_iterations
+                                   , consensus_storage.get_mean_absolute_difference(consensus_matrix, cold_consensus)
+                                   , adjusted_rand_score(cold_labels, labels) ]]
+                                , columns=[ 'warm_iterations', 'cold_iterations', 'iteration_savings'
+                                          , 'consensus_difference', 'labels_adjusted_rand_index' ])
+    file_name     = get_output_file_name(run_parameters, 'nmf_warm_start', 'download')
+    results_writer.submit_result(writer_state, file_name, comparison_df.to_csv, file_name, sep='\t', index=False, float_format='%g')
+
+
+def select_number_of_clusters(consensus_matrix, run_parameters, writer_state=None):
+    """ k-means labels of the consensus matrix. For a number of clusters sweep, score the consensus matrix
+        of every number of clusters (cophenetic correlation, proportion of ambiguous clustering and mean
+        silhouette), save the scores and keep the number of clusters recommended by the
+        "number_of_clusters_selection" score: 'pac' (default; lowest PAC, ties to the highest cophenetic
+        correlation), 'cophenetic' or 'silhouette' (highest score).
+
+    Args:
+        consensus_matrix: samples x samples consensus matrix, or the sweep stack of them.
+        run_parameters: parameter set dictionary with "number_of_clusters" and (optional)
+                        "number_of_clusters_selection" and "output_format" keys.
+        writer_state: (optional) background results writer (see results_writer.start_results_writer).
+
+    Returns:
+        consensus_matrix: consensus matrix of the (recommended) number of clusters.
+        labels: its cluster labels (see cluster_consensus_matrix).
+        sample_order: its samples in display order (see cluster_consensus_matrix).
+
+    Output:
+        number_of_clusters_sweep_{method}_{timestamp}_download.tsv (for a sweep, in the "output_format")
+    """
+
+    if not is_cluster_number_sweep(run_parameters):
+        return (consensus_matrix,) + tuple(cluster_consensus_matrix(consensus_matrix, run_parameters['number_of_clusters'], run_parameters))
+
+    if 'number_of_clusters_selection' in run_parameters:
+        number_of_clusters_selection = run_parameters['number_of_clusters_selection']
+    else:
+        number_of_clusters_selection = 'pac'
+
+    if number_of_clusters_selection not in ['pac', 'cophenetic', 'silhouette']:
+        raise ValueError('number_of_clusters_selection contains bad value.')
+
+    sweep_scores = []
+    sweep_labels = []
+    sweep_orders = []
+    for k, k_consensus_matrix in zip(get_cluster_numbers(run_parameters), consensus_matrix):
+        labels,    \
+        order      = cluster_consensus_matrix(k_consensus_matrix, k, run_parameters)
+        silhouette = get_clustering_scores(k_consensus_matrix, labels, run_parameters)[1]
+        sweep_scores.append([ k, get_cophenetic_correlation(k_consensus_matrix)
+                            , get_proportion_of_ambiguous_clustering(k_consensus_matrix), silhouette ])
+        sweep_labels.append(labels)
+        sweep_orders.append(order)
+
+    sweep_df = pd.DataFrame(sweep_scores, columns=['number_of_clusters', 'cophenetic_correlation', 'pac', 'silhouette'])
+
+    cophenetic = np.nan_to_num(sweep_df['cophenetic_correlation'].values, nan=-np.inf)
+    if   number_of_clusters_selection == 'pac':
+        recommended = np.lexsort((-cophenetic, np.nan_to_num(sweep_df['pac'].values, nan=np.inf)))[0]
+    elif number_of_clusters_selection == 'cophenetic':
+        recommended = np.argmax(cophenetic)
+    else:
+        recommended = np.argmax(np.nan_to_num(sweep_df['silhouette'].values, nan=-np.inf))
+
+    sweep_df['recommended'] = (np.arange(len(sweep_df)) == recommended).astype(int)
+    sweep_df                = sweep_df.set_index('number_of_clusters')
+    file_name               = get_output_file_name(run_parameters, 'number_of_clusters_sweep', 'download', results_writer.get_output_type_suffix(run_parameters))
+    results_writer.submit_result(writer_state, file_name, results_writer.save_df, sweep_df, file_name, run_parameters, float_format='%g')
+
+    return consensus_matrix[recommended], sweep_labels[recommended], sweep_orders[recommended]
+
+
+def get_cophenetic_correlation(consensus_matrix):
+    """ cophenetic correlation coefficient of the average linkage hierarchical clustering of the
+        consensus distances (1 - consensus).
+
+    Args:
+        consensus_matrix: samples x samples consensus matrix.
+
+    Returns:
+        cophenetic_correlation: correlation of the consensus and cophenetic distances.
+    """
+    from scipy.cluster.hierarchy import cophenet
+
+    consensus_dendrogram, \
+    consensus_distances   = get_consensus_dendrogram(consensus_matrix)
+    if consensus_distances.size < 2 or np.ptp(consensus_distances) == 0:
+        return np.nan
+
+    return cophenet(consensus_dendrogram, consensus_distances)[0]
+
+
+def get_consensus_dendrogram(consensus_matrix):
+    """ average linkage hierarchical clustering of the consensus distances (1 - consensus).
+
+    Args:
+        consensus_matrix: samples x samples consensus matrix.
+
+    Returns:
+        consensus_dendrogram: scipy linkage matrix.
+        consensus_distances: condensed consensus distances.
+    """
+    from scipy.cluster.hierarchy import linkage
+    from scipy.spatial.distance import squareform
+
+    if isinstance(consensus_matrix, consensus_storage.PackedConsensusMatrix):
+        consensus_distances = consensus_matrix.get_condensed_distances()
+    else:
+        consensus_distances = squareform(1 - np.asarray(consensus_matrix, dtype=np.float64), checks=False)
+    if consensus_distances.size == 0:
+        return np.zeros((0, 4)), consensus_distances
+
+    return linkage(consensus_distances, method='average'), consensus_distances
+
+
+def get_proportion_of_ambiguous_clustering(consensus_matrix, lower=0.1, upper=0.9, block_rows=1024):
+    """ proportion of ambiguous clustering (PAC): the fraction of sample pairs whose consensus lies
+        strictly between lower and upper; counted in blocks of rows.
+
+    Args:
+        consensus_matrix: samples x samples consensus matrix.
+        lower: consensus below which a pair is unambiguously apart.
+        upper: consensus above which a pair is unambiguously together.
+        block_rows: rows counted at a time.
+
+    Returns:
+        pac: proportion of the (off diagonal) pairs with an ambiguous consensus.
+    """
+
+    number_of_samples = consensus_matrix.shape[0]
+    if number_of_samples < 2:
+        return np.nan
+
+    ambiguous = 0
+    for start in range(0, number_of_samples, block_rows):
+        block     = consensus_matrix[start:start + block_rows]
+        ambiguous = ambiguous + np.count_nonzero((block > lower) & (block < upper))
+
+    diagonal  = consensus_matrix.diagonal()
+    ambiguous = ambiguous - np.count_nonzero((diagonal > lower) & (diagonal < upper))
+
+    return ambiguous / (number_of_samples * (number_of_samples - 1))
+
+
+def cluster_consensus_matrix(consensus_matrix, number_of_clusters, run_parameters):
+    """ final clustering of the samples from the consensus matrix with the "final_clustering" method:
+        'kmeans' (default, kn.perform_kmeans on the consensus rows; a packed consensus is made dense,
+        with a warning); 'spectral', k-means of the spectral embedding of the consensus graph
+        sparsified to the "final_clustering_neighbors" strongest consensus values of each sample;
+        'minibatch_kmeans', mini-batch k-means of the rank "final_clustering_rank" eigen embedding
+        of the consensus matrix; 'hierarchical', the average linkage dendrogram of the consensus
+        distances cut into the number of clusters. The display order comes from the same embedding
+        or dendrogram as the labels.
+
+    Args:
+        consensus_matrix: samples x samples consensus matrix.
+        number_of_clusters: number of clusters.
+        run_parameters: dictionary with (optional) "final_clustering", "final_clustering_neighbors"
+                        and "final_clustering_rank" keys.
+
+    Returns:
+        labels: cluster label of each sample.
+        sample_order: samples in display order (clusters together, see form_consensus_matrix_graphic).
+    """
+    import warnings
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+    from scipy.cluster.hierarchy import fcluster, leaves_list
+
+    if 'final_clustering' in run_parameters:
+        final_clustering = run_parameters['final_clustering']
+    else:
+        final_clustering = 'kmeans'
+
+    if   final_clustering == 'kmeans':
+        if isinstance(consensus_matrix, consensus_storage.PackedConsensusMatrix):
+            warnings.warn( 'kmeans final_clustering makes the packed consensus matrix dense (%d x %d); '
+                           'set final_clustering to spectral or minibatch_kmeans to keep it packed.'%(consensus_matrix.shape), stacklevel=2 )
+        labels       = kn.perform_kmeans(np.asarray(consensus_matrix), number_of_clusters)
+        sample_order = np.argsort(labels)
+
+    elif final_clustering == 'hierarchical':
+        consensus_dendrogram, \
+        consensus_distances   = get_consensus_dendrogram(consensus_matrix)
+        labels       = fcluster(consensus_dendrogram, number_of_clusters, criterion='maxclust') - 1
+        sample_order = leaves_list(consensus_dendrogram)
+
+    elif final_clustering == 'spectral':
+        if 'final_clustering_neighbors' in run_parameters:
+            neighbors = int(run_parameters['final_clustering_neighbors'])
+        else:
+            neighbors = 30
+        if neighbors < 1:
+            raise ValueError('final_clustering_neighbors contains bad value.')
+
+        embedding    = get_spectral_embedding(get_consensus_graph(consensus_matrix, neighbors), number_of_clusters)
+        labels       = KMeans(n_clusters=number_of_clusters, random_state=10, n_init=10).fit_predict(embedding)
+        sample_order = np.lexsort((embedding[:, 0], labels))
+
+    elif final_clustering == 'minibatch_kmeans':
+        if 'final_clustering_rank' in run_parameters:
+            rank = int(run_parameters['final_clustering_rank'])
+        else:
+            rank = number_of_clusters
+        if rank < 1:
+            raise ValueError('final_clustering_rank contains bad value.')
+
+        eigenvalues,  \
+        eigenvectors  = get_leading_eigenvectors(consensus_matrix, rank)
+        embedding     = eigenvectors * np.sqrt(np.maximum(eigenvalues, 0))
+        labels        = MiniBatchKMeans(n_clusters=number_of_clusters, random_state=10, n_init=3).fit_predict(embedding)
+        sample_order  = np.lexsort((embedding[:, 0], labels))
+
+    else:
+        raise ValueError('final_clustering contains bad value.')
+
+    return labels, sample_order
+
+
+def get_consensus_graph(consensus_matrix, neighbors, block_rows=1024):
+    """ sparsify the consensus matrix: keep the "neighbors" largest off diagonal consensus values of
+        every sample (a pair is kept when either sample keeps it); rows are ranked in blocks.
+
+    Args:
+        consensus_matrix: samples x samples consensus matrix.
+        neighbors: number of strongest consensus values kept per sample.
+        block_rows: rows ranked at a time.
+
+    Returns:
+        consensus_graph: symmetric scipy csr matrix of the kept consensus values.
+    """
+    import scipy.sparse as spar
+
+    number_of_samples = consensus_matrix.shape[0]
+    neighbors         = max(min(neighbors, number_of_samples - 1), 1)
+
+    rows, columns, values = [], [], []
+    for start in range(0, number_of_samples, block_rows):
+        block         = np.array(consensus_matrix[start:start + block_rows], dtype=np.float64)
+        block_samples = np.arange(start, start + block.shape[0])
+        block[np.arange(block.shape[0]), block_samples] = -np.inf
+        nearest       = np.argpartition(-block, neighbors - 1, axis=1)[:, 0:neighbors]
+        rows.append(np.repeat(block_samples, neighbors))
+        columns.append(nearest.ravel())
+        values.append(np.take_along_axis(block, nearest, axis=1).ravel())
+
+    values          = np.maximum(np.concatenate(values), 0)
+    consensus_graph = spar.csr_matrix((values, (np.concatenate(rows), np.concatenate(columns))), shape=consensus_matrix.shape)
+    consensus_graph = consensus_graph.maximum(consensus_graph.T)
+    consensus_graph.eliminate_zeros()
+
+    return consensus_graph
+
+
+def get_spectral_embedding(consensus_graph, dimensions):
+    """ spectral embedding of a consensus graph: the leading eigenvectors of the normalized adjacency
+        D^-1/2 A D^-1/2, with every sample row scaled to unit length.
+
+    Args:
+        consensus_graph: symmetric (sparse) samples x samples adjacency matrix.
+        dimensions: number of eigenvectors.
+
+    Returns:
+        embedding: samples x dimensions matrix.
+    """
+    import scipy.sparse as spar
+
+    epsilon      = 1e-15
+    degrees      = np.asarray(consensus_graph.sum(axis=1)).ravel()
+    scale        = spar.diags(1 / np.sqrt(np.maximum(degrees, epsilon)))
+    eigenvalues, \
+    embedding    = get_leading_eigenvectors(scale @ consensus_graph @ scale, dimensions)
+
+    return embedding / np.maximum(np.linalg.norm(embedding, axis=1, keepdims=True), epsilon)
+
+
+def get_leading_eigenvectors(symmetric_matrix, dimensions, dense_size=256):
+    """ largest eigenvalues and their eigenvectors of a symmetric (dense or sparse) matrix: Lanczos
+        iterations (eigsh, from a fixed start vector) with matrix products only, or a dense
+        decomposition for small matrices.
+
+    Args:
+        symmetric_matrix: symmetric samples x samples matrix.
+        dimensions: number of eigenvectors.
+        dense_size: largest size decomposed densely.
+
+    Returns:
+        eigenvalues: the largest eigenvalues, in decreasing order.
+        eigenvectors: samples x dimensions matrix of their eigenvectors.
+    """
+    import scipy.sparse as spar
+    from scipy.sparse.linalg import eigsh
+
+    size       = symmetric_matrix.shape[0]
+    dimensions = min(dimensions, size)
+
+    if size <= dense_size or dimensions >= size - 1:
+        if spar.issparse(symmetric_matrix):
+            symmetric_matrix = symmetric_matrix.toarray()
+        eigenvalues, eigenvectors = np.linalg.eigh(np.asarray(symmetric_matrix, dtype=np.float64))
+        return eigenvalues[::-1][0:dimensions], eigenvectors[:, ::-1][:, 0:dimensions]
+
+    eigenvalues, eigenvectors = eigsh(symmetric_matrix, k=dimensions, which='LA', v0=np.random.RandomState(10).rand(size))
+    order = np.argsort(eigenvalues)[::-1]
+
+    return eigenvalues[order], eigenvectors[:, order]
+
+
+def save_final_samples_clustering(sample_names, labels, run_parameters, writer_state=None):
+    """ wtite .tsv file that assings a cluster number label to the sample_names.
+
+    Args:
+        sample_names: (unique) data identifiers.
+        labels: cluster number assignments.
+        run_parameters: write path (run_parameters["results_directory"]).
+        writer_state: (optional) background results writer (see results_writer.start_results_writer).
+
+    Output:
+        samples_labeled_by_cluster_{method}_{timestamp}_viz.tsv
+        phenotypes_labeled_by_cluster_{method}_{timestamp}_viz.tsv
+    """
+
+    cluster_labels_df         = kn.create_df_with_sample_labels(sample_names, labels)
+    cluster_mapping_full_path = get_output_file_name(run_parameters, 'samples_label_by_cluster', 'viz')
+    results_writer.submit_result(writer_state, cluster_mapping_full_path, cluster_labels_df.to_csv, cluster_mapping_full_path, sep='\t', header=None)
+
+    if 'phenotype_name_full_path' in run_parameters.keys():
+        results_writer.wait_for_result(writer_state, cluster_mapping_full_path)
+        run_parameters['cluster_mapping_full_path'] = cluster_mapping_full_path
+        cluster_eval.clustering_evaluation(run_parameters)
+
+
+def get_output_file_name(run_parameters, prefix_string, suffix_string='', type_suffix='tsv'):
+    """ get the full directory / filename for writing
+    Args:
+        run_parameters: dictionary with keys: "results_directory", "method" and "correlation_measure"
+        prefix_string:  the first letters of the ouput file name
+        suffix_string:  the last letters of the output file name before '.tsv'
+
+    Returns:
+        output_file_name:   full file and directory name suitable for file writing
+    """
+
+    method            = run_parameters['method'] 
+    results_directory = run_parameters["results_directory"]
+
+    output_file_name = os.path.join(results_directory,    prefix_string + '_' + method)
+    output_file_name = kn.create_timestamped_filename(output_file_name) + '_' + suffix_string + '.' + type_suffix
+
+    return output_file_name
+
+
+def get_precision_dtype(run_parameters):
+    """ floating point type of the run.
+
+    Args:
+        run_parameters: parameter set dictionary with (optional) "precision" key, 'float64' (default) or 'float32'.
+
+    Returns:
+        precision_dtype: numpy float32 or float64 type.
+    """
+
+    if 'precision' not in run_parameters:
+        return np.dtype('float64')
+
+    if run_parameters['precision'] not in ['float32', 'float64']:
+        raise ValueError('precision contains bad value.')
+
+    return np.dtype(run_parameters['precision'])
+
+
+def set_spreadsheet_precision(spreadsheet_df, run_parameters):
+    """ convert the spreadsheet to the run "precision" (left as read when not given).
+
+    Args:
+        spreadsheet_df: genes x samples dataframe.
+        run_parameters: parameter set dictionary with (optional) "precision" key.
+
+    Returns:
+        spreadsheet_df: genes x samples dataframe of the run precision.
+    """
+
+    if 'precision' not in run_parameters:
+        return spreadsheet_df
+
+    if data_cache.is_sparse_df(spreadsheet_df):
+        return spreadsheet_df.astype(pd.SparseDtype(get_precision_dtype(run_parameters), 0))
+
+    return spreadsheet_df.astype(get_precision_dtype(run_parameters))
+
+
+def get_nmf_spreadsheet_df(spreadsheet_name_full_path, run_parameters):
+    """ read the spreadsheet of the nmf and cc_nmf methods: as sparse columns when "sparse_spreadsheet"
+        is true (see data_cache.get_sparse_spreadsheet_df), otherwise dense.
+
+    Args:
+        spreadsheet_name_full_path: full path name of the genes x samples spreadsheet.
+        run_parameters: parameter set dictionary with (optional) "sparse_spreadsheet" key.
+
+    Returns:
+        spreadsheet_df: genes x samples dataframe.
+    """
+
+    if 'sparse_spreadsheet' in run_parameters and run_parameters['sparse_spreadsheet']:
+        return data_cache.get_sparse_spreadsheet_df(spreadsheet_name_full_path, run_parameters)
+
+    return data_cache.get_spreadsheet_df(spreadsheet_name_full_path, run_parameters)
+
+
+def get_spreadsheet_matrix(spreadsheet_df):
+    """ the values of a spreadsheet dataframe: a scipy csc matrix for sparse columns, otherwise dense.
+
+    Args:
+        spreadsheet_df: genes x samples dataframe.
+
+    Returns:
+        spreadsheet_mat: genes x samples matrix.
+    """
+
+    if data_cache.is_sparse_df(spreadsheet_df):
+        return spreadsheet_df.sparse.to_coo().tocsc()
+
+    return spreadsheet_df.values
+
+
+def normalize_spreadsheet_matrix(spreadsheet_mat, run_parameters):
+    """ quantile normalize the spreadsheet columns (kn.get_quantile_norm_matrix) unless
+        "quantile_normalization" is false. Quantile normalization ranks every value, so a sparse
+        spreadsheet is made dense here, with a warning.
+
+    Args:
+        spreadsheet_mat: genes x samples (dense or scipy sparse) matrix.
+        run_parameters: parameter set dictionary with (optional) "quantile_normalization" key (default 1).
+
+    Returns:
+        spreadsheet_mat: the normalized dense matrix, or the matrix as given.
+    """
+    import warnings
+    import scipy.sparse as spar
+
+    if 'quantile_normalization' in run_parameters and not run_parameters['quantile_normalization']:
+        return spreadsheet_mat
+
+    if spar.issparse(spreadsheet_mat):
+        warnings.warn( 'quantile normalization makes the sparse spreadsheet dense (%d x %d); '
+                       'set quantile_normalization to 0 to keep it sparse.'%(spreadsheet_mat.shape), stacklevel=2 )
+        spreadsheet_mat = spreadsheet_mat.toarray()
+
+    return kn.get_quantile_norm_matrix(spreadsheet_mat)
+
+
+def set_network_precision(network_mat, lap_diag, lap_pos, run_parameters):
+    """ convert the network and its laplacian components to the run "precision" (left as read when not given).
+
+    Args:
+        network_mat: normalized genes x genes network matrix.
+        lap_diag: laplacian matrix component, L = lap_diag - lap_pos.
+        lap_pos: laplacian matrix component, L = lap_diag - lap_pos.
+        run_parameters: parameter set dictionary with (optional) "precision" key.
+
+    Returns:
+        network_mat, lap_diag, lap_pos: of the run precision.
+    """
+
+    if 'precision' not in run_parameters:
+        return network_mat, lap_diag, lap_pos
+
+    precision_dtype = get_precision_dtype(run_parameters)
+
+    return network_mat.astype(precision_dtype), lap_diag.astype(precision_dtype), lap_pos.astype(precision_dtype)
+
+
+def update_tmp_directory(run_parameters, tmp_dir):
+    """ Update tmp_directory value in rum_parameters dictionary
+
+    Args:
+        run_parameters: run_parameters as the dictionary config
+        tmp_dir: temporary directory prefix subjected to different functions
+
+    Returns:
+        run_parameters: an updated run_parameters
+    """
+
+    if (run_parameters['processing_method'] == 'distribute'):
+        run_parameters["tmp_directory"] = kn.create_dir(run_parameters['cluster_shared_volumn'], tmp_dir)
+    else:
+        run_parameters["tmp_directory"] = kn.create_dir(run_parameters["run_directory"], tmp_dir)
+
+    return run_parameters
+
+def form_consensus_matrix_graphic(consensus_matrix, k=3, run_parameters=None, sample_order=None):
+    """ reorder the consensus matrix for graphic display, in the order of the final clustering.
+
+    Args:
+        consensus_matrix: calculated consensus matrix in samples x samples order.
+        k: number of clusters estimate (inner diminsion k of factored h_matrix).
+        run_parameters: (optional) dictionary with the "final_clustering" keys (K-means when none).
+        sample_order: (optional) display order from cluster_consensus_matrix, to reuse instead of clustering again.
+
+    Returns:
+        cc_cm: consensus_matrix with rows and columns in the final clustering sort order.
+    """
+
+    if sample_order is None:
+        sample_order = cluster_consensus_matrix(consensus_matrix, k, run_parameters or {})[1]
+
+    cc_cm         = np.array(consensus_matrix)
+    sorted_labels = np.asarray(sample_order)
     cc_cm         = cc_cm[sorted_labels[:, None], sorted_labels]
 
     return cc_cm
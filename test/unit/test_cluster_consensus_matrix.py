@@ -0,0 +1,43 @@
+import unittest
+from unittest import TestCase
+import numpy as np
+from sklearn.metrics import adjusted_rand_score
+
+import samples_clustering_toolbox as sctbx
+
+
+class TestCluster_consensus_matrix(TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.labels           = np.random.randint(0, 4, 300)
+        self.consensus_matrix = 0.7 * (self.labels[:, None] == self.labels[None, :]) + 0.3 * np.random.rand(300, 300)
+        self.consensus_matrix = (self.consensus_matrix + self.consensus_matrix.T) / 2
+        np.fill_diagonal(self.consensus_matrix, 1)
+
+    def test_final_clusterings_recover_the_blocks(self):
+        for final_clustering in ['kmeans', 'spectral', 'minibatch_kmeans', 'hierarchical']:
+            labels, sample_order = sctbx.cluster_consensus_matrix(self.consensus_matrix, 4, {'final_clustering': final_clustering})
+            self.assertEqual(adjusted_rand_score(self.labels, labels), 1, msg=final_clustering)
+            self.assertEqual(sorted(sample_order), list(range(300)), msg=final_clustering)
+            self.assertEqual(np.count_nonzero(np.diff(labels[sample_order])), 3, msg=final_clustering)
+
+        self.assertRaises(ValueError, sctbx.cluster_consensus_matrix, self.consensus_matrix, 4, {'final_clustering': 'dbscan'})
+
+    def test_consensus_graph_keeps_the_strongest_neighbors(self):
+        consensus_graph = sctbx.get_consensus_graph(self.consensus_matrix, 5, block_rows=64)
+        self.assertEqual((consensus_graph != consensus_graph.T).nnz, 0)
+        self.assertEqual(consensus_graph.diagonal().sum(), 0)
+        self.assertTrue(np.all(consensus_graph.getnnz(axis=1) >= 5))
+
+        strongest = np.sort(np.where(np.eye(300, dtype=bool), -np.inf, self.consensus_matrix), axis=1)[:, -5:]
+        self.assertTrue(np.allclose(np.sort(consensus_graph.max(axis=1).toarray().ravel()), np.sort(strongest[:, -1])))
+
+    def test_graphic_reuses_the_sample_order(self):
+        labels, sample_order = sctbx.cluster_consensus_matrix(self.consensus_matrix, 4, {'final_clustering': 'hierarchical'})
+        graphic = sctbx.form_consensus_matrix_graphic(self.consensus_matrix, 4, sample_order=sample_order)
+        self.assertTrue(np.array_equal(graphic, self.consensus_matrix[np.ix_(sample_order, sample_order)]))
+        self.assertTrue(np.array_equal(graphic, sctbx.form_consensus_matrix_graphic(self.consensus_matrix, 4, {'final_clustering': 'hierarchical'})))
+
+
+if __name__ == '__main__':
+    unittest.main()
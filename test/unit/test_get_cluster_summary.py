@@ -0,0 +1,85 @@
+import os
+import unittest
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import knpackage.toolbox as kn
+
+import samples_clustering_toolbox as sctbx
+
+
+class TestGet_cluster_summary(TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.spreadsheet_mat = np.random.rand(40, 25) + 100
+        self.labels          = np.random.randint(1, 4, 25)
+
+    def test_summary_equals_masked_means(self):
+        spreadsheet_df   = pd.DataFrame(self.spreadsheet_mat)
+        expected_ave     = np.array([ spreadsheet_df.iloc[:, self.labels == i].mean(axis=1).values for i in np.unique(self.labels) ]).T
+        smooth_mat       = np.random.rand(40, 25)
+
+        for block_size in [1, 60, 2**18]:
+            cluster_averages, gene_variance = sctbx.get_cluster_summary(self.spreadsheet_mat, self.labels, block_size=block_size)
+            self.assertTrue(np.allclose(cluster_averages, expected_ave))
+            self.assertTrue(np.allclose(gene_variance, spreadsheet_df.var(axis=1).values, rtol=1e-12))
+
+            cluster_averages, gene_variance = sctbx.get_cluster_summary(self.spreadsheet_mat, self.labels, smooth_mat, block_size=block_size)
+            self.assertTrue(np.allclose(cluster_averages, expected_ave))
+            self.assertTrue(np.allclose(gene_variance, np.var(smooth_mat, axis=1, ddof=1)))
+
+        binary_mat       = (self.spreadsheet_mat < 100.2).astype(float)
+        sparse_summary   = sctbx.get_cluster_summary(sparse.csr_matrix(binary_mat), self.labels)
+        dense_summary    = sctbx.get_cluster_summary(binary_mat, self.labels)
+        self.assertTrue(np.allclose(sparse_summary[0], dense_summary[0]))
+        self.assertTrue(np.allclose(sparse_summary[1], dense_summary[1]))
+
+        offset_mat       = 1e8 + self.spreadsheet_mat
+        sparse_variance  = sctbx.get_cluster_summary(sparse.csr_matrix(offset_mat), self.labels)[1]
+        self.assertTrue(np.allclose(sparse_variance, np.var(offset_mat, axis=1, ddof=1), rtol=1e-12))
+
+    def test_integer_spreadsheet_averages_are_fractions(self):
+        binary_mat       = (self.spreadsheet_mat < 100.4).astype(np.int64)
+        spreadsheet_df   = pd.DataFrame(binary_mat)
+        expected_ave     = np.array([ spreadsheet_df.iloc[:, self.labels == i].mean(axis=1).values for i in np.unique(self.labels) ]).T
+
+        cluster_averages, gene_variance = sctbx.get_cluster_summary(binary_mat, self.labels, block_size=60)
+        self.assertEqual(cluster_averages.dtype, np.float64)
+        self.assertTrue(np.allclose(cluster_averages, expected_ave))
+        self.assertTrue(np.allclose(gene_variance, spreadsheet_df.var(axis=1).values))
+        self.assertGreater(np.count_nonzero((cluster_averages > 0) & (cluster_averages < 1)), 0)
+
+        top_gene_index   = sctbx.get_top_gene_index(cluster_averages, 7)
+        for cluster in range(3):
+            self.assertGreaterEqual(cluster_averages[top_gene_index[:, cluster], cluster].min(),
+                                    np.sort(expected_ave[:, cluster])[::-1][6])
+
+    def test_top_gene_index(self):
+        cluster_averages = sctbx.get_cluster_summary(self.spreadsheet_mat, self.labels)[0]
+        top_gene_index   = sctbx.get_top_gene_index(cluster_averages, 7)
+
+        self.assertEqual(top_gene_index.shape, (7, 3))
+        for cluster in range(3):
+            self.assertEqual(set(top_gene_index[:, cluster]), set(np.argsort(cluster_averages[:, cluster])[::-1][0:7]))
+        self.assertEqual(sctbx.get_top_gene_index(cluster_averages, 100).shape, (40, 3))
+
+    def test_saved_top_genes_are_float_flags(self):
+        run_parameters = { 'method': 'nmf', 'top_number_of_genes': 7
+                         , 'results_directory': kn.create_dir('.', 'tmp_cluster_summary') }
+        spreadsheet_df = pd.DataFrame(self.spreadsheet_mat, index=['gene_%02d'%(row) for row in range(40)])
+        try:
+            sctbx.save_spreadsheet_and_variance_heatmap(spreadsheet_df, self.labels, run_parameters)
+            file_name = [ file_name for file_name in os.listdir(run_parameters['results_directory'])
+                          if file_name.startswith('top_genes_by_cluster') ][0]
+            with open(os.path.join(run_parameters['results_directory'], file_name)) as file_handle:
+                values = [ line.rstrip('\n').split('\t')[1:] for line in file_handle ][1:]
+        finally:
+            kn.remove_dir(run_parameters['results_directory'])
+
+        self.assertEqual(set(value for row in values for value in row), {'0.0', '1.0'})
+        self.assertEqual([ row[0] for row in values ].count('1.0'), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
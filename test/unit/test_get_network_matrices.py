@@ -0,0 +1,48 @@
+import os
+import shutil
+import unittest
+from unittest import TestCase
+import numpy as np
+import knpackage.toolbox as kn
+
+import data_cache_toolbox as data_cache
+
+
+class TestGet_network_matrices(TestCase):
+    def setUp(self):
+        self.cache_directory = kn.create_dir('.', 'tmp_network_cache')
+        self.network_name    = os.path.join(self.cache_directory, 'test.edge')
+        np.random.seed(0)
+        with open(self.network_name, 'w') as fh:
+            for node_1, node_2 in np.random.randint(0, 30, (80, 2)):
+                if node_1 != node_2:
+                    fh.write('G%02d\tG%02d\t1\tedge\n'%(node_1, node_2))
+        self.run_parameters = {'network_cache_directory': self.cache_directory}
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_directory)
+
+    def test_cached_network_equals_parsed_network(self):
+        parsed = data_cache.get_network_matrices(self.network_name, {})
+        saved  = data_cache.get_network_matrices(self.network_name, self.run_parameters)
+        cached = data_cache.get_network_matrices(self.network_name, self.run_parameters)
+
+        for matrices in [saved, cached]:
+            self.assertEqual(matrices[1], parsed[1])
+            for index in [0, 2, 3]:
+                self.assertEqual(abs(matrices[index] - parsed[index]).toarray().max(), 0)
+
+        self.assertFalse(cached[0].data.flags.writeable, msg="cached network is not memory-mapped")
+
+    def test_changed_network_is_parsed_again(self):
+        data_cache.get_network_matrices(self.network_name, self.run_parameters)
+        with open(self.network_name, 'a') as fh:
+            fh.write('G98\tG99\t1\tedge\n')
+        network_mat, unique_gene_names, lap_diag, lap_pos = data_cache.get_network_matrices(self.network_name, self.run_parameters)
+
+        self.assertIn('G99', unique_gene_names)
+        self.assertEqual(network_mat.shape[0], len(unique_gene_names))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+from unittest import TestCase
+import numpy as np
+from sklearn.metrics import silhouette_samples, pairwise_distances
+
+import samples_clustering_toolbox as sctbx
+
+
+class TestGet_silhouette_samples(TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.feature_matrix = np.random.rand(61, 40)
+        self.labels         = np.random.randint(0, 3, 61)
+        self.labels[7]      = 3
+
+    def test_blocks_match_precomputed_distances(self):
+        expected = silhouette_samples(pairwise_distances(self.feature_matrix), self.labels, metric='precomputed')
+
+        for silhouette_working_memory in [1024, 0.01, 0.0001]:
+            run_parameters = {'silhouette_working_memory': silhouette_working_memory}
+            silhouette_values = sctbx.get_silhouette_samples(self.feature_matrix, self.labels, run_parameters)
+            self.assertTrue(np.allclose(silhouette_values, expected, rtol=0, atol=1e-12))
+
+        self.assertEqual(silhouette_values[7], 0)
+
+    def test_bad_working_memory(self):
+        self.assertRaises(ValueError, sctbx.get_silhouette_samples,
+                          self.feature_matrix, self.labels, {'silhouette_working_memory': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
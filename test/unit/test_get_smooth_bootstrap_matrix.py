@@ -0,0 +1,41 @@
+import unittest
+from unittest import TestCase
+import numpy as np
+from scipy import sparse
+import knpackage.toolbox as kn
+
+import sample_clustering_toolbox_research_module as tstdata
+import samples_clustering_toolbox as sctbx
+
+
+class TestGet_smooth_bootstrap_matrix(TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.run_parameters = tstdata.get_test_paramters_dictionary()
+        self.network_mat    = kn.normalize_sparse_mat_by_diagonal(
+                                  sparse.csr_matrix(tstdata.synthesize_random_network(40, 120)))
+        self.spreadsheet_mat = np.random.rand(40, 25)
+
+    def tearDown(self):
+        del self.run_parameters
+
+    def test_column_sample_of_smoothed_spreadsheet(self):
+        self.run_parameters['rows_sampling_fraction'] = 1.0
+        smooth_spreadsheet_mat, iterations = kn.smooth_matrix_with_rwr(self.spreadsheet_mat, self.network_mat, self.run_parameters)
+        smooth_bootstrap_mat = sctbx.get_smooth_bootstrap_matrix(smooth_spreadsheet_mat, self.run_parameters)
+        self.assertIs(smooth_bootstrap_mat, smooth_spreadsheet_mat)
+
+        np.random.seed(3)
+        sample_mat, sample_permutation = kn.sample_a_matrix(self.spreadsheet_mat, 1.0, 0.8)
+        smooth_sample_mat, iterations = kn.smooth_matrix_with_rwr(sample_mat, self.network_mat, self.run_parameters)
+
+        self.assertTrue(np.allclose(smooth_bootstrap_mat[:, sample_permutation], smooth_sample_mat,
+                                    atol=self.run_parameters['rwr_convergence_tolerence']))
+
+    def test_rows_sampling_smooths_each_sample(self):
+        self.run_parameters['rows_sampling_fraction'] = 0.8
+        self.assertIsNone(sctbx.get_smooth_bootstrap_matrix(self.spreadsheet_mat, self.run_parameters))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+import unittest
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+import knpackage.toolbox as kn
+
+import data_cache_toolbox as data_cache
+
+
+class TestGet_spreadsheet_df(TestCase):
+    def setUp(self):
+        self.cache_directory = kn.create_dir('.', 'tmp_spreadsheet_cache')
+        self.run_parameters  = {'spreadsheet_cache_directory': self.cache_directory}
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_directory)
+
+    def get_cached_spreadsheet_df(self, spreadsheet_df):
+        spreadsheet_name = os.path.join(self.cache_directory, 'spreadsheet.tsv')
+        spreadsheet_df.to_csv(spreadsheet_name, sep='\t')
+
+        parsed_df = kn.get_spreadsheet_df(spreadsheet_name)
+        data_cache.get_spreadsheet_df(spreadsheet_name, self.run_parameters)
+        cached_df = data_cache.get_spreadsheet_df(spreadsheet_name, self.run_parameters)
+        pd.testing.assert_frame_equal(cached_df, parsed_df)
+
+        return cached_df
+
+    def test_numeric_spreadsheet_is_memory_mapped(self):
+        spreadsheet_df = pd.DataFrame(np.random.rand(20, 6), index=['gene_%d'%(row) for row in range(20)],
+                                      columns=['sample_%d'%(column) for column in range(6)])
+        cached_df = self.get_cached_spreadsheet_df(spreadsheet_df)
+        self.assertFalse(cached_df.values.flags.writeable, msg='cached spreadsheet is not memory-mapped')
+
+    def test_mixed_phenotype_spreadsheet(self):
+        phenotype_df = pd.DataFrame({ 'grade': ['G1', np.nan, 'G3', 'G2']
+                                    , 'age'  : [61, 45, 70, 52]
+                                    , 'score': [0.5, np.nan, 1.5, 2.0] }, index=['s1', 's2', 's3', 's4'])
+        phenotype_df.index.name = 'sample_id'
+        self.get_cached_spreadsheet_df(phenotype_df)
+
+    def test_network_spreadsheet_equals_reindexed_spreadsheet(self):
+        spreadsheet_name = os.path.join(self.cache_directory, 'spreadsheet.tsv')
+        pd.DataFrame(np.random.randint(0, 2, (40, 5)), index=['gene_%02d'%(row) for row in range(40)],
+                     columns=['sample_%d'%(column) for column in range(5)]).to_csv(spreadsheet_name, sep='\t')
+        unique_gene_names = sorted(['gene_%02d'%(row) for row in range(0, 60, 3)])
+
+        reindexed_df = kn.update_spreadsheet_df(kn.get_spreadsheet_df(spreadsheet_name), unique_gene_names)
+        for run_parameters in [{'spreadsheet_chunk_size': 7}, {}, self.run_parameters]:
+            network_df = data_cache.get_network_spreadsheet_df(spreadsheet_name, unique_gene_names, run_parameters)
+            pd.testing.assert_frame_equal(network_df, reindexed_df)
+
+    def test_network_spreadsheet_duplicate_genes(self):
+        spreadsheet_name = os.path.join(self.cache_directory, 'spreadsheet.tsv')
+        pd.DataFrame(np.random.rand(4, 2), index=['g1', 'g2', 'g3', 'g1']).to_csv(spreadsheet_name, sep='\t')
+
+        self.assertRaises(ValueError, data_cache.get_network_spreadsheet_df, spreadsheet_name, ['g1', 'g2'], {'spreadsheet_chunk_size': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
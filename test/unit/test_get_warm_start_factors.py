@@ -0,0 +1,56 @@
+import unittest
+from unittest import TestCase
+import numpy as np
+import knpackage.toolbox as kn
+
+import sample_clustering_toolbox_research_module as tstdata
+import samples_clustering_toolbox as sctbx
+
+
+class TestGet_warm_start_factors(TestCase):
+    def setUp(self):
+        self.run_parameters = tstdata.get_test_paramters_dictionary()
+        self.run_parameters['tmp_directory'     ] = kn.create_dir('.', 'tmp_warm_start')
+        self.run_parameters['nmf_initialization'] = 'warm'
+        self.spreadsheet_mat = np.repeat(tstdata.get_wide_3_cluster_spreadsheet(4), 10, axis=0) + 0.01
+        sctbx.prepare_nmf_warm_start(self.spreadsheet_mat, self.run_parameters)
+
+    def tearDown(self):
+        kn.remove_dir(self.run_parameters['tmp_directory'])
+        del self.run_parameters
+
+    def test_factors_restricted_to_sampled_columns(self):
+        w_matrix, h_matrix   = sctbx.get_warm_start_factors(np.arange(12), self.run_parameters)
+        sample_permutation   = np.array([7, 0, 3, 11])
+        w_sample, h_sample   = sctbx.get_warm_start_factors(sample_permutation, self.run_parameters)
+
+        self.assertTrue(np.array_equal(w_sample, w_matrix))
+        self.assertTrue(np.array_equal(h_sample, h_matrix[:, sample_permutation]))
+
+    def test_jitter_is_seeded(self):
+        self.run_parameters['nmf_warm_start_jitter'] = 0.1
+        np.random.seed(5)
+        w_first, h_first   = sctbx.get_warm_start_factors(np.arange(12), self.run_parameters)
+        np.random.seed(5)
+        w_second, h_second = sctbx.get_warm_start_factors(np.arange(12), self.run_parameters)
+
+        self.assertTrue(np.array_equal(w_first, w_second) and np.array_equal(h_first, h_second))
+        self.assertTrue(np.all(w_first > 0) and np.all(h_first >= 0))
+
+    def test_warm_bootstrap_converges_at_invariance(self):
+        self.run_parameters['rows_sampling_fraction'] = 1.0
+        for sample in range(3):
+            sctbx.run_cc_nmf_clusters_worker(self.spreadsheet_mat, self.run_parameters, sample)
+
+        records = sctbx.read_nmf_convergence_records(self.run_parameters['tmp_directory'])
+        self.assertEqual(sorted(record[0] for record in records), [0, 1, 2])
+        for record in records:
+            self.assertEqual(record[1], self.run_parameters['nmf_max_invariance'])
+
+    def test_bad_initialization(self):
+        self.run_parameters['nmf_initialization'] = 'hot'
+        self.assertRaises(ValueError, sctbx.get_warm_start_factors, np.arange(12), self.run_parameters)
+
+
+if __name__ == '__main__':
+    unittest.main()
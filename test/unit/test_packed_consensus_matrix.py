@@ -0,0 +1,98 @@
+import os
+import unittest
+import warnings
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+import knpackage.toolbox as kn
+
+import consensus_storage_toolbox as consensus_storage
+import samples_clustering_toolbox as sctbx
+
+
+class TestPacked_consensus_matrix(TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.clusterings    = [ (np.random.randint(0, 3, 30), np.random.permutation(40)[0:30]) for bootstrap in range(6) ]
+        self.run_parameters = { 'number_of_clusters'  : 3
+                              , 'number_of_bootstraps': 6
+                              , 'processing_method'   : 'serial'
+                              , 'consensus_storage'   : 'packed'
+                              , 'results_directory'   : kn.create_dir('.', 'tmp_packed_consensus') }
+
+        linkage_matrix,   \
+        indicator_matrix  = sctbx.initialize_consensus_matrices(40, {})
+        linkage_matrix,   \
+        indicator_matrix  = sctbx.update_consensus_matrices(self.clusterings, linkage_matrix, indicator_matrix, block_size=100)
+        self.dense_consensus = sctbx.form_consensus_matrix({'processing_method': 'serial'}, linkage_matrix, indicator_matrix)
+
+    def tearDown(self):
+        kn.remove_dir(self.run_parameters['results_directory'])
+
+    def get_packed_consensus(self):
+        linkage_matrix,   \
+        indicator_matrix  = sctbx.initialize_consensus_matrices(40, self.run_parameters)
+        self.assertEqual(indicator_matrix.dtype, np.uint16)
+        self.assertEqual(indicator_matrix.shape, (40 * 41 // 2,))
+        linkage_matrix,   \
+        indicator_matrix  = sctbx.update_consensus_matrices(self.clusterings, linkage_matrix, indicator_matrix, block_size=100)
+
+        return sctbx.form_consensus_matrix(self.run_parameters, linkage_matrix, indicator_matrix)
+
+    def test_packed_consensus_equals_dense_consensus(self):
+        packed_consensus = self.get_packed_consensus()
+        packed_consensus.block_size = 100
+
+        self.assertTrue(np.array_equal(np.asarray(packed_consensus), self.dense_consensus))
+        self.assertTrue(np.array_equal(packed_consensus[7:19], self.dense_consensus[7:19]))
+        self.assertTrue(np.array_equal(packed_consensus.diagonal(), np.diagonal(self.dense_consensus)))
+
+        x_matrix = np.random.rand(40, 3)
+        self.assertTrue(np.allclose(packed_consensus.matmat(x_matrix), self.dense_consensus.dot(x_matrix)))
+        self.assertTrue(np.allclose(packed_consensus.matvec(x_matrix[:, 0]), self.dense_consensus.dot(x_matrix[:, 0])))
+        self.assertTrue(np.allclose(packed_consensus.get_condensed_distances(), sctbx.get_consensus_dendrogram(self.dense_consensus)[1]))
+        self.assertAlmostEqual(consensus_storage.get_packed_mean(packed_consensus.values, 40), np.mean(self.dense_consensus))
+
+    def test_sparsified_consensus_keeps_values_above_threshold(self):
+        self.run_parameters['consensus_threshold'] = 0.5
+        sparse_consensus = self.get_packed_consensus()
+
+        self.assertTrue(sparse_consensus.is_sparse())
+        self.assertTrue(np.array_equal(np.asarray(sparse_consensus), np.where(self.dense_consensus >= 0.5, self.dense_consensus, 0)))
+        self.assertTrue(np.allclose(sparse_consensus.get_condensed_distances(),
+                                    sctbx.get_consensus_dendrogram(np.where(self.dense_consensus >= 0.5, self.dense_consensus, 0))[1]))
+
+    def test_saved_packed_consensus_equals_dense_consensus(self):
+        packed_consensus = self.get_packed_consensus()
+        packed_consensus.block_size = 100
+        sample_names     = pd.Index(['sample_%d'%(column) for column in range(40)])
+        tmp_dir          = self.run_parameters['results_directory']
+
+        pd.DataFrame(data=self.dense_consensus, columns=sample_names, index=sample_names).to_csv(
+            os.path.join(tmp_dir, 'dense.tsv'), sep='\t', float_format='%g')
+        packed_consensus.save_tsv(os.path.join(tmp_dir, 'packed.tsv'), sample_names)
+        with open(os.path.join(tmp_dir, 'dense.tsv')) as dense_file, open(os.path.join(tmp_dir, 'packed.tsv')) as packed_file:
+            self.assertEqual(packed_file.read(), dense_file.read())
+
+        for consensus_matrix in [packed_consensus, packed_consensus.sparsify(0.3)]:
+            consensus_matrix.save_npz(os.path.join(tmp_dir, 'consensus.npz'), sample_names)
+            read_back, read_names = consensus_storage.load_npz(os.path.join(tmp_dir, 'consensus.npz'))
+            self.assertTrue(np.array_equal(read_names, sample_names))
+            self.assertTrue(np.array_equal(np.asarray(read_back), np.asarray(consensus_matrix)))
+
+    def test_kmeans_of_packed_consensus_warns(self):
+        packed_consensus = self.get_packed_consensus()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            labels = sctbx.cluster_consensus_matrix(packed_consensus, 3, {})[0]
+            self.assertEqual(len(caught), 1)
+            sctbx.cluster_consensus_matrix(packed_consensus, 3, {'final_clustering': 'minibatch_kmeans'})
+            self.assertEqual(len(caught), 1)
+        self.assertTrue(np.array_equal(labels, sctbx.cluster_consensus_matrix(self.dense_consensus, 3, {})[0]))
+
+    def test_consensus_storage_bad_value(self):
+        self.assertRaises(ValueError, sctbx.is_consensus_packed, {'consensus_storage': 'triangle'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+from unittest import TestCase
+import numpy as np
+from scipy import sparse
+from scipy.optimize import nnls
+import knpackage.toolbox as kn
+
+import sample_clustering_toolbox_research_module as tstdata
+import samples_clustering_toolbox as sctbx
+
+
+class TestPerform_nmf_with_solver(TestCase):
+    def setUp(self):
+        self.run_parameters  = tstdata.get_test_paramters_dictionary()
+        np.random.seed(0)
+        self.spreadsheet_mat = np.repeat(tstdata.get_wide_3_cluster_spreadsheet(3), 10, axis=0) + 0.01
+        network_mat          = sparse.csr_matrix(tstdata.synthesize_random_network(self.spreadsheet_mat.shape[0], 20))
+        self.lap_diag,       \
+        self.lap_pos         = kn.form_network_laplacian_matrix(network_mat)
+
+    def tearDown(self):
+        del self.run_parameters
+
+    def test_multiplicative_equals_kn(self):
+        np.random.seed(1)
+        kn_h_mat = kn.perform_nmf(self.spreadsheet_mat, self.run_parameters)
+        np.random.seed(1)
+        kn_net_h_mat = kn.perform_net_nmf(self.spreadsheet_mat, self.lap_pos, self.lap_diag, self.run_parameters)
+
+        self.run_parameters['nmf_solver'] = 'multiplicative'
+        np.random.seed(1)
+        h_mat, iterations, seconds = sctbx.perform_nmf_with_solver(self.spreadsheet_mat, self.run_parameters)
+        self.assertTrue(np.array_equal(h_mat, kn_h_mat))
+        self.assertTrue(0 < iterations < self.run_parameters['nmf_max_iterations'])
+
+        np.random.seed(1)
+        h_mat, iterations, seconds = sctbx.perform_nmf_with_solver(self.spreadsheet_mat, self.run_parameters,
+                                                                   self.lap_diag, self.lap_pos)
+        self.assertTrue(np.array_equal(h_mat, kn_net_h_mat))
+
+    def test_solvers_find_the_clusters(self):
+        expected = np.argmax(tstdata.get_wide_3_cluster_spreadsheet(3), 0)
+
+        for nmf_solver in ['hals', 'anls_bpp']:
+            self.run_parameters['nmf_solver'] = nmf_solver
+            np.random.seed(1)
+            h_mat, iterations, seconds = sctbx.perform_nmf_with_solver(self.spreadsheet_mat, self.run_parameters)
+            self.assertTrue(tstdata.sets_a_eq_b(np.argmax(h_mat, 0), expected), msg=nmf_solver)
+            self.assertTrue(iterations < self.run_parameters['nmf_max_iterations'])
+
+    def test_batched_bootstraps_equal_single(self):
+        self.run_parameters['tmp_directory'] = kn.create_dir('.', 'tmp_batched_nmf')
+        spreadsheet_mat = np.random.rand(40, 30)
+        try:
+            for nmf_solver in [None, 'hals', 'anls_bpp']:
+                if nmf_solver is not None:
+                    self.run_parameters['nmf_solver'] = nmf_solver
+                clusterings = sctbx.run_cc_nmf_clusters_batch_worker(spreadsheet_mat, self.run_parameters, [3, 4, 5])
+
+                for sample, (cluster_id, sample_permutation) in zip([3, 4, 5], clusterings):
+                    single_cluster_id, single_permutation = sctbx.run_cc_nmf_clusters_worker(spreadsheet_mat, self.run_parameters, sample)
+                    self.assertTrue(np.array_equal(cluster_id, single_cluster_id), msg=nmf_solver)
+                    self.assertTrue(np.array_equal(sample_permutation, single_permutation))
+        finally:
+            kn.remove_dir(self.run_parameters['tmp_directory'])
+
+    def test_bootstrap_batches(self):
+        self.assertEqual(sctbx.get_bootstrap_batches(range(7), 3), [[0, 1, 2], [3, 4, 5], [6]])
+        self.run_parameters['bootstrap_batch_size'] = 0
+        self.assertRaises(ValueError, sctbx.get_bootstrap_batch_size, self.run_parameters)
+
+    def test_bad_solver(self):
+        self.run_parameters['nmf_solver'] = 'als'
+        self.assertRaises(ValueError, sctbx.perform_nmf_with_solver, self.spreadsheet_mat, self.run_parameters)
+
+    def test_bpp_equals_nnls(self):
+        np.random.seed(0)
+        c_mat = np.random.rand(50, 5)
+        b_mat = np.random.randn(50, 40)
+        x_mat = sctbx.solve_nnls_with_bpp(c_mat.T.dot(c_mat), c_mat.T.dot(b_mat))
+
+        for column in range(b_mat.shape[1]):
+            self.assertTrue(np.allclose(x_mat[:, column], nnls(c_mat, b_mat[:, column])[0]))
+
+    def test_network_hals_update_does_not_increase_the_objective(self):
+        def get_objective(w_stack, h_stack):
+            w_mat = w_stack[0]
+            return np.linalg.norm(x_stack[0] - w_mat.dot(h_stack[0]))**2 \
+                 + penalty * np.trace(w_mat.T.dot((self.lap_diag - self.lap_pos).dot(w_mat)))
+
+        penalty  = 10.
+        x_stack  = self.spreadsheet_mat[np.newaxis]
+        w_stack  = np.random.rand(1, x_stack.shape[1], 3)
+        h_stack  = np.random.rand(1, 3, x_stack.shape[2])
+        for genes, lap_rows in sctbx.get_laplacian_blocks(self.lap_pos):
+            self.assertEqual(self.lap_pos[genes][:, genes].nnz, 0)
+        self.assertEqual(sorted(np.concatenate([ genes for genes, lap_rows in sctbx.get_laplacian_blocks(self.lap_pos) ])),
+                         list(range(x_stack.shape[1])))
+
+        objective = get_objective(w_stack, h_stack)
+        for iteration in range(20):
+            w_stack        = sctbx.update_w_matrix_hals(x_stack, w_stack, h_stack, self.lap_diag, self.lap_pos, penalty)
+            next_objective = get_objective(w_stack, h_stack)
+            self.assertLessEqual(next_objective, objective * (1 + 1e-12))
+            objective      = next_objective
+            h_stack        = np.random.rand(1, 3, x_stack.shape[2])
+            objective      = get_objective(w_stack, h_stack)
+
+
+if __name__ == '__main__':
+    unittest.main()
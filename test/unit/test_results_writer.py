@@ -0,0 +1,153 @@
+import os
+import gzip
+import importlib.util
+import unittest
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import knpackage.toolbox as kn
+
+import consensus_storage_toolbox as consensus_storage
+import data_cache_toolbox as data_cache
+import results_writer_toolbox as results_writer
+import samples_clustering_toolbox as sctbx
+
+
+class TestResults_writer(TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.tmp_dir   = kn.create_dir('.', 'tmp_results_writer')
+        self.result_df = pd.DataFrame(np.random.rand(25, 7), index=['gene_%02d'%(row) for row in range(25)],
+                                      columns=['sample_%d'%(column) for column in range(7)])
+
+    def tearDown(self):
+        kn.remove_dir(self.tmp_dir)
+
+    def read_text(self, file_name):
+        file_name = os.path.join(self.tmp_dir, file_name)
+        if file_name.endswith('.gz'):
+            with gzip.open(file_name, 'rt') as file_handle:
+                return file_handle.read()
+        with open(file_name) as file_handle:
+            return file_handle.read()
+
+    def test_chunked_tsv_equals_tsv(self):
+        self.result_df.to_csv(os.path.join(self.tmp_dir, 'result.tsv'), sep='\t', float_format='%g')
+        for compress, parallelism in [(False, 1), (False, 2), (True, 1), (True, 3)]:
+            file_name = 'chunked.tsv.gz' if compress else 'chunked.tsv'
+            results_writer.save_tsv_chunks(results_writer.get_row_chunk_dfs(self.result_df, chunk_size=30),
+                                           os.path.join(self.tmp_dir, file_name), '%g', compress, parallelism)
+            self.assertEqual(self.read_text(file_name), self.read_text('result.tsv'), msg=file_name)
+
+    def test_npz_df_read_back(self):
+        sparse_df = data_cache.get_sparse_df(sparse.csr_matrix(self.result_df.values * (self.result_df.values < 0.2)),
+                                             self.result_df.index, self.result_df.columns)
+        for result_df in [self.result_df, sparse_df]:
+            results_writer.save_df(result_df, os.path.join(self.tmp_dir, 'result.npz'), {'output_format': 'npz'})
+            read_back = results_writer.load_npz_df(os.path.join(self.tmp_dir, 'result.npz'))
+            self.assertTrue(np.array_equal(read_back.values, np.asarray(result_df.values, dtype=float)))
+            self.assertEqual(list(read_back.index), list(result_df.index))
+            self.assertEqual(list(read_back.columns), list(result_df.columns))
+
+    def test_packed_consensus_read_back(self):
+        consensus_matrix = np.random.rand(12, 12)
+        consensus_matrix = (consensus_matrix + consensus_matrix.T) / 2
+        packed_values    = consensus_matrix[np.triu_indices(12)]
+        packed_consensus = consensus_storage.PackedConsensusMatrix(packed_values, 12, block_size=40)
+        sample_names     = pd.Index(['sample_%d'%(column) for column in range(12)])
+
+        results_writer.save_consensus_df(consensus_matrix, sample_names, os.path.join(self.tmp_dir, 'dense.tsv'), {})
+        for output_format in ['tsv', 'tsv.gz']:
+            file_name = 'packed.' + output_format
+            results_writer.save_consensus_df(packed_consensus, sample_names, os.path.join(self.tmp_dir, file_name),
+                                             {'output_format': output_format, 'output_parallelism': 2})
+            self.assertEqual(self.read_text(file_name), self.read_text('dense.tsv'))
+
+        results_writer.save_consensus_df(packed_consensus, sample_names, os.path.join(self.tmp_dir, 'packed.npz'), {'output_format': 'npz'})
+        self.assertTrue(np.array_equal(results_writer.load_npz_df(os.path.join(self.tmp_dir, 'packed.npz')).values, consensus_matrix))
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'parquet and feather need pyarrow')
+    def test_packed_consensus_arrow_read_back(self):
+        consensus_matrix = np.random.rand(12, 12)
+        consensus_matrix = (consensus_matrix + consensus_matrix.T) / 2
+        packed_consensus = consensus_storage.PackedConsensusMatrix(consensus_matrix[np.triu_indices(12)], 12, block_size=40)
+        sample_names     = pd.Index(['sample_%d'%(column) for column in range(12)])
+        consensus_df     = pd.DataFrame(consensus_matrix, columns=sample_names, index=sample_names)
+        self.assertGreater(packed_consensus.shape[0] // packed_consensus.get_block_rows(), 1)
+
+        results_writer.save_consensus_df(packed_consensus, sample_names, os.path.join(self.tmp_dir, 'packed.parquet'), {'output_format': 'parquet'})
+        pd.testing.assert_frame_equal(pd.read_parquet(os.path.join(self.tmp_dir, 'packed.parquet')), consensus_df)
+
+        results_writer.save_consensus_df(packed_consensus, sample_names, os.path.join(self.tmp_dir, 'packed.feather'), {'output_format': 'feather'})
+        pd.testing.assert_frame_equal(pd.read_feather(os.path.join(self.tmp_dir, 'packed.feather')), consensus_df.reset_index())
+
+    def test_consensus_in_cluster_order(self):
+        consensus_matrix = np.random.rand(12, 12)
+        consensus_matrix = (consensus_matrix + consensus_matrix.T) / 2
+        packed_consensus = consensus_storage.PackedConsensusMatrix(consensus_matrix[np.triu_indices(12)], 12, block_size=40)
+        sample_names     = pd.Index(['sample_%d'%(column) for column in range(12)])
+        sample_order     = np.random.permutation(12)
+
+        ordered_df       = pd.DataFrame(sctbx.form_consensus_matrix_graphic(consensus_matrix, sample_order=sample_order),
+                                        columns=sample_names[sample_order], index=sample_names[sample_order])
+        ordered_df.to_csv(os.path.join(self.tmp_dir, 'ordered.tsv'), sep='\t', float_format='%g')
+        for consensus, output_format, parallelism in [(consensus_matrix, 'tsv', 1), (packed_consensus, 'tsv', 1), (packed_consensus, 'tsv.gz', 2)]:
+            file_name = 'consensus.' + output_format
+            results_writer.save_consensus_df(consensus, sample_names, os.path.join(self.tmp_dir, file_name),
+                                             {'output_format': output_format, 'output_parallelism': parallelism}, sample_order=sample_order)
+            self.assertEqual(self.read_text(file_name), self.read_text('ordered.tsv'))
+
+    def test_background_writer_flushes_and_reports_errors(self):
+        run_parameters = {'output_writers': 2, 'results_directory': self.tmp_dir, 'method': 'cc_nmf'}
+        writer_state   = results_writer.start_results_writer(run_parameters)
+        file_names     = [ os.path.join(self.tmp_dir, 'result_%d.tsv'%(number)) for number in range(6) ]
+        for file_name in file_names:
+            results_writer.submit_result(writer_state, file_name, results_writer.save_df, self.result_df, file_name, run_parameters)
+            self.assertLessEqual(len(writer_state['pending']), 4)
+        results_writer.wait_for_result(writer_state, file_names[0])
+        self.assertTrue(os.path.isfile(file_names[0]))
+
+        bad_name = os.path.join(self.tmp_dir, 'missing_directory', 'result.tsv')
+        results_writer.submit_result(writer_state, bad_name, results_writer.save_text, bad_name, 'text')
+        self.assertRaises(FileNotFoundError, results_writer.stop_results_writer, writer_state, run_parameters)
+
+        for file_name in file_names:
+            self.assertEqual(self.read_text(os.path.basename(file_name)), self.result_df.to_csv(sep='\t'))
+        timings_name = [ file_name for file_name in os.listdir(self.tmp_dir) if file_name.startswith('output_timings_cc_nmf') ]
+        timings_df   = pd.read_csv(os.path.join(self.tmp_dir, timings_name[0]), sep='\t')
+        self.assertEqual(sorted(timings_df['file_name']), sorted(['result.tsv'] + [ os.path.basename(name) for name in file_names ]))
+        self.assertEqual(list(timings_df['status'] == 'ok').count(False), 1)
+
+    def test_background_writer_with_output_parallelism(self):
+        run_parameters = {'output_writers': 1, 'output_format': 'tsv.gz', 'output_parallelism': 2,
+                          'results_directory': self.tmp_dir, 'method': 'cc_nmf'}
+        writer_state   = results_writer.start_results_writer(run_parameters)
+        file_name      = os.path.join(self.tmp_dir, 'result.tsv.gz')
+        results_writer.submit_result(writer_state, file_name, results_writer.save_df, self.result_df, file_name, run_parameters)
+        results_writer.stop_results_writer(writer_state, run_parameters)
+
+        self.assertEqual(self.read_text('result.tsv.gz'), self.result_df.to_csv(sep='\t'))
+
+    def test_convergence_outputs_are_timed(self):
+        run_parameters = { 'output_writers': 1, 'results_directory': self.tmp_dir, 'method': 'cc_nmf'
+                         , 'bootstrap_convergence': [[4, 0.1, 0.2], [8, 0.01, 0.0]] }
+        writer_state   = results_writer.start_results_writer(run_parameters)
+        sctbx.save_bootstrap_convergence(run_parameters, writer_state)
+        results_writer.stop_results_writer(writer_state, run_parameters)
+
+        timings_name = [ file_name for file_name in os.listdir(self.tmp_dir) if file_name.startswith('output_timings_cc_nmf') ]
+        timings_df   = pd.read_csv(os.path.join(self.tmp_dir, timings_name[0]), sep='\t')
+        self.assertEqual(len(timings_df), 1)
+        self.assertTrue(timings_df['file_name'][0].startswith('bootstrap_convergence_cc_nmf'))
+        self.assertEqual(len(pd.read_csv(os.path.join(self.tmp_dir, timings_df['file_name'][0]), sep='\t')), 2)
+
+    def test_output_format_bad_value(self):
+        self.assertEqual(results_writer.get_output_type_suffix({}), 'tsv')
+        self.assertRaises(ValueError, results_writer.get_output_format, {'output_format': 'xlsx'})
+        self.assertRaises(ValueError, results_writer.get_output_parallelism, {'output_parallelism': 0})
+        self.assertRaises(ValueError, sctbx.get_consensus_matrix_order, {'consensus_matrix_order': 'labels'})
+
+
+if __name__ == '__main__':
+    unittest.main()
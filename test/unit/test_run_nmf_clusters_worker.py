@@ -4,7 +4,7 @@ import numpy as np
 import knpackage.toolbox as kn
 
 import sample_clustering_toolbox_research_module as tstdata
-import sample_clustering_toolbox as sctbx
+import samples_clustering_toolbox as sctbx
 
 
 class TestRun_nmf_clusters_worker(TestCase):
@@ -18,6 +18,16 @@ class TestRun_nmf_clusters_worker(TestCase):
         kn.remove_dir(self.run_parameters["tmp_directory"])
         del self.run_parameters
 
+    def get_consensus_matrix(self, spreadsheet_mat):
+        linkage_matrix = np.zeros((spreadsheet_mat.shape[1], spreadsheet_mat.shape[1]))
+        indicator_matrix = np.zeros((spreadsheet_mat.shape[1], spreadsheet_mat.shape[1]))
+
+        for sample in range(0, int(self.run_parameters['number_of_bootstraps'])):
+            clustering = sctbx.run_cc_nmf_clusters_worker(spreadsheet_mat, self.run_parameters, sample)
+            linkage_matrix, indicator_matrix = sctbx.update_consensus_matrices([clustering], linkage_matrix, indicator_matrix)
+
+        return sctbx.form_consensus_matrix(self.run_parameters, linkage_matrix, indicator_matrix)
+
     def test_run_nmf_clusters_worker(self):
         self.run_parameters['number_of_bootstraps'] = 10
         self.run_parameters['method'] = self.run_parameters['method_1']
@@ -26,12 +36,7 @@ class TestRun_nmf_clusters_worker(TestCase):
         spreadsheet_consensus_mat = tstdata.get_square_3_cluster_spreadsheet(cluster_rows)
         spreadsheet_mat = tstdata.get_wide_3_cluster_spreadsheet(cluster_rows)
 
-        for sample in range(0, int(self.run_parameters['number_of_bootstraps'])):
-            sctbx.run_cc_nmf_clusters_worker(spreadsheet_mat, self.run_parameters, sample)
-
-        linkage_matrix = np.zeros((spreadsheet_mat.shape[1], spreadsheet_mat.shape[1]))
-        indicator_matrix = np.zeros((spreadsheet_mat.shape[1], spreadsheet_mat.shape[1]))
-        consensus_matrix = sctbx.form_consensus_matrix(self.run_parameters, linkage_matrix, indicator_matrix)
+        consensus_matrix = self.get_consensus_matrix(spreadsheet_mat)
         consensus_matrix[consensus_matrix != 0] = 1
         consensus_matrix = np.int_(consensus_matrix)
 
@@ -39,5 +44,65 @@ class TestRun_nmf_clusters_worker(TestCase):
         cluster_difference = cluster_difference.sum()
         self.assertEqual(cluster_difference, 0, msg='nmf clustering failed')
 
+    def test_consensus_accumulation_memory_equals_disk(self):
+        self.run_parameters['number_of_bootstraps'] = 6
+        self.run_parameters['method'] = self.run_parameters['method_1']
+        spreadsheet_mat = tstdata.get_wide_3_cluster_spreadsheet(3)
+
+        self.run_parameters['consensus_accumulation'] = 'memory'
+        memory_consensus = self.get_consensus_matrix(spreadsheet_mat)
+
+        self.run_parameters['consensus_accumulation'] = 'disk'
+        disk_consensus = self.get_consensus_matrix(spreadsheet_mat)
+
+        self.assertTrue(np.array_equal(memory_consensus, disk_consensus), msg='memory and disk consensus differ')
+
+    def test_threads_consensus_does_not_depend_on_parallelism(self):
+        self.run_parameters['number_of_bootstraps'] = 6
+        self.run_parameters['method'] = self.run_parameters['method_1']
+        self.run_parameters['processing_method'] = 'threads'
+        spreadsheet_mat = tstdata.get_wide_3_cluster_spreadsheet(3)
+        jobs_id = range(0, self.run_parameters['number_of_bootstraps'])
+
+        consensus_matrices = []
+        for parallelism, bootstrap_batch_size in [(1, 1), (3, 1), (3, 2)]:
+            self.run_parameters['bootstrap_batch_size'] = bootstrap_batch_size
+            linkage_matrix, indicator_matrix = sctbx.accumulate_clusterings_locally(
+                sctbx.run_cc_nmf_clusters_worker, [spreadsheet_mat], self.run_parameters, jobs_id, parallelism,
+                spreadsheet_mat.shape[1], sctbx.run_cc_nmf_clusters_batch_worker)
+            consensus_matrices.append(sctbx.form_consensus_matrix(self.run_parameters, linkage_matrix, indicator_matrix))
+
+        self.assertTrue(np.array_equal(consensus_matrices[0], consensus_matrices[1]), msg='threads consensus differs')
+        self.assertTrue(np.array_equal(consensus_matrices[0], consensus_matrices[2]), msg='batched threads consensus differs')
+
+    def test_checkpoint_resume_equals_uninterrupted(self):
+        self.run_parameters['number_of_bootstraps'] = 6
+        self.run_parameters['method'] = self.run_parameters['method_1']
+        spreadsheet_mat = tstdata.get_wide_3_cluster_spreadsheet(3)
+        uninterrupted_consensus = self.get_consensus_matrix(spreadsheet_mat)
+
+        self.run_parameters['checkpoint_directory'] = self.run_parameters["tmp_directory"]
+        sctbx.load_bootstrap_checkpoint(self.run_parameters)
+        for sample in [1, 4]:
+            sctbx.run_cc_nmf_clusters_worker(spreadsheet_mat, self.run_parameters, sample)
+
+        jobs_id = range(0, self.run_parameters['number_of_bootstraps'])
+        checkpointed = sctbx.load_bootstrap_checkpoint(self.run_parameters)
+        self.assertEqual(sorted(checkpointed.keys()), [1, 4])
+
+        clusterings = (sctbx.run_cc_nmf_clusters_worker(spreadsheet_mat, self.run_parameters, sample)
+                       for sample in jobs_id if sample not in checkpointed)
+        clusterings = sctbx.merge_checkpointed_clusterings(jobs_id, checkpointed, clusterings)
+        linkage_matrix, indicator_matrix = sctbx.initialize_consensus_matrices(spreadsheet_mat.shape[1], self.run_parameters)
+        linkage_matrix, indicator_matrix = sctbx.accumulate_clusterings(
+            clusterings, linkage_matrix, indicator_matrix, self.run_parameters)
+        resumed_consensus = sctbx.form_consensus_matrix(self.run_parameters, linkage_matrix, indicator_matrix)
+
+        self.assertTrue(np.array_equal(uninterrupted_consensus, resumed_consensus), msg='resumed consensus differs')
+
+        self.run_parameters['number_of_clusters'] = 4
+        self.assertRaises(ValueError, sctbx.load_bootstrap_checkpoint, self.run_parameters)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,102 @@
+import os
+import shutil
+import unittest
+import warnings
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import knpackage.toolbox as kn
+
+import data_cache_toolbox as data_cache
+import samples_clustering_toolbox as sctbx
+
+
+class TestSample_a_spreadsheet_matrix(TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.spreadsheet_mat = (np.random.rand(50, 20) < 0.1).astype(float)
+        self.run_parameters  = { 'number_of_clusters'   : 3
+                               , 'nmf_conv_check_freq'  : 50
+                               , 'nmf_max_invariance'   : 200
+                               , 'nmf_max_iterations'   : 300
+                               , 'nmf_penalty_parameter': 1400
+                               , 'nmf_solver'           : 'multiplicative' }
+
+    def test_sparse_sample_equals_dense_sample(self):
+        for sample in range(5):
+            np.random.seed(sample)
+            dense_sample, dense_permutation = kn.sample_a_matrix(self.spreadsheet_mat, 0.8, 0.8)
+            np.random.seed(sample)
+            sparse_sample, sparse_permutation = sctbx.sample_a_spreadsheet_matrix(sparse.csr_matrix(self.spreadsheet_mat), 0.8, 0.8)
+
+            self.assertTrue(sparse.issparse(sparse_sample))
+            self.assertTrue(np.array_equal(sparse_permutation, dense_permutation))
+            self.assertTrue(np.array_equal(sparse_sample.toarray(), dense_sample))
+
+    def test_generator_sample_equals_dense_sample(self):
+        dense_sample, dense_permutation = sctbx.sample_a_spreadsheet_matrix(self.spreadsheet_mat, 0.8, 0.8, np.random.default_rng(3))
+        sparse_sample, sparse_permutation = sctbx.sample_a_spreadsheet_matrix(sparse.csr_matrix(self.spreadsheet_mat), 0.8, 0.8,
+                                                                              np.random.default_rng(3))
+
+        self.assertTrue(np.array_equal(sparse_permutation, dense_permutation))
+        self.assertTrue(np.array_equal(sparse_sample.toarray(), dense_sample))
+        self.assertGreaterEqual(np.count_nonzero(~dense_sample.any(axis=1)), 10)
+
+    def test_sparse_nmf_equals_dense_nmf(self):
+        for nmf_solver in ['multiplicative', 'hals', 'anls_bpp']:
+            self.run_parameters['nmf_solver'] = nmf_solver
+            np.random.seed(1)
+            dense_h, dense_iterations, seconds = sctbx.perform_nmf_with_solver(self.spreadsheet_mat, self.run_parameters)
+            np.random.seed(1)
+            sparse_h, sparse_iterations, seconds = sctbx.perform_nmf_with_solver(sparse.csc_matrix(self.spreadsheet_mat), self.run_parameters)
+
+            self.assertEqual(sparse_iterations, dense_iterations)
+            self.assertTrue(np.allclose(sparse_h, dense_h), msg=nmf_solver)
+
+    def test_quantile_normalization_densifies_with_a_warning(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            normalized_mat = sctbx.normalize_spreadsheet_matrix(sparse.csr_matrix(self.spreadsheet_mat), {})
+        self.assertEqual(len(caught), 1)
+        self.assertTrue(np.array_equal(normalized_mat, kn.get_quantile_norm_matrix(self.spreadsheet_mat)))
+
+        sparse_mat = sparse.csr_matrix(self.spreadsheet_mat)
+        self.assertIs(sctbx.normalize_spreadsheet_matrix(sparse_mat, {'quantile_normalization': 0}), sparse_mat)
+
+    def test_sparse_spreadsheet_df_equals_spreadsheet_df(self):
+        cache_directory  = kn.create_dir('.', 'tmp_sparse_spreadsheet')
+        spreadsheet_name = os.path.join(cache_directory, 'spreadsheet.tsv')
+        pd.DataFrame(self.spreadsheet_mat.astype(int), index=['gene_%02d'%(row) for row in range(50)],
+                     columns=['sample_%d'%(column) for column in range(20)]).to_csv(spreadsheet_name, sep='\t')
+        try:
+            spreadsheet_df = kn.get_spreadsheet_df(spreadsheet_name)
+            for run_parameters in [{'spreadsheet_chunk_size': 7}, {}, {'spreadsheet_cache_directory': cache_directory}]:
+                sparse_df = data_cache.get_sparse_spreadsheet_df(spreadsheet_name, run_parameters)
+                self.assertTrue(data_cache.is_sparse_df(sparse_df))
+                pd.testing.assert_frame_equal(sparse_df.sparse.to_dense(), spreadsheet_df, check_index_type=False)
+
+            sparse_df = data_cache.get_sparse_spreadsheet_df(spreadsheet_name, {'spreadsheet_cache_directory': cache_directory})
+            self.assertTrue(np.array_equal(sctbx.get_spreadsheet_matrix(sparse_df).toarray(), spreadsheet_df.values))
+        finally:
+            shutil.rmtree(cache_directory)
+
+    def test_sparse_spreadsheet_df_has_string_names(self):
+        cache_directory  = kn.create_dir('.', 'tmp_sparse_spreadsheet')
+        spreadsheet_name = os.path.join(cache_directory, 'spreadsheet.tsv')
+        pd.DataFrame(self.spreadsheet_mat.astype(int), index=np.arange(50) + 1000, columns=np.arange(20)).to_csv(spreadsheet_name, sep='\t')
+        try:
+            spreadsheet_df = kn.get_spreadsheet_df(spreadsheet_name)
+            for run_parameters in [{'spreadsheet_chunk_size': 7}, {'spreadsheet_cache_directory': cache_directory},
+                                   {'spreadsheet_cache_directory': cache_directory}]:
+                sparse_df = data_cache.get_sparse_spreadsheet_df(spreadsheet_name, run_parameters)
+                self.assertEqual(list(sparse_df.index),   list(spreadsheet_df.index))
+                self.assertEqual(list(sparse_df.columns), list(spreadsheet_df.columns))
+                self.assertEqual(sparse_df.index[0], '1000')
+                self.assertEqual(sparse_df.columns[0], '0')
+        finally:
+            shutil.rmtree(cache_directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import unittest
+from unittest import TestCase
+from multiprocessing import Pool
+import numpy as np
+import knpackage.toolbox as kn
+
+import samples_clustering_toolbox as sctbx
+
+
+def save_a_random_clustering(tmp_dir, sequence_number):
+    np.random.seed(sequence_number)
+    sample_permutation = np.random.permutation(300)[0:241]
+    cluster_id         = np.random.randint(0, 3 + sequence_number * 40, 241)
+    sctbx.save_a_clustering(cluster_id, sample_permutation, tmp_dir, sequence_number)
+
+    return sequence_number, cluster_id, sample_permutation
+
+
+class TestSave_a_clustering(TestCase):
+    def setUp(self):
+        self.tmp_dir = kn.create_dir('.', 'tmp_bootstrap_store')
+
+    def tearDown(self):
+        kn.remove_dir(self.tmp_dir)
+
+    def test_concurrent_appends_read_back(self):
+        with Pool(4) as pool:
+            saved = pool.starmap(save_a_random_clustering, [(self.tmp_dir, sample) for sample in range(12)])
+
+        read_back = dict(sctbx.read_saved_clusterings(self.tmp_dir))
+        self.assertEqual(sorted(read_back.keys()), list(range(12)))
+
+        for sequence_number, cluster_id, sample_permutation in saved:
+            self.assertTrue(np.array_equal(read_back[sequence_number][0], cluster_id))
+            self.assertTrue(np.array_equal(read_back[sequence_number][1], sample_permutation))
+
+    def test_incomplete_record_is_dropped(self):
+        for sample in range(3):
+            save_a_random_clustering(self.tmp_dir, sample)
+
+        store_name = os.path.join(self.tmp_dir, 'bootstrap_clusterings.bin')
+        store_size = os.path.getsize(store_name)
+        with open(store_name, 'ab') as fh:
+            fh.write(bytes(100))
+
+        self.assertEqual(len(list(sctbx.read_saved_clusterings(self.tmp_dir))), 3)
+
+        sctbx.truncate_bootstrap_store(self.tmp_dir)
+        self.assertEqual(os.path.getsize(store_name), store_size)
+
+        save_a_random_clustering(self.tmp_dir, 3)
+        self.assertEqual(sorted(dict(sctbx.read_saved_clusterings(self.tmp_dir)).keys()), [0, 1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
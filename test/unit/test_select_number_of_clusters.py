@@ -0,0 +1,90 @@
+import os
+import unittest
+from unittest import TestCase
+import numpy as np
+import knpackage.toolbox as kn
+
+import results_writer_toolbox as results_writer
+import samples_clustering_toolbox as sctbx
+
+
+class TestSelect_number_of_clusters(TestCase):
+    def setUp(self):
+        self.run_parameters = { 'number_of_clusters': ['2..4', 6]
+                              , 'method'            : 'cc_nmf'
+                              , 'processing_method' : 'serial'
+                              , 'results_directory' : kn.create_dir('.', 'tmp_number_of_clusters_sweep') }
+
+    def tearDown(self):
+        kn.remove_dir(self.run_parameters['results_directory'])
+
+    def test_cluster_numbers(self):
+        self.assertEqual(sctbx.get_cluster_numbers(self.run_parameters), [2, 3, 4, 6])
+        self.assertEqual(sctbx.get_cluster_numbers({'number_of_clusters': 3}), [3])
+        self.assertFalse(sctbx.is_cluster_number_sweep({'number_of_clusters': 3}))
+        self.assertTrue(sctbx.is_cluster_number_sweep({'number_of_clusters': '2..4'}))
+        self.assertEqual(sctbx.get_cluster_numbers({'number_of_clusters': '2..4'}), [2, 3, 4])
+        self.assertEqual(len(sctbx.get_cluster_number_parameters({'number_of_clusters': '2..4'})), 3)
+        self.assertRaises(ValueError, sctbx.get_cluster_numbers, {'number_of_clusters': ['2..x']})
+        self.assertRaises(ValueError, sctbx.get_cluster_numbers, {'number_of_clusters': [3, '2..4']})
+
+    def test_sweep_consensus_equals_single_consensus(self):
+        np.random.seed(0)
+        clusterings = [ (np.array([np.random.randint(0, k, 30) for k in [2, 3, 4, 6]]), np.random.permutation(40)[0:30])
+                        for bootstrap in range(5) ]
+
+        linkage_stack,   \
+        indicator_matrix = sctbx.initialize_consensus_matrices(40, self.run_parameters)
+        linkage_stack,   \
+        indicator_matrix = sctbx.update_consensus_matrices(clusterings, linkage_stack, indicator_matrix)
+        self.assertEqual(linkage_stack.shape, (4, 40, 40))
+
+        for row in range(4):
+            linkage_matrix,  \
+            k_indicator      = sctbx.initialize_consensus_matrices(40, {})
+            linkage_matrix,  \
+            k_indicator      = sctbx.update_consensus_matrices([ (cluster_id[row], sample_permutation)
+                                                                 for cluster_id, sample_permutation in clusterings ],
+                                                               linkage_matrix, k_indicator)
+            self.assertTrue(np.array_equal(linkage_stack[row], linkage_matrix))
+            self.assertTrue(np.array_equal(indicator_matrix, k_indicator))
+
+    def test_sweep_clusterings_read_back(self):
+        cluster_id         = np.array([[0, 1, 1, 0, 1], [2, 0, 1, 2, 1]])
+        sample_permutation = np.array([4, 0, 3, 2, 7])
+        tmp_dir            = self.run_parameters['results_directory']
+        sctbx.save_a_clustering(cluster_id[0], sample_permutation, tmp_dir, 0)
+        sctbx.save_a_clustering(cluster_id,    sample_permutation, tmp_dir, 1)
+
+        read_back = dict(sctbx.read_saved_clusterings(tmp_dir))
+        self.assertTrue(np.array_equal(read_back[0][0], cluster_id[0]))
+        self.assertTrue(np.array_equal(read_back[1][0], cluster_id))
+        self.assertTrue(np.array_equal(read_back[1][1], sample_permutation))
+
+    def test_block_consensus_recommends_its_cluster_number(self):
+        labels           = np.repeat(np.arange(3), 10)
+        block_consensus  = (labels[:, None] == labels[None, :]).astype(float)
+        consensus_stack  = np.array([ block_consensus for k in [2, 3, 4, 6] ])
+        consensus_stack[0] = np.where(labels[:, None] + labels[None, :] == 1, 0.5, block_consensus)
+
+        self.assertEqual(sctbx.get_proportion_of_ambiguous_clustering(block_consensus), 0)
+        self.assertAlmostEqual(sctbx.get_proportion_of_ambiguous_clustering(consensus_stack[0]), 200 / 870)
+
+        for number_of_clusters_selection in ['pac', 'silhouette']:
+            self.run_parameters['number_of_clusters'          ] = [2, 3]
+            self.run_parameters['number_of_clusters_selection'] = number_of_clusters_selection
+            consensus_matrix, selected_labels, sample_order = sctbx.select_number_of_clusters(consensus_stack[0:2], self.run_parameters)
+            self.assertIs(consensus_matrix.base, consensus_stack)
+            self.assertEqual(len(set(selected_labels)), 3)
+            self.assertTrue(np.array_equal(np.sort(sample_order), np.arange(30)))
+
+        self.run_parameters['output_format'] = 'npz'
+        sctbx.select_number_of_clusters(consensus_stack[0:2], self.run_parameters)
+        file_name = [ file_name for file_name in os.listdir(self.run_parameters['results_directory']) if file_name.endswith('.npz') ][0]
+        sweep_df  = results_writer.load_npz_df(os.path.join(self.run_parameters['results_directory'], file_name))
+        self.assertEqual(list(sweep_df.index), ['2', '3'])
+        self.assertEqual(list(sweep_df['recommended']), [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from unittest import TestCase
+import numpy as np
+from scipy import sparse
+import knpackage.toolbox as kn
+
+import sample_clustering_toolbox_research_module as tstdata
+import samples_clustering_toolbox as sctbx
+
+
+class TestSmooth_matrix_with_rwr(TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.run_parameters = tstdata.get_test_paramters_dictionary()
+        self.run_parameters['rwr_convergence_tolerence'] = 1e-10
+        self.network_mat    = kn.normalize_sparse_mat_by_diagonal(
+                                  sparse.csr_matrix(tstdata.synthesize_random_network(50, 150)))
+        self.restart        = np.random.rand(50, 12)
+
+    def tearDown(self):
+        del self.run_parameters
+
+    def test_solvers_agree_with_power_iteration(self):
+        power_smooth, power_iterations = sctbx.smooth_matrix_with_rwr(self.restart, self.network_mat, self.run_parameters)
+
+        for rwr_solver in ['direct', 'cg']:
+            self.run_parameters['rwr_solver'] = rwr_solver
+            smooth, iterations = sctbx.smooth_matrix_with_rwr(self.restart, self.network_mat, self.run_parameters)
+            self.assertTrue(np.allclose(smooth, power_smooth, atol=1e-8), msg=rwr_solver + ' differs from power iteration')
+            self.assertLessEqual(iterations, power_iterations)
+
+    def test_threads_share_one_solver(self):
+        from multiprocessing.pool import ThreadPool
+
+        self.run_parameters['rwr_solver'] = 'direct'
+        with ThreadPool(processes=4) as pool:
+            solvers = pool.map(lambda thread: sctbx.get_rwr_solver(self.network_mat, self.run_parameters), range(8))
+        self.assertEqual(len(set(map(id, solvers))), 1)
+        self.assertIs(sctbx.get_rwr_solver(self.network_mat, self.run_parameters), solvers[0])
+
+    def test_bad_solver(self):
+        self.run_parameters['rwr_solver'] = 'jacobi'
+        self.assertRaises(ValueError, sctbx.smooth_matrix_with_rwr, self.restart, self.network_mat, self.run_parameters)
+
+
+if __name__ == '__main__':
+    unittest.main()
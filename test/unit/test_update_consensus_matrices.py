@@ -0,0 +1,80 @@
+import unittest
+from unittest import TestCase
+import numpy as np
+import knpackage.toolbox as kn
+
+import samples_clustering_toolbox as sctbx
+
+
+class TestUpdate_consensus_matrices(TestCase):
+    def setUp(self):
+        self.number_of_samples = 17
+        self.number_of_bootstraps = 9
+        self.clusterings = []
+        for sample in range(0, self.number_of_bootstraps):
+            np.random.seed(sample)
+            sample_permutation = np.random.permutation(self.number_of_samples)[0:13]
+            cluster_id = np.random.randint(0, 4, sample_permutation.size)
+            self.clusterings.append((cluster_id, sample_permutation))
+
+        self.linkage_matrix = np.zeros((self.number_of_samples, self.number_of_samples))
+        self.indicator_matrix = np.zeros((self.number_of_samples, self.number_of_samples))
+        for cluster_id, sample_permutation in self.clusterings:
+            self.linkage_matrix = kn.update_linkage_matrix(cluster_id, sample_permutation, self.linkage_matrix)
+            self.indicator_matrix = kn.update_indicator_matrix(sample_permutation, self.indicator_matrix)
+
+    def tearDown(self):
+        del self.clusterings
+
+    def test_update_consensus_matrices(self):
+        linkage_matrix = np.zeros((self.number_of_samples, self.number_of_samples))
+        indicator_matrix = np.zeros((self.number_of_samples, self.number_of_samples))
+        linkage_matrix, indicator_matrix = sctbx.update_consensus_matrices(
+            self.clusterings + [None], linkage_matrix, indicator_matrix, block_size=40)
+
+        self.assertTrue(np.array_equal(linkage_matrix, self.linkage_matrix), msg='linkage matrix differs')
+        self.assertTrue(np.array_equal(indicator_matrix, self.indicator_matrix), msg='indicator matrix differs')
+
+    def test_accumulate_clusterings_dtypes(self):
+        for consensus_dtype in ['float32', 'int32', 'uint16']:
+            run_parameters = {'consensus_dtype': consensus_dtype, 'consensus_batch_size': 4}
+            linkage_matrix, indicator_matrix = sctbx.initialize_consensus_matrices(self.number_of_samples, run_parameters)
+            linkage_matrix, indicator_matrix = sctbx.accumulate_clusterings(
+                iter(self.clusterings), linkage_matrix, indicator_matrix, run_parameters)
+
+            self.assertEqual(linkage_matrix.dtype, np.dtype(consensus_dtype))
+            self.assertTrue(np.array_equal(linkage_matrix, self.linkage_matrix), msg=consensus_dtype)
+            self.assertTrue(np.array_equal(indicator_matrix, self.indicator_matrix), msg=consensus_dtype)
+
+    def test_float32_precision_consensus(self):
+        run_parameters = {'processing_method': 'serial', 'precision': 'float32'}
+        linkage_matrix, indicator_matrix = sctbx.initialize_consensus_matrices(self.number_of_samples, run_parameters)
+        linkage_matrix, indicator_matrix = sctbx.accumulate_clusterings(
+            iter(self.clusterings), linkage_matrix, indicator_matrix, run_parameters)
+        consensus_matrix = sctbx.form_consensus_matrix(run_parameters, linkage_matrix, indicator_matrix)
+
+        self.assertEqual(consensus_matrix.dtype, np.float32)
+        self.assertTrue(np.allclose(consensus_matrix, self.linkage_matrix / np.maximum(self.indicator_matrix, 1), atol=1e-7))
+
+        run_parameters['precision'] = 'float16'
+        self.assertRaises(ValueError, sctbx.get_precision_dtype, run_parameters)
+
+    def test_accumulate_clusterings_stops_when_stable(self):
+        run_parameters = {'processing_method': 'serial', 'number_of_clusters': 2,
+                          'bootstrap_convergence_tolerance': 1e-6, 'bootstrap_convergence_check_freq': 2,
+                          'bootstrap_convergence_window': 2, 'min_number_of_bootstraps': 8}
+        sample_permutation = np.arange(0, self.number_of_samples)
+        cluster_id = np.int_(sample_permutation > 8)
+        clusterings = ((cluster_id, sample_permutation) for sample in range(0, 100))
+
+        linkage_matrix, indicator_matrix = sctbx.initialize_consensus_matrices(self.number_of_samples, run_parameters)
+        linkage_matrix, indicator_matrix = sctbx.accumulate_clusterings(
+            clusterings, linkage_matrix, indicator_matrix, run_parameters)
+
+        self.assertEqual(run_parameters['number_of_bootstraps_used'], 8)
+        self.assertEqual(indicator_matrix.max(), 8)
+        self.assertEqual(len(run_parameters['bootstrap_convergence']), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()